@@ -0,0 +1,312 @@
+"""Remote encode agent: pulls jobs from a coordinating app.py and runs them here.
+
+    python agent.py --coordinator http://encoder:5000 [--name NAME] [--max-jobs N]
+
+MEDIA_DIR, OUTPUT_DIR and TEMP_DIR are read from config.env like app.py.
+MEDIA_DIR and OUTPUT_DIR must point at the same library and output share
+as the coordinator's. Several agents can run on one machine; give each one
+a different --name.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+import psutil
+from dotenv import load_dotenv
+from finalize import encode_directory, publish
+from process_control import handbrake_supports_json, pin_process_tree, signal_process_tree
+from progress_parser import JsonProgressParser, ProgressParser
+
+# Load environment variables
+load_dotenv("config.env")
+
+MEDIA_DIR = os.getenv("MEDIA_DIR", "./media")
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "./output")
+TEMP_DIR = os.getenv("TEMP_DIR", "./temp")
+AGENT_TOKEN = os.getenv("AGENT_TOKEN", "")
+
+# Log lines kept per progress report while the coordinator is unreachable
+MAX_PENDING_LOG = 200
+# Longest wait (seconds) between attempts to report a finished job
+MAX_REPORT_RETRY_DELAY = 60
+
+class CoordinatorClient:
+    """JSON over HTTP to the coordinator's /agents endpoints"""
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def post(self, path, payload):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload).encode(),
+            headers={'Content-Type': 'application/json', 'X-Agent-Token': AGENT_TOKEN},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.load(response)
+
+class AgentJob:
+    """One coordinator job running on this agent"""
+    def __init__(self, data, cpus, encode_dir):
+        self.data = data
+        self.id = data['id']
+        self.cpus = cpus
+        self.process = None
+        self.paused = False
+        self.stop = None  # reason sent by the coordinator
+        self.lock = threading.Lock()
+        self.update = {}  # latest progress fields not yet reported
+        self.log = []  # log lines not yet reported
+        self.temp_output_path = os.path.join(encode_dir, f"temp_{self.id}_{data['filename']}")
+        self.preset_path = os.path.join(TEMP_DIR, f"agent_{self.id}_{data['preset_name']}")
+
+    def take_report(self):
+        """Progress fields and log lines gathered since the last report"""
+        with self.lock:
+            update, log = self.update, self.log
+            self.update, self.log = {}, []
+        return update, log
+
+    def output_bytes(self):
+        try:
+            return os.path.getsize(self.temp_output_path)
+        except OSError:
+            return 0
+
+class Agent:
+    def __init__(self, client, name, max_jobs):
+        self.client = client
+        self.name = name
+        self.cpus = sorted(psutil.Process().cpu_affinity()) if hasattr(psutil.Process, "cpu_affinity") else list(range(psutil.cpu_count() or 1))
+        self.max_jobs = max_jobs
+        self.agent_id = None
+        self.poll_interval = 2.0
+        self.report_interval = 1.0
+        self.jobs = {}  # job id -> AgentJob
+        self.lock = threading.Lock()
+        self.encoder_procs = {}  # pid -> psutil.Process, kept for cpu_percent() baselines
+        self.use_json = handbrake_supports_json()
+        # On the output share's filesystem if possible, so outputs are renamed into place
+        self.encode_dir = encode_directory(TEMP_DIR, OUTPUT_DIR)
+        psutil.cpu_percent(interval=None)
+
+    def register(self):
+        response = self.client.post("/agents/register", {
+            'name': self.name,
+            'cores': len(self.cpus),
+            'max_jobs': self.max_jobs
+        })
+        self.agent_id = response['agent_id']
+        self.poll_interval = response.get('poll_interval', self.poll_interval)
+        self.report_interval = response.get('report_interval', self.report_interval)
+        print(f"Registered with coordinator as {self.name} ({len(self.cpus)} cores, {self.max_jobs} jobs)")
+
+    def external_load(self):
+        """Fraction of the machine busy with anything other than our encoders"""
+        total = psutil.cpu_percent(interval=None) / 100
+        own = 0.0
+        seen = set()
+        with self.lock:
+            processes = [job.process for job in self.jobs.values() if job.process]
+        for process in processes:
+            try:
+                root = psutil.Process(process.pid)
+                for proc in [root] + root.children(recursive=True):
+                    p = self.encoder_procs.setdefault(proc.pid, proc)
+                    seen.add(proc.pid)
+                    own += p.cpu_percent() / 100
+            except psutil.Error:
+                pass
+        for pid in list(self.encoder_procs):
+            if pid not in seen:
+                del self.encoder_procs[pid]
+        return max(0.0, total - own / len(self.cpus))
+
+    def run(self):
+        threading.Thread(target=self.report_loop, daemon=True).start()
+        while True:
+            try:
+                if self.agent_id is None:
+                    self.register()
+                response = self.client.post(f"/agents/{self.agent_id}/poll", {
+                    'external_load': self.external_load()
+                })
+                if response.get('job'):
+                    self.start_job(response['job'])
+                    continue
+            except urllib.error.HTTPError as e:
+                if e.code == 404:
+                    # The coordinator restarted or dropped us: register again
+                    self.agent_id = None
+                else:
+                    print(f"Coordinator error: {e}")
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                print(f"Coordinator unreachable: {e}")
+            time.sleep(self.poll_interval)
+
+    def free_cpus(self):
+        """This agent's share of cores for one more job"""
+        share = max(1, len(self.cpus) // self.max_jobs)
+        with self.lock:
+            used = {cpu for job in self.jobs.values() for cpu in job.cpus}
+        free = [cpu for cpu in self.cpus if cpu not in used]
+        return free[:share] if len(free) >= share else self.cpus[:share]
+
+    def start_job(self, data):
+        job = AgentJob(data, self.free_cpus(), self.encode_dir)
+        with self.lock:
+            self.jobs[job.id] = job
+        thread = threading.Thread(target=self.run_job, args=(job,))
+        thread.daemon = True
+        thread.start()
+
+    def run_job(self, job):
+        data = job.data
+        returncode = None
+        error = None
+        try:
+            with open(job.preset_path, "w") as f:
+                f.write(data['preset'])
+
+            cmd = [
+                "HandBrakeCLI",
+                "-i", os.path.join(MEDIA_DIR, data['input']),
+                "-o", job.temp_output_path,
+                "--preset-import-file", job.preset_path,
+                "--verbose"
+            ]
+            if self.use_json:
+                cmd.append("--json")
+                parser = JsonProgressParser()
+            else:
+                parser = ProgressParser()
+            if data.get('encopts'):
+                cmd += ["--encopts", data['encopts']]
+
+            job.process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1,
+                universal_newlines=True
+            )
+            pin_process_tree(job.process.pid, job.cpus)
+            with job.lock:
+                job.log.append(f"Encoding on {self.name}, CPUs {','.join(map(str, job.cpus))}")
+
+            for line in job.process.stdout:
+                update, message = parser.feed(line)
+                with job.lock:
+                    if message:
+                        job.log.append(message)
+                        del job.log[:-MAX_PENDING_LOG]
+                    if update:
+                        job.update.update(update)
+            job.process.wait()
+            returncode = job.process.returncode
+
+            if returncode == 0 and not job.stop:
+                publish(job.temp_output_path, os.path.join(OUTPUT_DIR, data['output_file']))
+        except Exception as e:
+            error = str(e)
+            print(f"Encoding error: {e}")
+        finally:
+            for path in (job.preset_path, job.temp_output_path):
+                if os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+        self.finish_job(job, returncode, error)
+
+    def finish_job(self, job, returncode, error):
+        """Report the outcome, retrying until the coordinator accepts it"""
+        _, log = job.take_report()
+        output_path = os.path.join(OUTPUT_DIR, job.data['output_file'])
+        payload = {
+            'returncode': returncode,
+            'error': error,
+            'stopped': job.stop is not None,
+            'output_file': job.data['output_file'],
+            'output_bytes': os.path.getsize(output_path) if returncode == 0 and os.path.exists(output_path) else 0,
+            'log': log
+        }
+        # Until it is accepted: the coordinator shows the job encoding until then,
+        # and keeps this agent (which goes on polling) registered
+        attempt = 0
+        while True:
+            try:
+                self.client.post(f"/agents/{self.agent_id}/jobs/{job.id}/finish", payload)
+                break
+            except urllib.error.HTTPError as e:
+                if e.code == 404:
+                    # The coordinator no longer tracks this job
+                    break
+                print(f"Could not report job {job.id}: {e}")
+            except (urllib.error.URLError, OSError) as e:
+                print(f"Could not report job {job.id}: {e}")
+            attempt += 1
+            time.sleep(min(self.poll_interval * attempt, MAX_REPORT_RETRY_DELAY))
+        with self.lock:
+            self.jobs.pop(job.id, None)
+
+    def report_loop(self):
+        """Send progress for every running job; apply pause/resume/stop from the replies"""
+        while True:
+            time.sleep(self.report_interval)
+            with self.lock:
+                jobs = [job for job in self.jobs.values() if job.process and job.process.poll() is None]
+            for job in jobs:
+                update, log = job.take_report()
+                try:
+                    response = self.client.post(f"/agents/{self.agent_id}/jobs/{job.id}/progress", {
+                        'update': update,
+                        'log': log,
+                        'output_bytes': job.output_bytes()
+                    })
+                except urllib.error.HTTPError as e:
+                    # Cancelled or handed to another agent meanwhile
+                    response = {'stop': "cancelled"} if e.code == 404 else {}
+                except (urllib.error.URLError, OSError, ValueError) as e:
+                    print(f"Could not report job {job.id}: {e}")
+                    # Keep the unsent lines for the next report
+                    with job.lock:
+                        job.log[:0] = log
+                        del job.log[:-MAX_PENDING_LOG]
+                        job.update = {**update, **job.update}
+                    continue
+                self.apply_control(job, response)
+
+    def apply_control(self, job, response):
+        if response.get('stop') and not job.stop:
+            job.stop = response['stop']
+            if job.paused:
+                signal_process_tree(job.process.pid, suspend=False)
+            job.process.terminate()
+            print(f"Job {job.id} {job.stop} by coordinator")
+        elif response.get('paused', False) != job.paused:
+            job.paused = response['paused']
+            signal_process_tree(job.process.pid, suspend=job.paused)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--coordinator", default=os.getenv("COORDINATOR_URL", "http://localhost:5000"),
+                            help="base URL of the coordinating app.py")
+    arg_parser.add_argument("--name", default=socket.gethostname(), help="agent name shown in the dashboard")
+    arg_parser.add_argument("--max-jobs", type=int, default=int(os.getenv("MAX_CONCURRENT_JOBS", "1")),
+                            help="jobs to run side by side; the cores are split between them")
+    args = arg_parser.parse_args()
+
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    Agent(CoordinatorClient(args.coordinator), args.name, max(1, args.max_jobs)).run()
+
+if __name__ == "__main__":
+    main()
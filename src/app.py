@@ -2,17 +2,45 @@ import os
 import signal
 import subprocess
 import threading
-import re
 import json
 import psutil
 import shutil
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, jsonify, request, render_template, send_file
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 from datetime import datetime
 import time
 from collections import deque
+from progress_parser import JsonProgressParser, ProgressParser
+from scan_parser import parse_scan_output
+from job_store import JobStore
+from job_queue import JobQueue, PRIORITY_CLASSES
+from throughput_model import ThroughputModel
+from log_buffer import LogBuffer, LogSpooler
+from output_cache import OutputCache
+from preset_registry import PresetRegistry
+from metrics import MetricsRegistry
+from finalize import Finalizer, encode_directory, publish, same_filesystem
+from process_control import handbrake_supports_json, pin_process_tree, signal_process_tree
 import math
+import itertools
+import hashlib
+import queue
+import concurrent.futures
+import hmac
+import fnmatch
+import secrets
+import struct
+import atexit
+
+try:
+    import fcntl
+except ImportError:  # Windows: no engine lock file
+    fcntl = None
+try:
+    import termios
+except ImportError:  # Windows: no pipe backlog metric
+    termios = None
 
 # Load environment variables
 load_dotenv("config.env")
@@ -25,37 +53,215 @@ TEMP_DIR = os.getenv("TEMP_DIR", "./temp")
 
 app = Flask(__name__)
 
+# Maximum number of HandBrakeCLI processes running side by side
+MAX_CONCURRENT_JOBS = max(1, int(os.getenv("MAX_CONCURRENT_JOBS", "1")))
+
+# Split the usable cores between active jobs and pin each encoder to its share
+CPU_PINNING = os.getenv("CPU_PINNING", "true").lower() in ("1", "true", "yes")
+try:
+    AVAILABLE_CPUS = sorted(psutil.Process().cpu_affinity())
+except (AttributeError, psutil.Error):
+    # cpu_affinity is not available on macOS
+    AVAILABLE_CPUS = list(range(psutil.cpu_count() or 1))
+
+# HandBrakeCLI progress source: "json" (--json blocks), "text" (verbose lines) or "auto"
+PROGRESS_FORMAT = os.getenv("PROGRESS_FORMAT", "auto").lower()
+
+# Encoder option that sets the worker thread count, per HandBrake video encoder
+ENCODER_THREAD_OPTIONS = {
+    'x264': 'threads',
+    'x264_10bit': 'threads',
+    'x265': 'pools',
+    'x265_10bit': 'pools',
+    'x265_12bit': 'pools',
+}
+# Cores a hardware (GPU/media engine) encode is pinned to while software
+# encodes run beside it; it only needs them for decoding and filters
+HARDWARE_ENCODER_CPUS = max(1, int(os.getenv("HARDWARE_ENCODER_CPUS", "2")))
+
+# Background system stats sampling rate and ring buffer length
+STATS_SAMPLE_INTERVAL = float(os.getenv("STATS_SAMPLE_INTERVAL", "1"))
+STATS_HISTORY_SIZE = max(1, int(float(os.getenv("STATS_HISTORY_SECONDS", "3600")) / STATS_SAMPLE_INTERVAL))
+
+# Output file size sweep for running encodes, and the progress (%) needed
+# before the final size is projected from it
+OUTPUT_MONITOR_INTERVAL = 1.0
+OUTPUT_PROJECTION_MIN_PROGRESS = 2.0
+
+# Media library index: on-disk copy, refresh interval, "still being written"
+# window, and how long a directory's cached sizes are trusted while its mtime
+# stays the same (rewriting a file in place doesn't change it)
+MEDIA_INDEX_FILE = os.getenv("MEDIA_INDEX_FILE", "./media_index.json")
+MEDIA_INDEX_INTERVAL = float(os.getenv("MEDIA_INDEX_INTERVAL", "30"))
+MEDIA_INDEX_HOT_SECONDS = 300
+MEDIA_INDEX_SIZE_TTL = 300
+# /files?path= listings: page size bounds and how many rendered pages to keep
+FILES_PAGE_LIMIT = 200
+FILES_MAX_PAGE_LIMIT = 1000
+FILES_MAX_DEPTH = 8
+FILES_LISTING_CACHE_SIZE = 256
+
+# Media probing: HandBrakeCLI --scan pool size, result cache, per-scan timeout,
+# and whether indexed files are probed ahead of being queued
+PROBE_WORKERS = max(1, int(os.getenv("PROBE_WORKERS", "1")))
+PROBE_CACHE_FILE = os.getenv("PROBE_CACHE_FILE", "./probe_cache.json")
+PROBE_TIMEOUT = 120
+PROBE_ON_INDEX = os.getenv("PROBE_ON_INDEX", "true").lower() in ("1", "true", "yes")
+VIDEO_EXTENSIONS = {'mp4', 'mkv', 'avi', 'mov', 'wmv', 'flv', 'webm', 'm4v', 'ts', 'm2ts', 'mpg', 'mpeg', 'vob'}
+
+# Split mode: encode long inputs as this many time ranges side by side and
+# join them with ffmpeg (0 or 1 disables it), for inputs at least this long
+SPLIT_SEGMENTS = int(os.getenv("SPLIT_SEGMENTS", "0"))
+SPLIT_MIN_DURATION = float(os.getenv("SPLIT_MIN_DURATION", "1800"))
+# ffmpeg muxer for the joined output, per output format
+CONCAT_FORMATS = {'mp4': 'mp4', 'm4v': 'mp4', 'mkv': 'matroska', 'webm': 'webm'}
+
+# Remote encode agents (agent.py): how often they poll, how long one may stay
+# silent before its jobs go back to the queue, and the shared secret they send
+AGENT_POLL_INTERVAL = 2.0
+AGENT_REPORT_INTERVAL = 1.0
+AGENT_TIMEOUT = float(os.getenv("AGENT_TIMEOUT", "30"))
+AGENT_TOKEN = os.getenv("AGENT_TOKEN", "")
+
+# Queue order within a priority class: "fifo" (arrival order) or "shortest"
+# (shortest estimated encode first, from input size and the preset's history)
+QUEUE_ORDER = os.getenv("QUEUE_ORDER", "fifo").lower()
+# Most files one /queue/add-batch request may queue
+BATCH_ADD_LIMIT = int(os.getenv("BATCH_ADD_LIMIT", "2000"))
+
+# Background threads copying finished outputs to OUTPUT_DIR when the encode
+# couldn't be written on its filesystem (otherwise outputs are renamed into
+# place), and into the output cache
+FINALIZE_WORKERS = max(1, int(os.getenv("FINALIZE_WORKERS", "2")))
+
+# Finished encodes kept for identical re-queued jobs (same input, preset file
+# and format), evicted least recently used past this many GB (0 disables it)
+OUTPUT_CACHE_DIR = os.getenv("OUTPUT_CACHE_DIR", "./output_cache")
+OUTPUT_CACHE_SIZE_GB = float(os.getenv("OUTPUT_CACHE_SIZE_GB", "20"))
+
+# Durable queue and history (SQLite) and how many history rows stay in memory
+JOB_STORE_FILE = os.getenv("JOB_STORE_FILE", "./encoder.db")
+HISTORY_CACHE_SIZE = 100
+HISTORY_PAGE_LIMIT = 100
+# History rows the per-preset throughput model learns from at startup
+MODEL_HISTORY_ROWS = 5000
+
+# Live log lines kept per encode, full per-job logs on disk (kept this many
+# days, 0 = forever) and how many finished jobs' live logs stay readable
+LOG_BUFFER_LINES = 1000
+LOG_DIR = os.getenv("LOG_DIR", "./logs")
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "30"))
+FINISHED_LOG_JOBS = 20
+LOGS_PAGE_LIMIT = 500
+
+# /metrics histogram buckets: encode wall time and queue wait (seconds), average
+# FPS, the time spent parsing and applying one line of HandBrakeCLI output
+# (seconds), and the output still unread in the pipe after each line (bytes;
+# how far the reader trails the encoder, which blocks once the pipe is full)
+ENCODE_SECONDS_BUCKETS = (30, 60, 300, 600, 1200, 1800, 3600, 7200, 14400, 28800)
+QUEUE_WAIT_BUCKETS = (1, 10, 60, 300, 900, 3600, 14400, 43200, 86400)
+FPS_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+LINE_HANDLING_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+PIPE_BACKLOG_BUCKETS = (0, 256, 1024, 4096, 16384, 32768, 65536)
+
+# Server-Sent Events: state sampling rate, stats rate and per-client backlog limit,
+# and how many streams may be open at once (each holds a server thread, so keep
+# this below serve.py's SERVER_THREADS)
+EVENT_INTERVAL = 0.5
+STATS_EVENT_INTERVAL = 2.0
+EVENT_BACKLOG_LIMIT = 500
+MAX_EVENT_STREAMS = int(os.getenv("MAX_EVENT_STREAMS", "32"))
+
 # Global variables
-encoding_queue = []
-current_job = None
-current_process = None
-paused = False
-stopped = False
-progress_percent = 0
+encoding_queue = JobQueue()
+active_workers = {}  # job id -> EncodingWorker
+queued_paths = {}  # input path -> queued or active job, for duplicate checks (under scheduler_lock)
+scheduler_lock = threading.RLock()
 status_message = "Idle"
-encoding_history = []
-encoding_details = {
-    'current_fps': 0.0,
-    'average_fps': 0.0,
-    'eta': '--:--',
-    'time_elapsed': '00:00',
-    'time_remaining': '00:00',
-    'encoding_log': [],
-    'frames_processed': 0,
-    'total_frames': 0,
-    'start_timestamp': None,
-    'fps_history': deque(maxlen=60),
-    'eta_from_output': '--:--',
-}
+queue_running = False  # set by /start; remote agents only take jobs while it is
+encoding_history = []  # most recent history rows; the full history is in job_store
+job_store = JobStore(JOB_STORE_FILE)
+throughput_model = ThroughputModel()  # encode speed and size estimates from history
+output_cache = OutputCache(OUTPUT_CACHE_DIR, int(OUTPUT_CACHE_SIZE_GB * 1024 ** 3))
+log_spooler = LogSpooler(LOG_DIR) if LOG_DIR else None
+preset_registry = PresetRegistry(PRESET_DIR)  # parsed, validated presets
+finalizer = Finalizer(FINALIZE_WORKERS)
+encode_temp_dir = TEMP_DIR  # where encoders write; on OUTPUT_DIR's filesystem if possible, set at engine start
+
+# Prometheus metrics for /metrics; queue and worker gauges are filled in per scrape
+metrics = MetricsRegistry()
+jobs_finished_metric = metrics.counter(
+    "encoder_jobs_finished_total", "Jobs that left a worker slot, by outcome", ("preset", "status"))
+failures_metric = metrics.counter(
+    "encoder_job_failures_total", "Failed jobs by HandBrakeCLI exit code (or error, invalid_preset)", ("exit_code",))
+encode_seconds_metric = metrics.histogram(
+    "encoder_encode_duration_seconds", "Wall time of finished encodes", ENCODE_SECONDS_BUCKETS, ("preset", "status"))
+encode_fps_metric = metrics.histogram(
+    "encoder_encode_fps", "Average FPS of completed encodes", FPS_BUCKETS, ("preset",))
+input_bytes_metric = metrics.counter(
+    "encoder_input_bytes_total", "Source bytes of completed encodes", ("preset",))
+output_bytes_metric = metrics.counter(
+    "encoder_output_bytes_total", "Output bytes of completed encodes", ("preset",))
+queue_wait_metric = metrics.histogram(
+    "encoder_queue_wait_seconds", "Time from queueing to starting, per started job", QUEUE_WAIT_BUCKETS, ("priority",))
+line_handling_metric = metrics.histogram(
+    "encoder_output_line_handling_seconds", "Time spent parsing and applying one line of HandBrakeCLI output",
+    LINE_HANDLING_BUCKETS)
+pipe_backlog_metric = metrics.histogram(
+    "encoder_output_pipe_backlog_bytes",
+    "HandBrakeCLI output waiting unread in the pipe after each line (excludes the reader's own buffer)",
+    PIPE_BACKLOG_BUCKETS)
+queue_depth_metric = metrics.gauge("encoder_queue_depth", "Queued jobs", ("priority",))
+oldest_queued_metric = metrics.gauge("encoder_queue_oldest_wait_seconds", "How long the oldest queued job has waited")
+active_jobs_metric = metrics.gauge("encoder_active_jobs", "Jobs holding a worker", ("location", "state"))
+finished_logs = {}  # job id -> LogBuffer of recently finished jobs, oldest first
+
+def new_encoding_details(job_id):
+    """Fresh live-details state for one encode"""
+    return {
+        'current_fps': 0.0,
+        'average_fps': 0.0,
+        'eta': '--:--',
+        'time_elapsed': '00:00',
+        'time_remaining': '00:00',
+        'encoding_log': LogBuffer(LOG_BUFFER_LINES, log_spooler,
+                                  log_spooler.path_for(job_id) if log_spooler else None),
+        'frames_processed': 0,
+        'total_frames': 0,
+        'start_timestamp': None,
+        'fps_history': deque(maxlen=60),
+        'eta_from_output': '--:--',
+        'output_sample': None,  # (output bytes, progress) at the last bitrate sample
+        'output_bitrate': None,  # kbit/s of encoded media
+        'projected_size': None,  # MB, extrapolated from progress
+        'pass': 1,
+        'pass_count': 1,
+    }
+
+# EncodingJob bookkeeping that doesn't change what /queue shows
+UNVERSIONED_JOB_FIELDS = {'lock', 'version', 'serialized', 'temp_output_path', 'queue_position', 'queued_at'}
 
 class EncodingJob:
+    """One queued or running encode. Fields are written by encode, monitor and
+    request threads; every write that changes a value bumps `version` under the
+    job's lock, so serialize_job() can reuse its last result until then."""
+    __slots__ = ('lock', 'version', 'serialized', 'id', 'filename', 'file_path', 'preset', 'output_format',
+                 'status', 'priority', 'queue_position', 'progress', 'input_size', 'output_size',
+                 'start_time', 'end_time', 'error', 'current_fps', 'average_fps', 'time_elapsed',
+                 'time_remaining', 'eta', 'current_output_size', 'temp_output_path', 'media_info', 'queued_at')
+    
     def __init__(self, file_id, filename, preset, output_format, file_path=None):
+        object.__setattr__(self, 'lock', threading.RLock())
+        object.__setattr__(self, 'version', 0)
+        self.serialized = None  # (cache key, payload) from serialize_job
         self.id = file_id
         self.filename = filename
         self.file_path = file_path  # Full path for files in subdirectories
         self.preset = preset
         self.output_format = output_format
         self.status = "queued"
+        self.priority = "normal"  # key of PRIORITY_CLASSES
+        self.queue_position = 0.0  # sort key within the priority class
         self.progress = 0
         self.input_size = 0
         self.output_size = 0
@@ -69,6 +275,96 @@ class EncodingJob:
         self.eta = '--:--'
         self.current_output_size = 0  # Track current size during encoding
         self.temp_output_path = None
+        self.media_info = None  # duration, geometry, frame count and tracks from MediaProber
+        self.queued_at = time.time()  # for the queue wait metric
+    
+    def __setattr__(self, name, value):
+        with self.lock:
+            if name in UNVERSIONED_JOB_FIELDS:
+                object.__setattr__(self, name, value)
+                return
+            try:
+                if getattr(self, name) == value:
+                    return
+            except AttributeError:
+                pass
+            object.__setattr__(self, name, value)
+            object.__setattr__(self, 'version', self.version + 1)
+
+class JobIds:
+    """Job ids: the creation time in milliseconds, bumped past the last id
+    handed out so jobs created in the same millisecond never share one"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last = 0
+    
+    def seed(self, job_id):
+        """Never hand out an id at or below one already in use"""
+        with self.lock:
+            self.last = max(self.last, job_id or 0)
+    
+    def next(self):
+        with self.lock:
+            self.last = max(int(time.time() * 1000), self.last + 1)
+            return self.last
+
+job_ids = JobIds()
+
+class EncodingWorker:
+    """One scheduler slot: a job plus its own HandBrakeCLI process and live details"""
+    def __init__(self, slot, job):
+        self.slot = slot
+        self.job = job
+        self.process = None
+        self.paused = False
+        self.paused_at = None
+        self.released = False  # paused or finalizing, and not holding a slot or cores
+        self.resume_pending = False  # released, waiting for a free slot to resume
+        self.stopped = False
+        self.stop_reason = None  # "stopped" or "cancelled"
+        self.details = new_encoding_details(job.id)
+        self.thread = None
+        self.cpus = []  # CPU set this worker's encoder is pinned to
+        self.segments = []  # EncodingSegment per time range in split mode
+        self.agent = None  # RemoteAgent running this job, None for a local encode
+        self.cache_key = None  # output_cache key of this encode, None if uncacheable
+        self.preset = None  # Preset from preset_registry, checked when the job was taken
+    
+    def processes(self):
+        """Every HandBrakeCLI this worker is running: one, or one per segment in split mode"""
+        processes = [segment.process for segment in self.segments if segment.process]
+        if self.process:
+            processes.append(self.process)
+        return processes
+
+class EncodingSegment:
+    """One time range of a split-mode encode, run by its own HandBrakeCLI"""
+    def __init__(self, index, start, duration, temp_path):
+        self.index = index
+        self.start = start  # seconds into the input
+        self.duration = duration  # seconds, None for "to the end"
+        self.temp_path = temp_path
+        self.process = None
+        self.cpus = []
+        self.status = "queued"
+        self.progress = 0.0
+        self.fps = 0.0
+        self.avg_fps = 0.0
+        self.eta_seconds = None
+
+def log_event(details, message, log_type='info'):
+    """Append a line to an encode's live log (and its log file)"""
+    details['encoding_log'].append(message, log_type)
+
+def format_cpu_list(cpus):
+    """Format a CPU list as ranges, e.g. [0, 1, 2, 5] -> '0-2,5'"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f"{a}-{b}" if a != b else f"{a}" for a, b in ranges)
 
 def get_file_size(path):
     """Get file size in MB"""
@@ -93,45 +389,461 @@ def format_time(seconds):
     except (ValueError, TypeError):
         return "--:--"
 
-def extract_eta_from_line(line):
-    """Extract ETA from HandBrake output line"""
-    # Pattern for ETA: "ETA 00h01m23s" or "ETA 01:23:45"
-    patterns = [
-        r'eta\s+(\d{1,2})h(\d{1,2})m(\d{1,2})s',  # ETA 01h23m45s
-        r'eta\s+(\d{1,2}):(\d{1,2}):(\d{1,2})',   # ETA 01:23:45
-        r'eta\s+(\d{1,2}):(\d{1,2})',             # ETA 01:23
+def apply_progress_update(worker, update):
+    """Apply fields from ProgressParser to a worker's job and live details"""
+    global status_message
+    
+    job = worker.job
+    encoding_details = worker.details
+    
+    # One update is applied as a whole before /queue can see the job
+    with job.lock:
+        # ETA reported by HandBrake
+        if 'eta_seconds' in update:
+            eta_from_output = format_time(update['eta_seconds'])
+            encoding_details['eta_from_output'] = eta_from_output
+            job.eta = eta_from_output
+            encoding_details['eta'] = eta_from_output
+            encoding_details['time_remaining'] = eta_from_output
+            job.time_remaining = eta_from_output
+        
+        if 'fps' in update:
+            current_fps = update['fps']
+            encoding_details['current_fps'] = current_fps
+            job.current_fps = current_fps
+        
+            # Update FPS history
+            encoding_details['fps_history'].append({
+                'timestamp': datetime.now(),
+                'fps': current_fps
+            })
+        
+            # Prefer HandBrake's own average, else average the recent samples
+            if update.get('avg_fps'):
+                avg_fps = update['avg_fps']
+            else:
+                avg_fps = sum(item['fps'] for item in encoding_details['fps_history']) / len(encoding_details['fps_history'])
+            encoding_details['average_fps'] = round(avg_fps, 1)
+            job.average_fps = round(avg_fps, 1)
+        
+        # Multi-pass encodes (--json output only)
+        if 'pass' in update:
+            encoding_details['pass'] = update['pass']
+            encoding_details['pass_count'] = update['pass_count']
+        
+        progress_percent = None
+        
+        # Frame information
+        if 'frame' in update:
+            current_frame = update['frame']
+            total_frames = update['total_frames']
+            encoding_details['frames_processed'] = current_frame
+            encoding_details['total_frames'] = total_frames
+        
+            if total_frames > 0:
+                progress_percent = (current_frame / total_frames) * 100
+        
+                # Only calculate ETA if not already extracted from HandBrake
+                if encoding_details['eta'] == '--:--' and encoding_details['current_fps'] > 0:
+                    frames_remaining = total_frames - current_frame
+                    seconds_remaining = frames_remaining / encoding_details['current_fps']
+        
+                    encoding_details['eta'] = format_time(seconds_remaining)
+                    encoding_details['time_remaining'] = format_time(seconds_remaining)
+                    job.eta = format_time(seconds_remaining)
+                    job.time_remaining = format_time(seconds_remaining)
+        
+        # Percentage (for HandBrake versions without frame info)
+        if 'percent' in update:
+            progress_percent = update['percent']
+        
+            # Frame position from the probed frame count
+            if 'frame' not in update and encoding_details['total_frames'] > 0:
+                encoding_details['frames_processed'] = int(encoding_details['total_frames'] * progress_percent / 100)
+        
+        if progress_percent is not None:
+            job.progress = progress_percent
+        
+            # Calculate time elapsed
+            if encoding_details['start_timestamp']:
+                time_elapsed = (datetime.now() - encoding_details['start_timestamp']).total_seconds()
+                encoding_details['time_elapsed'] = format_time(time_elapsed)
+                job.time_elapsed = format_time(time_elapsed)
+        
+                # Until HandBrake prints its own ETA, estimate it from the frames done so far
+                frames_processed = encoding_details['frames_processed']
+                if (encoding_details['eta_from_output'] == '--:--' and frames_processed > 0
+                        and time_elapsed > 0 and encoding_details['total_frames'] > 0):
+                    frames_remaining = encoding_details['total_frames'] - frames_processed
+                    seconds_remaining = frames_remaining / (frames_processed / time_elapsed)
+        
+                    encoding_details['eta'] = format_time(seconds_remaining)
+                    encoding_details['time_remaining'] = format_time(seconds_remaining)
+                    job.eta = format_time(seconds_remaining)
+                    job.time_remaining = format_time(seconds_remaining)
+        
+            status_message = f"Encoding {job.filename}: {progress_percent:.1f}%"
+
+def use_json_progress():
+    if PROGRESS_FORMAT == "json":
+        return True
+    if PROGRESS_FORMAT == "text":
+        return False
+    return handbrake_supports_json()
+
+def build_thread_options(preset, threads):
+    """Encoder options that cap a preset's encoder at the given thread count, or None"""
+    option = ENCODER_THREAD_OPTIONS.get(preset.encoder)
+    if not option or threads <= 0:
+        return None
+    
+    # Keep the preset's own options, since --encopts replaces them
+    options = [opt for opt in preset.extra_options.split(':') if opt and not opt.startswith(f"{option}=")]
+    options.append(f"{option}={threads}")
+    return ':'.join(options)
+
+def split_cpus(cpus, parts):
+    """Split a CPU list into `parts` contiguous, disjoint, near-equal chunks"""
+    if parts <= 0:
+        return []
+    size, extra = divmod(len(cpus), parts)
+    chunks = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        # With more jobs than cores, jobs share cores round-robin
+        chunks.append(cpus[start:end] or [cpus[i % len(cpus)]])
+        start = end
+    return chunks
+
+def cpu_shares(workers):
+    """Fair CPU sets for slot-holding workers: hardware encodes get a few cores
+    and software encodes share the rest"""
+    hardware = [w for w in workers if w.preset and w.preset.hardware]
+    software = [w for w in workers if w not in hardware]
+    if hardware and software:
+        reserved = max(1, min(len(hardware) * HARDWARE_ENCODER_CPUS, len(AVAILABLE_CPUS) - len(software)))
+        return dict(zip(hardware + software,
+                        split_cpus(AVAILABLE_CPUS[:reserved], len(hardware))
+                        + split_cpus(AVAILABLE_CPUS[reserved:] or AVAILABLE_CPUS, len(software))))
+    return dict(zip(workers, split_cpus(AVAILABLE_CPUS, len(workers))))
+
+def rebalance_cpus():
+    """Partition AVAILABLE_CPUS between slot-holding workers whenever a slot
+    starts or ends, and re-pin every encoder whose set changed, so encoders
+    never share cores. A running encoder keeps the thread count it was
+    launched with; only its affinity moves."""
+    if not CPU_PINNING:
+        return
+    
+    with scheduler_lock:
+        workers = sorted(running_workers(), key=lambda w: w.slot)
+        for worker, cpus in cpu_shares(workers).items():
+            if cpus == worker.cpus:
+                continue
+            worker.cpus = cpus
+            pin_worker(worker)
+
+def pin_worker(worker):
+    """Pin a worker's encoder, or share its CPU set between its segment encoders"""
+    if worker.segments:
+        for segment, cpus in zip(worker.segments, split_cpus(worker.cpus, len(worker.segments))):
+            segment.cpus = cpus
+            if segment.process:
+                pin_process_tree(segment.process.pid, cpus)
+    elif worker.process:
+        pin_process_tree(worker.process.pid, worker.cpus)
+
+def plan_segments(worker, input_path):
+    """Time ranges for a split-mode encode, or [] to encode in one piece"""
+    job = worker.job
+    if SPLIT_SEGMENTS < 2 or not job.media_info or job.media_info['duration'] < SPLIT_MIN_DURATION:
+        return []
+    if not shutil.which("ffmpeg"):
+        log_event(worker.details, "Split mode needs ffmpeg to join segments; encoding in one piece", 'warning')
+        return []
+    
+    # At least one core per segment
+    count = min(SPLIT_SEGMENTS, len(worker.cpus)) if worker.cpus else SPLIT_SEGMENTS
+    if count < 2:
+        return []
+    
+    duration = job.media_info['duration']
+    bounds = [duration * i / count for i in range(count)] + [None]
+    return [
+        EncodingSegment(
+            i,
+            bounds[i],
+            None if bounds[i + 1] is None else bounds[i + 1] - bounds[i],
+            os.path.join(encode_temp_dir, f"temp_{job.id}_part{i:02d}_{job.filename}")
+        )
+        for i in range(count)
     ]
+
+def apply_segment_update(worker, segment, update):
+    """Fold one segment's progress into the job-wide progress, FPS and ETA"""
+    if 'percent' in update:
+        segment.progress = update['percent']
+    if 'fps' in update:
+        segment.fps = update['fps']
+        segment.avg_fps = update.get('avg_fps') or update['fps']
+    if 'eta_seconds' in update:
+        segment.eta_seconds = update['eta_seconds']
     
-    line_lower = line.lower()
+    total = worker.job.media_info['duration']
+    encoded = sum(s.progress / 100 * (s.duration if s.duration is not None else total - s.start)
+                  for s in worker.segments)
+    rollup = {'percent': encoded / total * 100}
     
-    for pattern in patterns:
-        match = re.search(pattern, line_lower)
-        if match:
-            groups = match.groups()
-            if len(groups) == 3:
-                # Format: hh:mm:ss or hh mm ss
-                try:
-                    hours = int(groups[0])
-                    minutes = int(groups[1])
-                    seconds = int(groups[2])
-                    total_seconds = hours * 3600 + minutes * 60 + seconds
-                    return format_time(total_seconds)
-                except ValueError:
-                    pass
-            elif len(groups) == 2:
-                # Format: mm:ss
-                try:
-                    minutes = int(groups[0])
-                    seconds = int(groups[1])
-                    total_seconds = minutes * 60 + seconds
-                    return format_time(total_seconds)
-                except ValueError:
-                    pass
+    # Segments run side by side: throughput adds up, the slowest one sets the ETA
+    running = [s for s in worker.segments if s.status == "encoding"]
+    if 'fps' in update:
+        rollup['fps'] = sum(s.fps for s in running)
+        rollup['avg_fps'] = sum(s.avg_fps for s in running)
+    etas = [s.eta_seconds for s in running if s.eta_seconds is not None]
+    if running and len(etas) == len(running):
+        rollup['eta_seconds'] = max(etas)
     
-    return None
+    apply_progress_update(worker, rollup)
+
+def launch_encoder(worker, cmd, cpus):
+    """Start one HandBrakeCLI, pinned to `cpus` and suspended if the worker is paused"""
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+        universal_newlines=True
+    )
+    if cpus:
+        pin_process_tree(process.pid, cpus)
+    
+    # Paused before the encoder was launched
+    if worker.paused:
+        signal_process_tree(process.pid, suspend=True)
+    return process
+
+class OutputMonitor:
+    """One thread that stats every running encode's output files each interval,
+    instead of a polling thread per job; it stops when nothing is watched"""
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.watched = {}  # EncodingWorker -> output paths being written
+        self.thread = None
+    
+    def watch(self, worker, paths):
+        with self.lock:
+            self.watched[worker] = list(paths)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+    
+    def unwatch(self, worker):
+        with self.lock:
+            self.watched.pop(worker, None)
+    
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.watched:
+                    self.thread = None
+                    return
+                watched = list(self.watched.items())
+            
+            for worker, paths in watched:
+                size = 0
+                for path in paths:
+                    try:
+                        size += os.stat(path).st_size
+                    except OSError:
+                        pass
+                self.observe(worker, size)
+            time.sleep(self.interval)
+    
+    def observe(self, worker, size):
+        """Record an output size in bytes: updates the job's current size, the
+        output bitrate and the final size projected from progress"""
+        job = worker.job
+        details = worker.details
+        progress = job.progress
+        duration = job.media_info['duration'] if job.media_info else 0
+        
+        # Bitrate of the media encoded since the last sample (smoothed, since
+        # muxers write in bursts); needs the probed duration
+        last = details['output_sample']
+        if last and duration and progress > last[1] and size >= last[0]:
+            media_seconds = (progress - last[1]) / 100 * duration
+            bitrate = (size - last[0]) * 8 / 1000 / media_seconds
+            previous = details['output_bitrate']
+            details['output_bitrate'] = round(bitrate if previous is None else previous * 0.7 + bitrate * 0.3)
+        if not last or progress > last[1]:
+            details['output_sample'] = (size, progress)
+        
+        if progress >= OUTPUT_PROJECTION_MIN_PROGRESS and size:
+            details['projected_size'] = round(size / (progress / 100) / (1024 * 1024), 2)
+        job.current_output_size = round(size / (1024 * 1024), 2)
+
+output_monitor = OutputMonitor(OUTPUT_MONITOR_INTERVAL)
+
+def observe_pipe_backlog(stream):
+    """Record how many bytes of encoder output wait unread in its pipe (FIONREAD)"""
+    if termios is None:
+        return
+    try:
+        pending = fcntl.ioctl(stream.fileno(), termios.FIONREAD, b"\0\0\0\0")
+    except (OSError, ValueError):
+        return
+    pipe_backlog_metric.observe(struct.unpack("i", pending)[0])
+
+def run_single_encode(worker, cmd, parser):
+    """Run the whole encode in one HandBrakeCLI; returns its exit code, or None if stopped"""
+    encoding_details = worker.details
+    
+    worker.process = launch_encoder(worker, cmd, worker.cpus)
+    process = worker.process
+    if worker.cpus:
+        log_event(encoding_details, f"Pinned to CPUs {format_cpu_list(worker.cpus)}")
+    
+    # Track the output file size during encoding
+    output_monitor.watch(worker, [worker.job.temp_output_path])
+    try:
+        for line in process.stdout:
+            # Check if stopped
+            if worker.stopped:
+                break
+            
+            received = time.perf_counter()
+            update, message = parser.feed(line)
+            if message:
+                log_event(encoding_details, message)
+            if update:
+                apply_progress_update(worker, update)
+            line_handling_metric.observe(time.perf_counter() - received)
+            observe_pipe_backlog(process.stdout)
+    finally:
+        output_monitor.unwatch(worker)
+    
+    if worker.stopped:
+        return None
+    
+    # Wait for process to complete normally
+    process.wait()
+    return process.returncode
 
-def run_encode(job):
-    global current_process, progress_percent, status_message, current_job, encoding_details, paused, stopped
+def run_split_encode(worker, cmd, parser_class):
+    """Encode each segment in its own HandBrakeCLI side by side, then join the parts
+    into the job's temp output; returns the exit code, or None if stopped"""
+    job = worker.job
+    encoding_details = worker.details
+    segments = worker.segments
+    update_lock = threading.Lock()
+    failed = []
+    
+    def run_segment(segment):
+        label = f"[part {segment.index + 1}/{len(segments)}]"
+        segment_cmd = list(cmd)
+        segment_cmd[segment_cmd.index("-o") + 1] = segment.temp_path
+        # HandBrake positions are in 90 kHz ticks; --stop-at counts from --start-at
+        segment_cmd += ["--start-at", f"pts:{round(segment.start * 90000)}"]
+        if segment.duration is not None:
+            segment_cmd += ["--stop-at", f"pts:{round(segment.duration * 90000)}"]
+        if segment.cpus:
+            thread_options = build_thread_options(worker.preset, len(segment.cpus))
+            if thread_options:
+                segment_cmd += ["--encopts", thread_options]
+        
+        parser = parser_class()
+        segment.status = "encoding"
+        segment.process = launch_encoder(worker, segment_cmd, segment.cpus)
+        for line in segment.process.stdout:
+            if worker.stopped or failed:
+                break
+            received = time.perf_counter()
+            update, message = parser.feed(line)
+            with update_lock:
+                if message:
+                    log_event(encoding_details, f"{label} {message}")
+                if update:
+                    apply_segment_update(worker, segment, update)
+            line_handling_metric.observe(time.perf_counter() - received)
+            observe_pipe_backlog(segment.process.stdout)
+        
+        if worker.stopped or failed:
+            terminate_process(segment.process)
+            segment.status = "stopped"
+            return
+        
+        segment.process.wait()
+        with update_lock:
+            if segment.process.returncode == 0:
+                segment.status = "completed"
+                apply_segment_update(worker, segment, {'percent': 100.0, 'eta_seconds': 0})
+                log_event(encoding_details, f"{label} Segment finished")
+            else:
+                segment.status = "failed"
+                failed.append(segment.process.returncode)
+                log_event(encoding_details, f"{label} Segment failed with return code {segment.process.returncode}", 'error')
+    
+    for segment, cpus in zip(segments, split_cpus(worker.cpus, len(segments)) if worker.cpus else []):
+        segment.cpus = cpus
+    log_event(encoding_details, f"Split mode: encoding {len(segments)} segments side by side")
+    
+    threads = []
+    for segment in segments:
+        thread = threading.Thread(target=run_segment, args=(segment,))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    
+    # Wait until every segment has an encoder before watching the output size
+    while not worker.stopped and any(s.process is None for s in segments) and any(t.is_alive() for t in threads):
+        time.sleep(0.05)
+    output_monitor.watch(worker, [s.temp_path for s in segments])
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        output_monitor.unwatch(worker)
+    
+    if worker.stopped:
+        return None
+    if failed:
+        return failed[0]
+    
+    return concat_segments(worker)
+
+def concat_segments(worker):
+    """Join the encoded segments into the job's temp output without re-encoding"""
+    job = worker.job
+    list_path = os.path.join(TEMP_DIR, f"temp_{job.id}_parts.txt")
+    with open(list_path, "w") as f:
+        for segment in worker.segments:
+            escaped = os.path.abspath(segment.temp_path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+           "-f", "concat", "-safe", "0", "-i", list_path, "-map", "0", "-c", "copy"]
+    if job.output_format in CONCAT_FORMATS:
+        cmd += ["-f", CONCAT_FORMATS[job.output_format]]
+    cmd.append(job.temp_output_path)
+    
+    log_event(worker.details, f"Joining {len(worker.segments)} segments")
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    finally:
+        os.remove(list_path)
+    for line in result.stdout.splitlines():
+        log_event(worker.details, line, 'error')
+    return result.returncode
+
+def run_encode(worker):
+    global status_message
+    
+    job = worker.job
+    encoding_details = worker.details
     
     input_path = job.file_path if job.file_path else os.path.join(MEDIA_DIR, job.filename)
     
@@ -140,7 +852,7 @@ def run_encode(job):
     output_filename = os.path.splitext(job.filename)[0] + f".{job.output_format}"
     
     # Create temp output path
-    job.temp_output_path = os.path.join(TEMP_DIR, temp_filename)
+    job.temp_output_path = os.path.join(encode_temp_dir, temp_filename)
     final_output_path = os.path.join(OUTPUT_DIR, output_filename)
     
     preset_path = os.path.join(PRESET_DIR, job.preset)
@@ -148,20 +860,19 @@ def run_encode(job):
     # Get input file size
     job.input_size = get_file_size(input_path)
     
-    # Reset encoding details
-    encoding_details.update({
-        'current_fps': 0.0,
-        'average_fps': 0.0,
-        'eta': '--:--',
-        'eta_from_output': '--:--',
-        'time_elapsed': '00:00',
-        'time_remaining': '00:00',
-        'encoding_log': [],
-        'frames_processed': 0,
-        'total_frames': 0,
-        'start_timestamp': datetime.now(),
-        'fps_history': deque(maxlen=60),
-    })
+    # The probed frame count gives progress and ETA before HandBrake reports frames
+    if job.media_info is None:
+        job.media_info = media_prober.lookup(input_path)
+    if job.media_info:
+        encoding_details['total_frames'] = job.media_info['frame_count']
+    
+    encoding_details['start_timestamp'] = datetime.now()
+    
+    # An identical earlier encode is reused instead of running HandBrake again
+    worker.cache_key = output_cache.key_for(input_path, preset_path, job.output_format)
+    
+    # Long inputs can be cut into time ranges encoded side by side
+    worker.segments = plan_segments(worker, input_path)
     
     cmd = [
         "HandBrakeCLI",
@@ -171,12 +882,24 @@ def run_encode(job):
         "--verbose"
     ]
     
-    current_job = job
+    # Structured progress where the build supports it, verbose text otherwise
+    if use_json_progress():
+        cmd.append("--json")
+        parser_class = JsonProgressParser
+    else:
+        parser_class = ProgressParser
+    
+    # Match the encoder's thread pool to this worker's share of the cores
+    # (split mode sizes each segment's pool to its own share)
+    if worker.cpus and not worker.segments:
+        thread_options = build_thread_options(worker.preset, len(worker.cpus))
+        if thread_options:
+            cmd += ["--encopts", thread_options]
+    
     job.status = "encoding"
     job.start_time = datetime.now().isoformat()
-    progress_percent = 0
+    job_store.update_job(job)
     status_message = f"Encoding: {job.filename}"
-    stopped = False
     
     # Clear temp file if exists
     if os.path.exists(job.temp_output_path):
@@ -185,193 +908,122 @@ def run_encode(job):
         except:
             pass
     
+    finalizing = False  # handed to the finalize pool
     try:
-        current_process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
+        if worker.cache_key and output_cache.fetch(worker.cache_key, final_output_path):
+            log_event(encoding_details, "Identical encode found in the output cache, reusing it")
+            record_completed(worker, output_filename, get_file_size(final_output_path))
+            return
         
-        # Start a thread to monitor output file size during encoding
-        def monitor_output_size():
-            while current_process and current_process.poll() is None and not stopped:
-                try:
-                    if os.path.exists(job.temp_output_path):
-                        job.current_output_size = get_file_size(job.temp_output_path)
-                    else:
-                        job.current_output_size = 0
-                except:
-                    job.current_output_size = 0
-                time.sleep(1)
-        
-        monitor_thread = threading.Thread(target=monitor_output_size)
-        monitor_thread.daemon = True
-        monitor_thread.start()
-        
-        for line in current_process.stdout:
-            # Check if stopped
-            if stopped:
-                break
-            
-            # Check if paused
-            while paused and current_process and current_process.poll() is None and not stopped:
-                time.sleep(0.5)
-            
-            # Add to log (limit to last 100 lines)
-            encoding_details['encoding_log'].append({
-                'timestamp': datetime.now().isoformat(),
-                'message': line.strip(),
-                'type': 'info'
-            })
-            if len(encoding_details['encoding_log']) > 100:
-                encoding_details['encoding_log'] = encoding_details['encoding_log'][-100:]
-            
-            # Extract ETA from HandBrake output
-            eta_from_output = extract_eta_from_line(line)
-            if eta_from_output:
-                encoding_details['eta_from_output'] = eta_from_output
-                job.eta = eta_from_output
-                encoding_details['eta'] = eta_from_output
-                encoding_details['time_remaining'] = eta_from_output
-                job.time_remaining = eta_from_output
-            
-            # Extract FPS
-            fps_match = re.search(r'(\d+\.\d+|\d+)\s*fps', line.lower())
-            if fps_match:
-                current_fps = float(fps_match.group(1))
-                encoding_details['current_fps'] = current_fps
-                job.current_fps = current_fps
-                
-                # Update FPS history
-                encoding_details['fps_history'].append({
-                    'timestamp': datetime.now(),
-                    'fps': current_fps
-                })
-                
-                # Calculate average FPS
-                if encoding_details['fps_history']:
-                    avg_fps = sum(item['fps'] for item in encoding_details['fps_history']) / len(encoding_details['fps_history'])
-                    encoding_details['average_fps'] = round(avg_fps, 1)
-                    job.average_fps = round(avg_fps, 1)
-            
-            # Extract frame information
-            frame_match = re.search(r'frame\s+(\d+)\s+of\s+(\d+)', line.lower())
-            if frame_match:
-                current_frame = int(frame_match.group(1))
-                total_frames = int(frame_match.group(2))
-                encoding_details['frames_processed'] = current_frame
-                encoding_details['total_frames'] = total_frames
-                
-                # Calculate progress percentage
-                if total_frames > 0:
-                    progress_percent = (current_frame / total_frames) * 100
-                    job.progress = progress_percent
-                    
-                    # Calculate time elapsed
-                    if encoding_details['start_timestamp']:
-                        time_elapsed = (datetime.now() - encoding_details['start_timestamp']).total_seconds()
-                        encoding_details['time_elapsed'] = format_time(time_elapsed)
-                        job.time_elapsed = format_time(time_elapsed)
-                        
-                        # Only calculate ETA if not already extracted from HandBrake
-                        if encoding_details['eta'] == '--:--' and encoding_details['current_fps'] > 0:
-                            frames_remaining = total_frames - current_frame
-                            seconds_remaining = frames_remaining / encoding_details['current_fps']
-                            
-                            encoding_details['eta'] = format_time(seconds_remaining)
-                            encoding_details['time_remaining'] = format_time(seconds_remaining)
-                            job.eta = format_time(seconds_remaining)
-                            job.time_remaining = format_time(seconds_remaining)
-            
-            # Alternative progress detection (for HandBrake versions without frame info)
-            if "%" in line and "encoding" in line.lower():
-                percent_match = re.search(r'(\d+\.\d+|\d+)\s*%', line)
-                if percent_match:
-                    progress_percent = float(percent_match.group(1))
-                    job.progress = progress_percent
-                    
-                    # Calculate time elapsed
-                    if encoding_details['start_timestamp']:
-                        time_elapsed = (datetime.now() - encoding_details['start_timestamp']).total_seconds()
-                        encoding_details['time_elapsed'] = format_time(time_elapsed)
-                        job.time_elapsed = format_time(time_elapsed)
-            
-            status_message = f"Encoding {job.filename}: {progress_percent:.1f}%"
-            
-            # Sleep a bit to prevent high CPU usage
-            time.sleep(0.01)
+        if worker.segments:
+            returncode = run_split_encode(worker, cmd, parser_class)
+        else:
+            returncode = run_single_encode(worker, cmd, parser_class())
         
         # Check if stopped
-        if stopped:
+        if worker.stopped:
             # Process was stopped, clean up
-            if current_process:
-                try:
-                    current_process.terminate()
-                    current_process.wait(timeout=2)
-                except:
-                    try:
-                        current_process.kill()
-                    except:
-                        pass
+            for process in worker.processes():
+                terminate_process(process)
             
-            job.status = "stopped"
-            job.error = "Stopped by user"
-            job.end_time = datetime.now().isoformat()
+            record_stopped(worker)
+            return
+        
+        if returncode == 0:
+            # Move from temp to final output
+            if os.path.exists(job.temp_output_path):
+                finalizing = publish_output(worker, output_filename, final_output_path)
+            if not finalizing:
+                complete_encode(worker, output_filename, final_output_path)
             
-            encoding_details['encoding_log'].append({
-                'timestamp': datetime.now().isoformat(),
-                'message': "⏹ Encoding stopped by user",
-                'type': 'warning'
-            })
+        else:
+            record_failed(worker, f"Process exited with code {returncode}",
+                          f"✗ Encoding failed with return code {returncode}", returncode)
             
-            # Clean up temp file
-            if job.temp_output_path and os.path.exists(job.temp_output_path):
+    except Exception as e:
+        record_failed(worker, str(e), f"✗ Encoding error: {str(e)}")
+        status_message = f"Error: {job.filename} - {str(e)}"
+        print(f"Encoding error: {e}")
+    
+    finally:
+        worker.process = None
+        for segment in worker.segments:
+            segment.process = None
+            if os.path.exists(segment.temp_path):
                 try:
-                    os.remove(job.temp_output_path)
-                except:
+                    os.remove(segment.temp_path)
+                except OSError:
                     pass
-            
-            status_message = f"Stopped: {job.filename}"
-            
-            # Reset current job
-            if current_job and current_job.id == job.id:
-                current_job = None
-            
-            # Start next job in queue
-            process_queue()
-            return
         
-        # Wait for process to complete normally
-        current_process.wait()
+        # Clean up temp file if it exists and job failed/cancelled/stopped
+        if job.status in ["failed", "cancelled", "stopped", "interrupted"] and job.temp_output_path and os.path.exists(job.temp_output_path):
+            try:
+                os.remove(job.temp_output_path)
+            except:
+                pass
         
-        if current_process.returncode == 0:
-            # Move from temp to final output
+        # A copy in the finalize pool finishes the worker itself
+        if not finalizing:
+            finish_worker(worker)
+
+def publish_output(worker, output_filename, final_output_path):
+    """Put a finished encode in OUTPUT_DIR under its final name. A rename on
+    the same filesystem happens here and returns False. A copy goes to the
+    finalize pool and returns True: the worker hands its slot to the next
+    job, and the copy's callback records the job and finishes the worker."""
+    job = worker.job
+    if same_filesystem(job.temp_output_path, OUTPUT_DIR):
+        publish(job.temp_output_path, final_output_path)
+        return False
+    
+    log_event(worker.details, "Copying the output to the output directory")
+    with scheduler_lock:
+        worker.released = True
+        job.status = "finalizing"
+    job_store.update_job(job)
+    process_queue()
+    
+    def copied(future):
+        global status_message
+        try:
+            future.result()
+            complete_encode(worker, output_filename, final_output_path)
+        except Exception as e:
+            record_failed(worker, str(e), f"✗ Could not copy the output: {str(e)}")
+            status_message = f"Error: {job.filename} - {str(e)}"
+            print(f"Finalize error: {e}")
             if os.path.exists(job.temp_output_path):
-                shutil.move(job.temp_output_path, final_output_path)
-            
-            job.status = "completed"
-            job.output_size = get_file_size(final_output_path)
-            job.current_output_size = job.output_size
-            job.progress = 100
-            progress_percent = 100
-            job.eta = "00:00"
-            job.time_remaining = "00:00"
-            
-            # Add completion message
-            encoding_details['encoding_log'].append({
-                'timestamp': datetime.now().isoformat(),
-                'message': f"✓ Encoding completed successfully. Output saved to {output_filename}",
-                'type': 'success'
-            })
-            
-            # Calculate total time
-            if encoding_details['start_timestamp']:
-                total_time = (datetime.now() - encoding_details['start_timestamp']).total_seconds()
-            
-            encoding_history.append({
+                try:
+                    os.remove(job.temp_output_path)
+                except OSError:
+                    pass
+        finish_worker(worker)
+    
+    finalizer.submit(publish, job.temp_output_path, final_output_path).add_done_callback(copied)
+    return True
+
+def complete_encode(worker, output_filename, final_output_path):
+    """Record a published encode and keep a copy in the output cache (made in the finalize pool)"""
+    record_completed(worker, output_filename, get_file_size(final_output_path))
+    if worker.cache_key:
+        finalizer.submit(output_cache.store, worker.cache_key, final_output_path)
+
+def record_completed(worker, output_filename, output_size):
+    """Mark a worker's job completed and add it to the history"""
+    global status_message
+    
+    job = worker.job
+    job.status = "completed"
+    job.output_size = output_size
+    job.current_output_size = job.output_size
+    job.progress = 100
+    job.eta = "00:00"
+    job.time_remaining = "00:00"
+    
+    # Add completion message
+    log_event(worker.details, f"✓ Encoding completed successfully. Output saved to {output_filename}", 'success')
+    
+    history_entry = {
                 'filename': job.filename,
                 'preset': job.preset,
                 'format': job.output_format,
@@ -382,251 +1034,1182 @@ def run_encode(job):
                 'end_time': datetime.now().isoformat(),
                 'duration': job.time_elapsed,
                 'reduction': f"{((job.input_size - job.output_size) / job.input_size * 100):.1f}%" if job.input_size > 0 else "0%"
-            })
-            
-            status_message = f"Completed: {job.filename}"
-            
-        else:
-            job.status = "failed"
-            job.error = f"Process exited with code {current_process.returncode}"
-            
-            encoding_details['encoding_log'].append({
-                'timestamp': datetime.now().isoformat(),
-                'message': f"✗ Encoding failed with return code {current_process.returncode}",
-                'type': 'error'
-            })
+            }
+    if job.media_info:
+        history_entry.update({
+            'width': job.media_info['width'],
+            'height': job.media_info['height'],
+            'frame_count': job.media_info['frame_count'],
+            'source_duration': job.media_info['duration']
+        })
+    history_entry['id'] = job_store.finish_job(job.id, history_entry)
+    throughput_model.add(history_entry)
+    history_entry['job_id'] = job.id
+    encoding_history.append(history_entry)
+    del encoding_history[:-HISTORY_CACHE_SIZE]
+    
+    status_message = f"Completed: {job.filename}"
+
+def record_failed(worker, error, message, exit_code=None):
+    """Mark a worker's job failed; exit_code is HandBrakeCLI's, if it ran to the end"""
+    global status_message
+    
+    job = worker.job
+    job.status = "failed"
+    job.error = error
+    failures_metric.inc(exit_code=exit_code if exit_code is not None else "error")
+    
+    log_event(worker.details, message, 'error')
+    
+    status_message = f"Failed: {job.filename}"
+
+def record_stopped(worker):
+    """Mark a worker's job stopped or cancelled by the user, or interrupted by a shutdown"""
+    global status_message
+    
+    job = worker.job
+    reason = worker.stop_reason or "stopped"
+    job.status = reason
+    job.error = f"{reason.capitalize()} by user" if reason != "interrupted" else "Interrupted by shutdown"
+    job.end_time = datetime.now().isoformat()
+    job.eta = "--:--"
+    job.time_remaining = "--:--"
+    
+    if reason == "interrupted":
+        log_event(worker.details, "⏹ Encoding interrupted by shutdown; it is re-queued on the next start", 'warning')
+    else:
+        log_event(worker.details, f"⏹ Encoding {reason} by user", 'warning')
+    
+    status_message = f"{reason.capitalize()}: {job.filename}"
+
+def observe_finished_job(job):
+    """Count a job leaving its worker in the /metrics counters and histograms"""
+    jobs_finished_metric.inc(preset=job.preset, status=job.status)
+    if job.start_time:
+        seconds = (datetime.fromisoformat(job.end_time) - datetime.fromisoformat(job.start_time)).total_seconds()
+        encode_seconds_metric.observe(seconds, preset=job.preset, status=job.status)
+    if job.status == "completed":
+        if job.average_fps:
+            encode_fps_metric.observe(job.average_fps, preset=job.preset)
+        input_bytes_metric.inc(round(job.input_size * 1024 * 1024), preset=job.preset)
+        output_bytes_metric.inc(round(job.output_size * 1024 * 1024), preset=job.preset)
+
+def finish_worker(worker):
+    """Free a finished worker's slot and start the next job(s) in queue"""
+    job = worker.job
+    if not job.end_time:
+        job.end_time = datetime.now().isoformat()
+    
+    # Finished one way or another: it won't be re-queued after a restart,
+    # unless it was cut short by a shutdown
+    if job.status != "completed" and not engine.stopping:
+        job_store.finish_job(job.id)
+    if job.status != "interrupted":
+        observe_finished_job(job)
+    
+    with scheduler_lock:
+        if active_workers.get(job.id) is worker:
+            del active_workers[job.id]
+            forget_queued_path(job)
+        # Its live log stays readable through /logs for a while
+        finished_logs.pop(job.id, None)
+        finished_logs[job.id] = worker.details['encoding_log']
+        while len(finished_logs) > FINISHED_LOG_JOBS:
+            del finished_logs[next(iter(finished_logs))]
+    process_queue()
+
+def terminate_process(process, timeout=2):
+    """Terminate a HandBrakeCLI process, killing it if it does not exit in time"""
+    if not process:
+        return
+    try:
+        process.terminate()
+        # A suspended encoder only acts on SIGTERM once it is continued
+        signal_process_tree(process.pid, suspend=False)
+        try:
+            process.wait(timeout=timeout)
+        except:
+            process.kill()
+    except:
+        pass
+
+def estimate_encode_seconds(job):
+    """Expected encode time for shortest-job-first ordering, from the throughput model"""
+    seconds = throughput_model.estimate(job.preset, job.input_size, job.media_info)['seconds']
+    # No history at all: bigger inputs take longer
+    return float(seconds if seconds is not None else job.input_size)
+
+def running_workers():
+    """Workers holding a local slot; released (paused) and remote workers do not count"""
+    return [w for w in active_workers.values() if not w.released and w.agent is None]
+
+def pop_runnable_job():
+    """The next queued job and its Preset, or (None, None) once the queue is
+    empty. A job whose preset was deleted or broken after it was queued fails
+    here rather than taking a slot (caller holds scheduler_lock)."""
+    global status_message
+    
+    while True:
+        job = encoding_queue.pop()
+        if job is None:
+            return None, None
+        preset = preset_registry.get(job.preset)
+        if preset is not None and preset.error is None:
+            queue_wait_metric.observe(time.time() - job.queued_at, priority=job.priority)
+            return job, preset
+        
+        failures_metric.inc(exit_code="invalid_preset")
+        job.status = "failed"
+        job.error = f"Invalid preset: {preset.error}" if preset else "Preset not found"
+        job.end_time = datetime.now().isoformat()
+        job_store.finish_job(job.id)
+        forget_queued_path(job)
+        print(f"Not encoding {job.filename}: {job.error}")
+        status_message = f"Failed: {job.filename}"
+
+def process_queue():
+    """Start queued jobs until every worker slot is busy"""
+    global queue_running
+    
+    with scheduler_lock:
+        if engine.stopping:
+            return
+        # Released jobs waiting to resume go before anything new
+        for worker in sorted(active_workers.values(), key=lambda w: w.slot):
+            if worker.resume_pending and len(running_workers()) < MAX_CONCURRENT_JOBS:
+                resume_worker(worker)
+        
+        new_workers = []
+        while len(running_workers()) < MAX_CONCURRENT_JOBS:
+            next_job, preset = pop_runnable_job()
+            if next_job is None:
+                queue_running = False
+                break
             
-            status_message = f"Failed: {job.filename}"
+            used_slots = {w.slot for w in active_workers.values()}
+            slot = next(s for s in itertools.count() if s not in used_slots)
             
-    except Exception as e:
-        job.status = "failed"
-        job.error = str(e)
+            worker = EncodingWorker(slot, next_job)
+            worker.preset = preset
+            active_workers[next_job.id] = worker
+            new_workers.append(worker)
         
-        encoding_details['encoding_log'].append({
-            'timestamp': datetime.now().isoformat(),
-            'message': f"✗ Encoding error: {str(e)}",
-            'type': 'error'
-        })
+        # Assign CPU sets before the new encoders are launched
+        rebalance_cpus()
         
-        status_message = f"Error: {job.filename} - {str(e)}"
-        print(f"Encoding error: {e}")
+        for worker in new_workers:
+            worker.thread = threading.Thread(target=run_encode, args=(worker,))
+            worker.thread.daemon = True
+            worker.thread.start()
+
+def get_active_workers():
+    """Active workers ordered by slot"""
+    with scheduler_lock:
+        return sorted(active_workers.values(), key=lambda w: w.slot)
+
+def find_workers(job_id=None):
+    """Workers targeted by a control request: one job if an id is given, else all"""
+    # A finalizing job has no encoder left to pause or stop
+    workers = [w for w in get_active_workers() if w.job.status != "finalizing"]
+    if job_id is None:
+        return workers
+    return [w for w in workers if w.job.id == job_id]
+
+class MediaProber:
+    """Runs HandBrakeCLI --scan on a background pool and caches the results
+    by path, size and mtime, so each version of a file is scanned once.
+
+    Requests are prioritised: files being queued jump ahead of files the
+    media index submits in the background.
+    """
+    QUEUED, INDEXED = 0, 1  # request priorities
     
-    finally:
-        if not stopped:  # Only set end time if not stopped
-            job.end_time = datetime.now().isoformat()
+    def __init__(self, cache_file, workers):
+        self.cache_file = cache_file
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.cache = {}  # absolute path -> {'size', 'mtime', 'info'}
+        self.pending = {}  # absolute path -> Future
+        self.requests = queue.PriorityQueue()
+        self.counter = itertools.count()
+        self.threads = []
+        self.load()
+    
+    def load(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file) as f:
+                self.cache = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading probe cache: {e}")
+    
+    def save(self):
+        if not self.cache_file:
+            return
+        with self.lock:
+            data = json.dumps(self.cache)
+        tmp_path = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            print(f"Error saving probe cache: {e}")
+    
+    def ensure_running(self):
+        with self.lock:
+            if self.threads:
+                return
+            for _ in range(self.workers):
+                thread = threading.Thread(target=self.run)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+    
+    def lookup(self, path):
+        """Cached info for the file as it is now, or None if it hasn't been probed"""
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.cache.get(path)
+            if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+                return entry['info']
+        return None
+    
+    def submit(self, path, callback=None, priority=QUEUED, size=None, mtime=None):
+        """Probe a file in the background; callback(info) runs once the result is known
+        (right away if it's cached). info is None if the scan failed."""
+        path = os.path.abspath(path)
+        if size is None or mtime is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return
+            size, mtime = st.st_size, st.st_mtime
         
-        current_process = None
+        with self.lock:
+            entry = self.cache.get(path)
+            if entry and entry['size'] == size and entry['mtime'] == mtime:
+                future = None
+                info = entry['info']
+            else:
+                future = self.pending.get(path)
+                if future is None:
+                    future = concurrent.futures.Future()
+                    self.pending[path] = future
+                    future.priority = None
+                # A higher priority request is queued again; the first one to run wins
+                if future.priority is None or priority < future.priority:
+                    future.priority = priority
+                    self.requests.put((priority, next(self.counter), path, size, mtime, future))
         
-        # Only clear current_job if this is actually the current job
-        if current_job and current_job.id == job.id:
-            current_job = None
+        if future is None:
+            if callback:
+                callback(info)
+            return
         
-        paused = False
-        stopped = False
+        self.ensure_running()
+        if callback:
+            future.add_done_callback(lambda f: callback(f.result()))
+    
+    def run(self):
+        while True:
+            _, _, path, size, mtime, future = self.requests.get()
+            with self.lock:
+                if future.done() or future.running():
+                    continue
+                future.set_running_or_notify_cancel()
+            
+            info = self.probe(path, size, mtime)
+            
+            with self.lock:
+                if self.pending.get(path) is future:
+                    del self.pending[path]
+                idle = not self.pending
+            future.set_result(info)
+            
+            # Write the cache once a burst of probes has drained
+            if idle:
+                self.save()
+    
+    def probe(self, path, size, mtime):
+        """Scan one file; the result (even a failed scan) is cached for this size and mtime"""
+        cmd = ["HandBrakeCLI", "-i", path, "--scan", "-t", "1"]
+        if handbrake_supports_json():
+            cmd.append("--json")
         
-        # Clean up temp file if it exists and job failed/cancelled/stopped
-        if job.status in ["failed", "cancelled", "stopped"] and job.temp_output_path and os.path.exists(job.temp_output_path):
-            try:
-                os.remove(job.temp_output_path)
-            except:
-                pass
+        try:
+            result = subprocess.run(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors="replace",
+                timeout=PROBE_TIMEOUT
+            )
+            info = parse_scan_output(result.stdout)
+        except subprocess.TimeoutExpired:
+            print(f"Probe timed out: {path}")
+            info = None
+        except OSError as e:
+            # HandBrakeCLI missing or not runnable: don't cache, try again later
+            print(f"Error probing {path}: {e}")
+            return None
         
-        # Start next job in queue (only if no job is running)
-        process_queue()
+        with self.lock:
+            self.cache[path] = {'size': size, 'mtime': mtime, 'info': info}
+        return info
+    
+    def probe_index(self, index):
+        """Queue background probes for indexed video files that have settled"""
+        cutoff = time.time() - MEDIA_INDEX_HOT_SECONDS
+        for rel_path, node in list(index.dirs.items()):
+            for name, item in list(node['entries'].items()):
+                if item['type'] != 'file' or item['mtime'] >= cutoff:
+                    continue
+                if os.path.splitext(name)[1].lower().lstrip('.') not in VIDEO_EXTENSIONS:
+                    continue
+                path = os.path.join(index.base_path, rel_path, name)
+                self.submit(path, priority=self.INDEXED, size=item['size'], mtime=item['mtime'])
 
-def process_queue():
-    """Process next job in queue if no job is currently running"""
-    global encoding_queue, current_job
-    
-    if not current_job and encoding_queue:
-        # Get the next job with status 'queued'
-        for i, job in enumerate(encoding_queue):
-            if job.status == "queued":
-                next_job = encoding_queue.pop(i)
-                thread = threading.Thread(target=run_encode, args=(next_job,))
-                thread.daemon = True
-                thread.start()
-                break
+media_prober = MediaProber(PROBE_CACHE_FILE, PROBE_WORKERS)
 
-def get_directory_structure(base_path, current_path=None, level=0):
-    """Recursively get directory structure"""
-    if current_path is None:
-        current_path = base_path
+class MediaIndex:
+    """In-memory index of MEDIA_DIR built with os.scandir (one stat per entry)
+
+    A refresh stats every directory once and only re-lists directories whose
+    mtime changed; files modified recently are re-stat'ed to catch growth, and
+    a directory listed more than MEDIA_INDEX_SIZE_TTL ago is listed again to
+    catch files rewritten in place.
+    The index is saved to disk so a restart only rescans what changed.
+    """
+    def __init__(self, base_path, index_file, interval):
+        self.base_path = base_path
+        self.index_file = index_file
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.dirs = {}  # relative dir path ('' is the root) -> {'mtime_ns', 'scanned', 'entries'}
+        self.version = 0
+        self.payload_cache = None  # (etag, JSON body) for /files
+        self.listing_cache = {}  # listing arguments -> (etag, JSON body) for /files?path=
+        self.ready = threading.Event()
+        self.start_lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        if not self.index_file or not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file) as f:
+                data = json.load(f)
+            if data.get('base_path') == os.path.abspath(self.base_path):
+                self.dirs = data['dirs']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading media index: {e}")
+    
+    def save(self):
+        if not self.index_file:
+            return
+        tmp_path = f"{self.index_file}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'base_path': os.path.abspath(self.base_path), 'dirs': self.dirs}, f)
+            os.replace(tmp_path, self.index_file)
+        except OSError as e:
+            print(f"Error saving media index: {e}")
+    
+    def scan_dir(self, rel_path, mtime_ns):
+        """List one directory; DirEntry.stat() is the only stat per entry"""
+        entries = {}
+        with os.scandir(os.path.join(self.base_path, rel_path)) as it:
+            for entry in it:
+                try:
+                    st = entry.stat()
+                    if entry.is_dir():
+                        entries[entry.name] = {'type': 'directory', 'mtime': st.st_mtime}
+                    elif entry.is_file():
+                        entries[entry.name] = {'type': 'file', 'size': st.st_size, 'mtime': st.st_mtime}
+                except OSError:
+                    pass
+        return {'mtime_ns': mtime_ns, 'scanned': time.time(), 'entries': entries}
+    
+    def restat_hot_files(self, rel_path, node):
+        """Re-stat files modified recently; writes don't change the directory mtime"""
+        changed = False
+        cutoff = time.time() - MEDIA_INDEX_HOT_SECONDS
+        for name, item in node['entries'].items():
+            if item['type'] != 'file' or item['mtime'] < cutoff:
+                continue
+            try:
+                st = os.stat(os.path.join(self.base_path, rel_path, name))
+            except OSError:
+                continue
+            if st.st_size != item['size'] or st.st_mtime != item['mtime']:
+                item['size'] = st.st_size
+                item['mtime'] = st.st_mtime
+                changed = True
+        return changed
+    
+    def refresh(self):
+        """Bring the index up to date; returns True if anything changed"""
+        with self.refresh_lock:
+            dirs = {}
+            changed = False
+            stack = [('', None)]
+            while stack:
+                rel_path, parent_entry = stack.pop()
+                try:
+                    st = os.stat(os.path.join(self.base_path, rel_path))
+                    node = self.dirs.get(rel_path)
+                    if node is None or node['mtime_ns'] != st.st_mtime_ns:
+                        node = self.scan_dir(rel_path, st.st_mtime_ns)
+                        changed = True
+                    elif time.time() - node.get('scanned', 0) >= MEDIA_INDEX_SIZE_TTL:
+                        rescanned = self.scan_dir(rel_path, st.st_mtime_ns)
+                        if rescanned['entries'] != node['entries']:
+                            node = rescanned
+                            changed = True
+                        else:
+                            node['scanned'] = rescanned['scanned']
+                    elif self.restat_hot_files(rel_path, node):
+                        changed = True
+                except OSError as e:
+                    print(f"Error reading directory {rel_path or self.base_path}: {e}")
+                    continue
+                
+                # The directory's own stat also keeps its parent's listing current
+                if parent_entry is not None and parent_entry['mtime'] != st.st_mtime:
+                    parent_entry['mtime'] = st.st_mtime
+                    changed = True
+                
+                dirs[rel_path] = node
+                for name, item in node['entries'].items():
+                    if item['type'] == 'directory':
+                        stack.append((os.path.join(rel_path, name), item))
+            
+            if changed or dirs.keys() != self.dirs.keys():
+                with self.lock:
+                    self.dirs = dirs
+                    self.version += 1
+                    self.payload_cache = None
+                    self.listing_cache = {}
+                self.save()
+                return True
+            return False
+    
+    def ensure_running(self):
+        """Build the index on first use and start the background refresher"""
+        if self.ready.is_set():
+            return
+        with self.start_lock:
+            if self.ready.is_set():
+                return
+            self.refresh()
+            if PROBE_ON_INDEX:
+                media_prober.probe_index(self)
+            thread = threading.Thread(target=self.run)
+            thread.daemon = True
+            thread.start()
+            self.ready.set()
+    
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+                if PROBE_ON_INDEX:
+                    media_prober.probe_index(self)
+            except Exception as e:
+                print(f"Error refreshing media index: {e}")
     
-    items = []
+    def make_item(self, rel_path, name, item, level, children, extensions=None):
+        """One file or directory in the /files format"""
+        path = os.path.join(rel_path, name)
+        if item['type'] == 'directory':
+            node = self.dirs.get(path)
+            child_count = len(self.filter_entries(node['entries'], extensions)) if node else 0
+            return {
+                'name': name,
+                'type': 'directory',
+                'path': path,
+                'level': level,
+                'children': children,
+                'child_count': child_count,
+                'size': 0,
+                'size_display': '-',
+                'modified': item['mtime'],
+                'extension': 'folder',
+                'expanded': False
+            }
+        
+        extension = os.path.splitext(name)[1].lower().lstrip('.')
+        size = round(item['size'] / (1024 * 1024), 2)
+        return {
+            'name': name,
+            'type': 'file',
+            'path': path,
+            'level': level,
+            'children': [],
+            'size': size,
+            'size_display': f"{size} MB",
+            'modified': item['mtime'],
+            'extension': extension if extension else 'unknown',
+            'expanded': False
+        }
     
-    try:
-        for item in os.listdir(current_path):
-            item_path = os.path.join(current_path, item)
-            relative_path = os.path.relpath(item_path, base_path)
+    def build_tree(self, rel_path='', level=0):
+        """Nested file tree in the /files format"""
+        node = self.dirs.get(rel_path)
+        if node is None:
+            return []
+        
+        items = []
+        for name, item in node['entries'].items():
+            children = []
+            if item['type'] == 'directory':
+                children = self.build_tree(os.path.join(rel_path, name), level + 1)
+            items.append(self.make_item(rel_path, name, item, level, children))
+        return items
+    
+    def filter_entries(self, entries, extensions):
+        """(name, entry) pairs, keeping directories and files with a wanted extension"""
+        if not extensions:
+            return list(entries.items())
+        return [
+            (name, item) for name, item in entries.items()
+            if item['type'] == 'directory' or os.path.splitext(name)[1].lower().lstrip('.') in extensions
+        ]
+    
+    def sorted_entries(self, rel_path, sort, extensions):
+        """Filtered entries of one directory in the order the file list shows them"""
+        field, _, direction = sort.partition('-')
+        entries = self.filter_entries(self.dirs[rel_path]['entries'], extensions)
+        # Name first so ties in size/date/type keep a stable, readable order
+        entries.sort(key=lambda entry: entry[0].lower())
+        if field != 'name':
+            entries.sort(key=FILE_SORT_KEYS[field])
+        if direction == 'desc':
+            entries.reverse()
+        return entries
+    
+    def build_listing(self, rel_path, level, depth, sort, extensions, offset=0, limit=None):
+        """Sorted, filtered items of one directory, nesting depth - 1 more levels"""
+        entries = self.sorted_entries(rel_path, sort, extensions)
+        page = entries[offset:offset + limit] if limit is not None else entries[offset:]
+        
+        items = []
+        for name, item in page:
+            children = []
+            if item['type'] == 'directory' and depth > 1:
+                child_path = os.path.join(rel_path, name)
+                if child_path in self.dirs:
+                    children, _ = self.build_listing(child_path, level + 1, depth - 1, sort, extensions)
+            items.append(self.make_item(rel_path, name, item, level, children, extensions))
+        return items, len(entries)
+    
+    def listing(self, rel_path, depth=1, offset=0, limit=FILES_PAGE_LIMIT, sort='name-asc', extensions=None):
+        """(etag, JSON body) for one page of a directory, or None if it isn't indexed"""
+        self.ensure_running()
+        key = (rel_path, depth, offset, limit, sort, extensions)
+        with self.lock:
+            cached = self.listing_cache.get(key)
+            if cached is not None:
+                return cached
+            if rel_path not in self.dirs:
+                return None
             
-            if os.path.isdir(item_path):
-                # It's a directory
-                items.append({
-                    'name': item,
-                    'type': 'directory',
-                    'path': relative_path,
-                    'level': level,
-                    'children': get_directory_structure(base_path, item_path, level + 1),
-                    'size': 0,
-                    'size_display': '-',
-                    'modified': os.path.getmtime(item_path),
-                    'extension': 'folder',
-                    'expanded': False
-                })
-            elif os.path.isfile(item_path):
-                # It's a file
-                extension = os.path.splitext(item)[1].lower().lstrip('.')
-                size = get_file_size(item_path)
-                
-                items.append({
-                    'name': item,
-                    'type': 'file',
-                    'path': relative_path,
-                    'level': level,
-                    'children': [],
-                    'size': size,
-                    'size_display': f"{size} MB",
-                    'modified': os.path.getmtime(item_path),
-                    'extension': extension if extension else 'unknown',
-                    'expanded': False
-                })
-    except Exception as e:
-        print(f"Error reading directory {current_path}: {e}")
+            level = len(rel_path.split(os.sep)) if rel_path else 0
+            items, total = self.build_listing(rel_path, level, depth, sort, extensions, offset, limit)
+            body = json.dumps({
+                'path': rel_path,
+                'offset': offset,
+                'limit': limit,
+                'total': total,
+                'sort': sort,
+                'items': items
+            })
+            cached = (hashlib.md5(body.encode()).hexdigest(), body)
+            if len(self.listing_cache) >= FILES_LISTING_CACHE_SIZE:
+                self.listing_cache = {}
+            self.listing_cache[key] = cached
+            return cached
     
-    return items
+    def payload(self):
+        """(etag, JSON body) of the full tree, rebuilt only after a change"""
+        self.ensure_running()
+        with self.lock:
+            if self.payload_cache is None:
+                body = json.dumps(self.build_tree())
+                etag = hashlib.md5(body.encode()).hexdigest()
+                self.payload_cache = (etag, body)
+            return self.payload_cache
+
+FILE_SORT_KEYS = {
+    'size': lambda entry: entry[1].get('size', 0),
+    'date': lambda entry: entry[1]['mtime'],
+    'type': lambda entry: entry[1]['type']
+}
+
+media_index = MediaIndex(MEDIA_DIR, MEDIA_INDEX_FILE, MEDIA_INDEX_INTERVAL)
 
 @app.route("/")
 def index():
     return render_template("index.html")
 
+def media_relative_path(path):
+    """Normalised path inside MEDIA_DIR ("" for the top); ValueError if it points outside"""
+    path = os.path.normpath(path.strip("/"))
+    if path == ".":
+        path = ""
+    if os.path.isabs(path) or path == ".." or path.startswith(".." + os.sep):
+        raise ValueError("Invalid path")
+    return path
+
+def parse_listing_args(args):
+    """Validated (path, depth, offset, limit, sort, extensions) for /files?path="""
+    path = media_relative_path(args.get("path", ""))
+    
+    depth = args.get("depth", default=1, type=int)
+    offset = args.get("offset", default=0, type=int)
+    limit = args.get("limit", default=FILES_PAGE_LIMIT, type=int)
+    if depth < 1 or offset < 0 or limit < 1:
+        raise ValueError("depth and limit must be positive and offset not negative")
+    
+    sort = args.get("sort", "name-asc")
+    field, _, direction = sort.partition("-")
+    if (field != "name" and field not in FILE_SORT_KEYS) or direction not in ("asc", "desc"):
+        raise ValueError(f"Unknown sort: {sort}")
+    
+    extensions = None
+    if args.get("ext"):
+        extensions = frozenset(e.strip().lower().lstrip(".") for e in args["ext"].split(",") if e.strip())
+    
+    return path, min(depth, FILES_MAX_DEPTH), offset, min(limit, FILES_MAX_PAGE_LIMIT), sort, extensions
+
 @app.get("/files")
 def list_files():
+    # Without a path or depth this is the whole tree, as older clients expect
+    lazy = "path" in request.args or "depth" in request.args
+    try:
+        if lazy:
+            listing_args = parse_listing_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     try:
-        structure = get_directory_structure(MEDIA_DIR)
-        return jsonify(structure)
+        if request.args.get("refresh"):
+            media_index.ensure_running()
+            media_index.refresh()
+        if lazy:
+            result = media_index.listing(*listing_args)
+            if result is None:
+                return jsonify({"error": "Directory not found"}), 404
+            etag, body = result
+        else:
+            etag, body = media_index.payload()
     except Exception as e:
         print(f"Error listing files: {e}")
         return jsonify([])
+    
+    # Clients revalidate every time and get a 304 while the library is unchanged
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 @app.get("/presets")
 def list_presets():
-    try:
-        files = [f for f in os.listdir(PRESET_DIR) if f.endswith(".json")]
-        return jsonify(files)
-    except:
-        return jsonify([])
+    # Invalid presets are listed with their error so they can be fixed
+    return jsonify([preset.to_dict() for preset in preset_registry.all()])
 
-@app.get("/queue")
-def get_queue():
-    queue_data = []
-    for job in encoding_queue:
-        queue_data.append({
+@app.get("/presets/<name>/stats")
+def preset_stats(name):
+    stats = throughput_model.stats(name)
+    if not stats['samples'] and preset_registry.get(name) is None:
+        return jsonify({"error": "Preset not found"}), 404
+    return jsonify(stats)
+
+def serialize_job(job, paused=False):
+    """JSON-ready view of a job for /queue, rebuilt only when the job (or, for
+    queued jobs, the throughput model behind its estimate) has changed.
+    The result is shared between calls; copy it before adding fields."""
+    key = (job.version, paused, throughput_model.version if job.status == "queued" else None)
+    cached = job.serialized
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    
+    with job.lock:
+        key = (job.version, paused, throughput_model.version if job.status == "queued" else None)
+        data = {
             'id': job.id,
             'filename': job.filename,
             'preset': job.preset,
             'format': job.output_format,
             'status': job.status,
+            'priority': job.priority,
             'progress': job.progress,
             'input_size': job.input_size,
             'output_size': job.output_size,
-            'current_output_size': job.current_output_size if job.status == 'encoding' else job.output_size,
+            'current_output_size': job.current_output_size if job.status in ['encoding', 'paused', 'finalizing'] else job.output_size,
             'current_fps': job.current_fps,
             'average_fps': job.average_fps,
             'time_elapsed': job.time_elapsed,
             'time_remaining': job.time_remaining,
             'eta': job.eta,
-            'paused': paused and job.status == 'encoding'
-        })
-    
-    current = None
-    if current_job:
-        current = {
-            'id': current_job.id,
-            'filename': current_job.filename,
-            'preset': current_job.preset,
-            'format': current_job.output_format,
-            'status': current_job.status,
-            'progress': current_job.progress,
-            'input_size': current_job.input_size,
-            'output_size': current_job.output_size,
-            'current_output_size': current_job.current_output_size,
-            'current_fps': current_job.current_fps,
-            'average_fps': current_job.average_fps,
-            'time_elapsed': current_job.time_elapsed,
-            'time_remaining': current_job.time_remaining,
-            'eta': current_job.eta,
+            'media_info': job.media_info,
+            'estimate': throughput_model.estimate(job.preset, job.input_size, job.media_info) if job.status == "queued" else None,
             'paused': paused
         }
+        job.serialized = (key, data)
+    return data
+
+def build_queue_payload():
+    """Queue state shared by /queue and the /events stream"""
+    queue_data = [serialize_job(job) for job in encoding_queue]
     
-    return jsonify({
+    workers = get_active_workers()
+    active = []
+    for worker in workers:
+        job_data = dict(serialize_job(worker.job, worker.paused))
+        job_data['slot'] = worker.slot
+        job_data['cpus'] = format_cpu_list(worker.cpus)
+        job_data['released'] = worker.released
+        job_data['resume_pending'] = worker.resume_pending
+        job_data['agent'] = worker.agent.name if worker.agent else None
+        active.append(job_data)
+    
+    # Overall progress is the mean of all active jobs
+    progress = sum(job['progress'] for job in active) / len(active) if active else 0
+    
+    # Time to work through the queue with every slot busy, from the per-job estimates
+    estimates = [job['estimate'] for job in queue_data]
+    slots = MAX_CONCURRENT_JOBS + agent_registry.capacity()
+    queue_estimate = {
+        'seconds': round(sum(e['seconds'] or 0 for e in estimates) / slots),
+        'output_size': round(sum(e['output_size'] or 0 for e in estimates), 2),
+        'unestimated': sum(1 for e in estimates if e['seconds'] is None)
+    }
+    
+    return {
         'queue': queue_data,
-        'current': current,
-        'status': status_message,
-        'progress': progress_percent,
-        'paused': paused,
-        'stopped': stopped
-    })
+        'current': active[0] if active else None,
+        'active': active,
+        'max_concurrent': slots,
+        'queue_estimate': queue_estimate,
+        'status': status_message if len(active) <= 1 else f"Encoding {len(active)} jobs",
+        'progress': progress,
+        'paused': bool(workers) and all(w.paused for w in workers),
+        'stopped': any(w.stopped for w in workers)
+    }
 
-@app.get("/encoding-details")
-def get_encoding_details():
-    global encoding_details, current_job
+@app.get("/queue")
+def get_queue():
+    return jsonify(build_queue_payload())
+
+def build_encoding_details(worker):
+    """Live encoding details for one worker"""
+    encoding_details = worker.details
+    current_job = worker.job
     
-    # Calculate size reduction if we have current job
+    # Calculate size reduction
     size_reduction = "-"
     current_output_size_display = "-"
     
-    if current_job:
-        # Show current output size during encoding
-        if current_job.status == 'encoding' and current_job.current_output_size > 0:
-            current_output_size_display = f"{current_job.current_output_size} MB"
-        elif current_job.output_size > 0:
-            current_output_size_display = f"{current_job.output_size} MB"
-        
-        # Calculate reduction percentage
-        if current_job.input_size and current_job.current_output_size:
-            reduction = ((current_job.input_size - current_job.current_output_size) / current_job.input_size * 100)
-            size_reduction = f"{reduction:.1f}%"
-        elif current_job.input_size and current_job.output_size:
-            reduction = ((current_job.input_size - current_job.output_size) / current_job.input_size * 100)
-            size_reduction = f"{reduction:.1f}%"
-        elif current_job.input_size:
-            size_reduction = "0%"
+    # Show current output size during encoding
+    if current_job.status in ['encoding', 'paused', 'finalizing'] and current_job.current_output_size > 0:
+        current_output_size_display = f"{current_job.current_output_size} MB"
+    elif current_job.output_size > 0:
+        current_output_size_display = f"{current_job.output_size} MB"
     
-    return jsonify({
+    # Calculate reduction percentage
+    if current_job.input_size and current_job.current_output_size:
+        reduction = ((current_job.input_size - current_job.current_output_size) / current_job.input_size * 100)
+        size_reduction = f"{reduction:.1f}%"
+    elif current_job.input_size and current_job.output_size:
+        reduction = ((current_job.input_size - current_job.output_size) / current_job.input_size * 100)
+        size_reduction = f"{reduction:.1f}%"
+    elif current_job.input_size:
+        size_reduction = "0%"
+    
+    return {
+        'id': current_job.id,
+        'slot': worker.slot,
+        'cpus': format_cpu_list(worker.cpus),
         'current_fps': encoding_details['current_fps'],
         'average_fps': encoding_details['average_fps'],
         'eta': encoding_details['eta_from_output'] if encoding_details['eta_from_output'] != '--:--' else encoding_details['eta'],
         'eta_from_output': encoding_details['eta_from_output'],
         'time_elapsed': encoding_details['time_elapsed'],
         'time_remaining': encoding_details['eta_from_output'] if encoding_details['eta_from_output'] != '--:--' else encoding_details['time_remaining'],
-        'encoding_log': encoding_details['encoding_log'][-20:],  # Last 20 entries
+        'encoding_log': encoding_details['encoding_log'].tail(20),  # Last 20 entries
         'frames_processed': encoding_details['frames_processed'],
         'total_frames': encoding_details['total_frames'],
-        'input_file': current_job.filename if current_job else "-",
-        'input_size': f"{current_job.input_size} MB" if current_job and current_job.input_size else "-",
+        'pass': encoding_details['pass'],
+        'pass_count': encoding_details['pass_count'],
+        'input_file': current_job.filename,
+        'input_size': f"{current_job.input_size} MB" if current_job.input_size else "-",
         'output_size': current_output_size_display,
         'size_reduction': size_reduction,
-        'preset': current_job.preset if current_job else "-",
-        'format': current_job.output_format if current_job else "-",
-        'paused': paused,
-        'stopped': stopped
-    })
+        'output_bitrate': f"{encoding_details['output_bitrate']} kbps" if encoding_details['output_bitrate'] is not None else "-",
+        'projected_size': f"{encoding_details['projected_size']} MB" if encoding_details['projected_size'] is not None else "-",
+        'preset': current_job.preset,
+        'format': current_job.output_format,
+        'progress': current_job.progress,
+        'paused': worker.paused,
+        'released': worker.released,
+        'stopped': worker.stopped,
+        'agent': worker.agent.name if worker.agent else None,
+        'segments': [
+            {
+                'index': segment.index,
+                'start': format_time(segment.start),
+                'end': format_time(segment.start + segment.duration if segment.duration is not None
+                                   else current_job.media_info['duration']),
+                'cpus': format_cpu_list(segment.cpus),
+                'status': segment.status,
+                'progress': round(segment.progress, 1),
+                'current_fps': segment.fps,
+                'eta': format_time(segment.eta_seconds) if segment.eta_seconds is not None else '--:--'
+            }
+            for segment in worker.segments
+        ]
+    }
+
+IDLE_ENCODING_DETAILS = {
+    'id': None,
+    'slot': None,
+    'cpus': '',
+    'current_fps': 0.0,
+    'average_fps': 0.0,
+    'eta': '--:--',
+    'eta_from_output': '--:--',
+    'time_elapsed': '00:00',
+    'time_remaining': '00:00',
+    'encoding_log': [],
+    'frames_processed': 0,
+    'total_frames': 0,
+    'pass': 1,
+    'pass_count': 1,
+    'input_file': "-",
+    'input_size': "-",
+    'output_size': "-",
+    'size_reduction': "-",
+    'output_bitrate': "-",
+    'projected_size': "-",
+    'preset': "-",
+    'format': "-",
+    'progress': 0,
+    'paused': False,
+    'released': False,
+    'stopped': False,
+    'agent': None,
+    'segments': []
+}
+
+@app.get("/encoding-details")
+def get_encoding_details():
+    jobs = [build_encoding_details(worker) for worker in get_active_workers()]
+    
+    # Top-level fields describe the requested job, or the first active one
+    selected = jobs[0] if jobs else IDLE_ENCODING_DETAILS
+    job_id = request.args.get("job", type=int)
+    if job_id is not None:
+        for details in jobs:
+            if details['id'] == job_id:
+                selected = details
+                break
+    
+    return jsonify({**selected, 'jobs': jobs})
 
 @app.get("/history")
 def get_history():
-    return jsonify(encoding_history[-20:])
+    # ?limit=&before=<id> pages back through the stored history, newest first
+    if "limit" not in request.args and "before" not in request.args:
+        return jsonify(encoding_history[-20:])
+    
+    limit = max(1, min(request.args.get("limit", default=20, type=int), HISTORY_PAGE_LIMIT))
+    before = request.args.get("before", type=int)
+    items, total = job_store.history_page(limit, before)
+    
+    return jsonify({
+        'items': items,
+        'total': total,
+        'next_before': items[-1]['id'] if len(items) == limit else None
+    })
+
+@app.get("/logs")
+def get_logs():
+    # ?job=<id>&after=<seq> returns only the lines a client hasn't seen yet
+    job_id = request.args.get("job", type=int)
+    after = request.args.get("after", default=0, type=int)
+    limit = max(1, min(request.args.get("limit", default=LOGS_PAGE_LIMIT, type=int), LOGS_PAGE_LIMIT))
+    
+    with scheduler_lock:
+        worker = active_workers.get(job_id)
+        buffer = worker.details['encoding_log'] if worker else finished_logs.get(job_id)
+    if buffer is None:
+        return jsonify({"error": "No live log for this job"}), 404
+    
+    lines = buffer.after(after, limit)
+    return jsonify({
+        'job': job_id,
+        'lines': lines,
+        'last_seq': lines[-1]['seq'] if lines else max(after, buffer.first_seq() - 1),
+        # Lines between `after` and the oldest one held have been dropped; the full log has them
+        'truncated': after + 1 < buffer.first_seq(),
+        'download': f"/logs/{job_id}/download" if log_spooler else None
+    })
+
+@app.get("/logs/<int:job_id>/download")
+def download_log(job_id):
+    path = log_spooler.path_for(job_id) if log_spooler else None
+    if not path or not os.path.exists(path):
+        return jsonify({"error": "No log file for this job"}), 404
+    return send_file(os.path.abspath(path), mimetype="text/plain", as_attachment=True,
+                     download_name=f"job_{job_id}.log")
+
+# Diff entry naming the keys a dict lost since the last event
+REMOVED_KEYS = "_removed"
+
+def diff_fields(old, new):
+    """Fields of `new` that differ from `old`; nested dicts are diffed, and keys
+    missing from `new` are listed under REMOVED_KEYS so a None value stays a value"""
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return new
+    changes = {}
+    for key, value in new.items():
+        if key not in old:
+            changes[key] = value
+        elif old[key] != value:
+            changes[key] = diff_fields(old[key], value)
+    removed = [key for key in old if key not in new]
+    if removed:
+        changes[REMOVED_KEYS] = removed
+    return changes
+
+def format_event(event, data):
+    """Encode one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class EventBroker:
+    """Samples dashboard state once and pushes the changes to every /events subscriber"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.snapshot = {}  # topic -> last published full payload
+        self.log_seqs = {}  # job id -> last published log sequence number
+        self.last_workers = []
+        self.thread = None
+    
+    def subscribe(self):
+        """Register a subscriber; returns its message queue and the current full
+        state, or None if MAX_EVENT_STREAMS are already open"""
+        messages = queue.Queue()
+        with self.lock:
+            if len(self.subscribers) >= MAX_EVENT_STREAMS:
+                return None
+            self.subscribers.add(messages)
+            snapshot = dict(self.snapshot)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+        return messages, snapshot
+    
+    def unsubscribe(self, messages):
+        with self.lock:
+            self.subscribers.discard(messages)
+    
+    def publish(self, topic, data):
+        message = format_event(topic, data)
+        for messages in list(self.subscribers):
+            # Drop clients that stopped reading; they reconnect and resync
+            if messages.qsize() > EVENT_BACKLOG_LIMIT:
+                self.subscribers.discard(messages)
+                messages.put(None)
+            else:
+                messages.put(message)
+    
+    def update(self, topic, payload):
+        """Store a topic's new full payload and publish whatever changed"""
+        with self.lock:
+            previous = self.snapshot.get(topic)
+            self.snapshot[topic] = payload
+            if previous is None:
+                self.publish(topic, payload)
+                return
+            changes = diff_fields(previous, payload)
+            if changes:
+                self.publish(topic, changes)
+    
+    def update_logs(self, workers):
+        """Publish log lines added since the last pass, including the final lines of finished jobs"""
+        lines = {}
+        last_seqs = self.log_seqs
+        self.log_seqs = {}
+        finished = [w for w in self.last_workers if w not in workers]
+        self.last_workers = workers
+        for worker in workers + finished:
+            job_id = str(worker.job.id)
+            last_seq = last_seqs.get(job_id, 0)
+            self.log_seqs[job_id] = last_seq
+            new_lines = worker.details['encoding_log'].after(last_seq)
+            if new_lines:
+                lines[job_id] = new_lines
+                self.log_seqs[job_id] = new_lines[-1]['seq']
+        
+        with self.lock:
+            # New subscribers start from the last 20 lines of each job
+            self.snapshot['log'] = {
+                str(worker.job.id): worker.details['encoding_log'].tail(20) for worker in workers
+            }
+            if lines:
+                self.publish('log', lines)
+    
+    def run(self):
+        try:
+            self.sample_forever()
+        finally:
+            # After an unexpected exit too, so the next subscriber starts a new thread
+            with self.lock:
+                if self.thread is threading.current_thread():
+                    self.thread = None
+    
+    def sample_forever(self):
+        last_stats = 0
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    return
+            
+            try:
+                workers = get_active_workers()
+                self.update('queue', build_queue_payload())
+                self.update('details', {'jobs': {
+                    str(worker.job.id): {k: v for k, v in build_encoding_details(worker).items() if k != 'encoding_log'}
+                    for worker in workers
+                }})
+                self.update_logs(workers)
+                self.update('history', {'items': encoding_history[-20:]})
+                
+                if time.time() - last_stats >= STATS_EVENT_INTERVAL:
+                    last_stats = time.time()
+                    self.update('stats', collect_system_stats())
+            except Exception as e:
+                print(f"Event broker error: {e}")
+            
+            time.sleep(EVENT_INTERVAL)
+
+event_broker = EventBroker()
+
+@app.get("/events")
+def stream_events():
+    subscription = event_broker.subscribe()
+    if subscription is None:
+        response = jsonify({"error": "Too many event streams"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '10'
+        return response
+    messages, snapshot = subscription
+    
+    def stream():
+        for topic, payload in snapshot.items():
+            yield format_event(topic, payload)
+        while True:
+            try:
+                message = messages.get(timeout=15)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if message is None:
+                return
+            yield message
+    
+    response = Response(stream(), mimetype="text/event-stream", headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Also runs if the client goes away before the stream starts
+    response.call_on_close(lambda: event_broker.unsubscribe(messages))
+    return response
+
+def input_path_key(path):
+    """queued_paths key: one spelling per input file"""
+    return os.path.normcase(os.path.abspath(path))
+
+def job_input_path(job):
+    return job.file_path or os.path.join(MEDIA_DIR, job.filename)
+
+def forget_queued_path(job):
+    """Drop a job that left the queue for good from the duplicate index"""
+    with scheduler_lock:
+        key = input_path_key(job_input_path(job))
+        if queued_paths.get(key) is job:
+            del queued_paths[key]
+
+def new_job(input_path, filename, preset, output_format, priority, file_path=None):
+    job = EncodingJob(job_ids.next(), filename, preset, output_format, file_path)
+    job.input_size = get_file_size(input_path)
+    job.priority = priority
+    job.media_info = media_prober.lookup(input_path)
+    return job
+
+def queue_jobs(jobs):
+    """Queue new jobs, skipping any whose input is already queued or encoding
+    (or appears twice in jobs); returns (queued, skipped)"""
+    queued, skipped = [], []
+    with scheduler_lock:
+        for job in jobs:
+            key = input_path_key(job_input_path(job))
+            if key in queued_paths:
+                skipped.append(job)
+                continue
+            queued_paths[key] = job
+            encoding_queue.push(job, estimate_encode_seconds(job) if QUEUE_ORDER == "shortest" else None)
+            queued.append(job)
+        # Persist before a worker can pick the jobs up, so their later status
+        # writes never land ahead of the insert and leave a queued row behind
+        job_store.add_jobs(queued)
+    
+    # Duration and frame count arrive in the background, usually from the probe cache
+    for job in queued:
+        estimate = job.queue_position if QUEUE_ORDER == "shortest" else None
+        def set_media_info(info, job=job, estimate=estimate):
+            job.media_info = info
+            # A better estimate re-sorts the job, unless it was moved by hand meanwhile
+            if estimate is not None and encoding_queue.get(job.id) is job and job.queue_position == estimate:
+                encoding_queue.push(job, estimate_encode_seconds(job))
+                job_store.save_positions([job])
+        media_prober.submit(job_input_path(job), set_media_info)
+    return queued, skipped
+
+def preset_error(name):
+    """Why a job can't be queued with a preset, or None if it can"""
+    preset = preset_registry.get(name)
+    if preset is None:
+        return "Preset not found"
+    if preset.error:
+        return f"Invalid preset {name}: {preset.error}"
+    return None
 
 @app.post("/queue/add")
 def add_to_queue():
     data = request.json
     if not data or "file" not in data or "preset" not in data:
         return jsonify({"error": "Missing file or preset"}), 400
+    priority = data.get("priority", "normal")
+    if priority not in PRIORITY_CLASSES:
+        return jsonify({"error": f"priority must be one of: {', '.join(PRIORITY_CLASSES)}"}), 400
     
-    # Check if file already in queue
-    for job in encoding_queue:
-        if job.filename == data["file"] and job.status in ["queued", "encoding", "paused"]:
-            return jsonify({"error": "File already in queue"}), 400
+    error = preset_error(data["preset"])
+    if error:
+        return jsonify({"error": error}), 400
     
     # Get full path for files in subdirectories
     if data.get("path"):
@@ -634,47 +2217,107 @@ def add_to_queue():
     else:
         input_path = os.path.join(MEDIA_DIR, data["file"])
     
-    input_size = get_file_size(input_path) if os.path.exists(input_path) else 0
+    job = new_job(input_path, data["file"], data["preset"], data.get("format", "mp4"), priority,
+                  input_path if data.get("path") else None)
+    queued, _ = queue_jobs([job])
+    if not queued:
+        return jsonify({"error": "File already in queue"}), 400
     
-    job_id = int(time.time() * 1000)
-    job = EncodingJob(
-        job_id,
-        data["file"],
-        data["preset"],
-        data.get("format", "mp4"),
-        input_path if data.get("path") else None
-    )
-    job.input_size = input_size
+    return jsonify({"status": "added", "id": job.id, "input_size": job.input_size})
+
+def batch_input_files(data):
+    """Paths relative to MEDIA_DIR named by an /queue/add-batch request, sorted:
+    the "files" list, or the files in "directory" (subdirectories too if
+    "recursive") whose names match "pattern" and end in one of "extensions"
+    (default: video files)"""
+    if data.get("files") is not None:
+        if not isinstance(data["files"], list):
+            raise ValueError("files must be a list of paths")
+        return sorted({media_relative_path(str(path)) for path in data["files"]})
+    if data.get("directory") is None:
+        raise ValueError("Missing files or directory")
+    
+    directory = media_relative_path(str(data["directory"]))
+    base = os.path.join(MEDIA_DIR, directory)
+    if not os.path.isdir(base):
+        raise FileNotFoundError("Directory not found")
+    pattern = data.get("pattern") or "*"
+    extensions = data.get("extensions") or VIDEO_EXTENSIONS
+    if isinstance(extensions, str):
+        extensions = extensions.split(",")
+    extensions = {str(e).strip().lower().lstrip(".") for e in extensions if str(e).strip()}
+    
+    files = []
+    for root, dirs, names in os.walk(base):
+        if not data.get("recursive"):
+            dirs.clear()
+        for name in names:
+            if (os.path.splitext(name)[1].lower().lstrip(".") in extensions
+                    and fnmatch.fnmatch(name.lower(), pattern.lower())):
+                files.append(os.path.relpath(os.path.join(root, name), MEDIA_DIR))
+    return sorted(files)
+
+@app.post("/queue/add-batch")
+def add_batch_to_queue():
+    data = request.json
+    if not data or "preset" not in data:
+        return jsonify({"error": "Missing preset"}), 400
+    priority = data.get("priority", "normal")
+    if priority not in PRIORITY_CLASSES:
+        return jsonify({"error": f"priority must be one of: {', '.join(PRIORITY_CLASSES)}"}), 400
+    
+    error = preset_error(data["preset"])
+    if error:
+        return jsonify({"error": error}), 400
+    
+    try:
+        files = batch_input_files(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    if len(files) > BATCH_ADD_LIMIT:
+        return jsonify({"error": f"{len(files)} files match; at most {BATCH_ADD_LIMIT} can be queued at once"}), 400
     
-    encoding_queue.append(job)
+    jobs, skipped = [], []
+    for path in files:
+        input_path = os.path.join(MEDIA_DIR, path)
+        if not os.path.isfile(input_path):
+            skipped.append({'path': path, 'reason': "not found"})
+            continue
+        jobs.append(new_job(input_path, os.path.basename(path), data["preset"],
+                            data.get("format", "mp4"), priority, input_path))
+    queued, duplicates = queue_jobs(jobs)
+    skipped += [{'path': os.path.relpath(job.file_path, MEDIA_DIR), 'reason': "already in queue"}
+                for job in duplicates]
     
-    return jsonify({"status": "added", "id": job_id, "input_size": input_size})
+    return jsonify({
+        "status": "added",
+        "added": [{'id': job.id, 'file': job.filename, 'input_size': job.input_size} for job in queued],
+        "skipped": skipped
+    })
 
 @app.post("/queue/remove")
 def remove_from_queue():
     data = request.json
     job_id = data.get("id")
     
-    global encoding_queue
-    
-    # Find the job
-    for i, job in enumerate(encoding_queue):
-        if job.id == job_id:
-            # Can't remove currently encoding job
-            if job.status == "encoding":
-                return jsonify({"error": "Cannot remove currently encoding job"}), 400
-            
-            encoding_queue.pop(i)
-            return jsonify({"status": "removed"})
+    # Only queued jobs are in the queue; encoding ones are stopped or cancelled instead
+    job = encoding_queue.remove(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    forget_queued_path(job)
     
-    return jsonify({"error": "Job not found"}), 404
+    job_store.delete_jobs([job_id])
+    return jsonify({"status": "removed"})
 
 @app.post("/queue/clear")
 def clear_queue():
-    global encoding_queue
-    
-    # Filter out only queued jobs (can't clear encoding jobs)
-    encoding_queue = [job for job in encoding_queue if job.status == "encoding"]
+    # Encoding jobs are not in the queue, so they carry on
+    jobs = encoding_queue.clear()
+    for job in jobs:
+        forget_queued_path(job)
+    job_store.delete_jobs([job.id for job in jobs])
     
     return jsonify({"status": "cleared"})
 
@@ -684,155 +2327,454 @@ def move_in_queue():
     job_id = data.get("id")
     direction = data.get("direction")
     
-    # Only move queued jobs
-    queued_jobs = [job for job in encoding_queue if job.status == "queued"]
-    
-    for i, job in enumerate(queued_jobs):
-        if job.id == job_id:
-            if direction == "up" and i > 0:
-                # Swap positions in the original queue
-                idx1 = encoding_queue.index(queued_jobs[i])
-                idx2 = encoding_queue.index(queued_jobs[i-1])
-                encoding_queue[idx1], encoding_queue[idx2] = encoding_queue[idx2], encoding_queue[idx1]
-            elif direction == "down" and i < len(queued_jobs) - 1:
-                idx1 = encoding_queue.index(queued_jobs[i])
-                idx2 = encoding_queue.index(queued_jobs[i+1])
-                encoding_queue[idx1], encoding_queue[idx2] = encoding_queue[idx2], encoding_queue[idx1]
-            break
+    # "top"/"bottom" move within the job's priority class; "up"/"down" and
+    # "position" (index in the whole queue) can cross into the neighbouring class
+    with scheduler_lock:
+        job = encoding_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        
+        if direction == "top":
+            moved = encoding_queue.move_to_top(job_id)
+        elif direction == "bottom":
+            moved = encoding_queue.move_to_bottom(job_id)
+        elif direction == "up":
+            moved = encoding_queue.move_one(job_id, -1)
+        elif direction == "down":
+            moved = encoding_queue.move_one(job_id, 1)
+        elif "position" in data:
+            try:
+                moved = encoding_queue.move_to(job_id, int(data["position"]))
+            except (TypeError, ValueError):
+                return jsonify({"error": "position must be an integer"}), 400
+        else:
+            return jsonify({"error": "direction must be up, down, top or bottom, or give a position"}), 400
     
+    job_store.save_positions(moved)
     return jsonify({"status": "moved"})
 
+@app.post("/queue/priority")
+def set_job_priority():
+    data = request.json or {}
+    priority = data.get("priority")
+    if priority not in PRIORITY_CLASSES:
+        return jsonify({"error": f"priority must be one of: {', '.join(PRIORITY_CLASSES)}"}), 400
+    
+    with scheduler_lock:
+        job = encoding_queue.get(data.get("id"))
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        # Joins the end of the new class, or its estimated place in shortest-first order
+        job.priority = priority
+        encoding_queue.push(job, estimate_encode_seconds(job) if QUEUE_ORDER == "shortest" else None)
+    
+    job_store.save_positions([job])
+    return jsonify({"status": "updated", "priority": priority})
+
 @app.post("/start")
 def start_encoding():
-    global current_job
+    global queue_running
+    queue_running = True
     
-    # Start processing if nothing is running
-    if not current_job:
+    # Fill any free worker slots; registered agents pick up the rest
+    if len(running_workers()) < MAX_CONCURRENT_JOBS:
         process_queue()
         return jsonify({"status": "started"})
     
     return jsonify({"status": "already_running"})
 
+def pause_worker(worker, release=False):
+    """Suspend a worker's encoder; with release, hand its slot and cores to the queue"""
+    with scheduler_lock:
+        if worker.stopped:
+            return
+        if not worker.paused:
+            worker.paused = True
+            worker.paused_at = datetime.now()
+            for process in worker.processes():
+                signal_process_tree(process.pid, suspend=True)
+            if worker.job.status == "encoding":
+                worker.job.status = "paused"
+                job_store.update_job(worker.job)
+            log_event(worker.details, "⏸ Encoding paused", 'warning')
+        
+        # Remote jobs keep their agent; only local slots can be handed back
+        if release and not worker.released and worker.agent is None:
+            worker.released = True
+            worker.cpus = []
+            log_event(worker.details, "Released worker slot to the queue", 'warning')
+            process_queue()
+
+def resume_worker(worker):
+    """Continue a paused worker; a released one waits until a slot is free"""
+    with scheduler_lock:
+        if not worker.paused or worker.stopped:
+            return
+        
+        if worker.released:
+            if len(running_workers()) >= MAX_CONCURRENT_JOBS:
+                if not worker.resume_pending:
+                    worker.resume_pending = True
+                    log_event(worker.details, "Waiting for a free worker slot to resume", 'warning')
+                return
+            worker.released = False
+            worker.resume_pending = False
+            rebalance_cpus()
+        
+        # Paused time does not count towards elapsed time
+        if worker.paused_at and worker.details['start_timestamp']:
+            worker.details['start_timestamp'] += datetime.now() - worker.paused_at
+        worker.paused = False
+        worker.paused_at = None
+        for process in worker.processes():
+            signal_process_tree(process.pid, suspend=False)
+        if worker.job.status == "paused":
+            worker.job.status = "encoding"
+            job_store.update_job(worker.job)
+        log_event(worker.details, "▶ Encoding resumed")
+
 @app.post("/pause")
 def pause_job():
-    global paused, current_job
-    paused = True
+    data = request.get_json(silent=True) or {}
     
-    if current_job and current_job.status == "encoding":
-        current_job.status = "paused"
+    for worker in find_workers(data.get("id")):
+        pause_worker(worker, release=bool(data.get("release")))
     
     return jsonify({"status": "paused"})
 
 @app.post("/resume")
 def resume_job():
-    global paused, current_job
-    paused = False
+    data = request.get_json(silent=True) or {}
     
-    if current_job and current_job.status == "paused":
-        current_job.status = "encoding"
+    for worker in find_workers(data.get("id")):
+        resume_worker(worker)
     
     return jsonify({"status": "resumed"})
 
+def stop_workers(workers, reason, timeout):
+    """Stop the given workers; their encode threads clean up and free the slots"""
+    global status_message
+    
+    for worker in workers:
+        worker.stop_reason = reason
+        worker.stopped = True
+        worker.paused = False
+        for process in worker.processes():
+            terminate_process(process, timeout)
+    
+    status_message = reason.capitalize()
+
 @app.post("/cancel")
 def cancel_job():
-    global current_process, current_job, status_message, paused, stopped
+    data = request.get_json(silent=True) or {}
+    stop_workers(find_workers(data.get("id")), "cancelled", timeout=5)
     
-    stopped = True
+    return jsonify({"status": "cancelled"})
+
+@app.post("/stop")
+def stop_encoding():
+    data = request.get_json(silent=True) or {}
+    stop_workers(find_workers(data.get("id")), "stopped", timeout=2)
     
-    if current_process:
-        try:
-            # Kill the process
-            current_process.terminate()
-            try:
-                current_process.wait(timeout=5)
-            except:
-                current_process.kill()
-        except:
-            pass
-        current_process = None
-    
-    if current_job:
-        current_job.status = "cancelled"
-        current_job.end_time = datetime.now().isoformat()
-        current_job.eta = "--:--"
-        current_job.time_remaining = "--:--"
-        
-        # Add cancellation message
-        encoding_details['encoding_log'].append({
-            'timestamp': datetime.now().isoformat(),
-            'message': "⏹ Encoding cancelled by user",
-            'type': 'warning'
-        })
-        
-        # Clean up temp file
-        if current_job.temp_output_path and os.path.exists(current_job.temp_output_path):
-            try:
-                os.remove(current_job.temp_output_path)
-            except:
-                pass
-        
-        current_job = None
+    return jsonify({"status": "stopped"})
+
+class RemoteAgent:
+    """An encode box running agent.py that pulls jobs from this coordinator"""
+    def __init__(self, agent_id, name, cores, max_jobs):
+        self.id = agent_id
+        self.name = name
+        self.cores = cores
+        self.max_jobs = max_jobs
+        self.external_load = 0.0  # fraction of the box busy with work other than our encodes
+        self.last_seen = time.time()
     
-    paused = False
-    status_message = "Cancelled"
-    progress_percent = 0
+    def workers(self):
+        return [w for w in active_workers.values() if w.agent is self]
     
-    # Start next job in queue
-    process_queue()
+    def free_slots(self):
+        """Job slots left once cores taken by other work on the box are set aside"""
+        cores_per_job = self.cores / self.max_jobs
+        usable = self.cores * (1 - self.external_load)
+        slots = min(self.max_jobs, int(usable / cores_per_job + 0.5))
+        return max(0, slots - len(self.workers()))
     
-    return jsonify({"status": "cancelled"})
+    def free_cores(self):
+        return self.cores * (1 - self.external_load) - len(self.workers()) * self.cores / self.max_jobs
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'cores': self.cores,
+            'max_jobs': self.max_jobs,
+            'external_load': round(self.external_load, 2),
+            'jobs': [w.job.id for w in self.workers()],
+            'last_seen': round(time.time() - self.last_seen, 1)
+        }
 
-@app.post("/stop")
-def stop_encoding():
-    global current_process, current_job, status_message, paused, stopped
+class AgentRegistry:
+    """Registered remote agents; a background thread re-queues the jobs of agents that go silent"""
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.agents = {}  # agent id -> RemoteAgent
+        self.thread = None
     
-    stopped = True
+    def ensure_running(self):
+        with scheduler_lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
     
-    if current_process:
-        try:
-            # Kill the process
-            current_process.terminate()
-            try:
-                current_process.wait(timeout=2)
-            except:
-                try:
-                    current_process.kill()
-                except:
-                    pass
-        except:
-            pass
-        current_process = None
-    
-    if current_job:
-        current_job.status = "stopped"
-        current_job.end_time = datetime.now().isoformat()
-        current_job.eta = "--:--"
-        current_job.time_remaining = "--:--"
-        
-        # Add stop message
-        encoding_details['encoding_log'].append({
-            'timestamp': datetime.now().isoformat(),
-            'message': "⏹ Encoding stopped by user",
-            'type': 'warning'
-        })
-        
-        # Clean up temp file
-        if current_job.temp_output_path and os.path.exists(current_job.temp_output_path):
-            try:
-                os.remove(current_job.temp_output_path)
-            except:
-                pass
+    def register(self, name, cores, max_jobs):
+        with scheduler_lock:
+            # A restarted agent registers again under the same name; its old jobs are gone
+            for agent in list(self.agents.values()):
+                if agent.name == name:
+                    self.drop(agent, "re-registered")
+            agent = RemoteAgent(secrets.token_hex(8), name, cores, max_jobs)
+            self.agents[agent.id] = agent
+        self.ensure_running()
+        print(f"Agent registered: {name} ({cores} cores, {max_jobs} jobs)")
+        return agent
+    
+    def touch(self, agent_id):
+        """The agent for an id, marked as seen now, or None if it isn't registered"""
+        with scheduler_lock:
+            agent = self.agents.get(agent_id)
+            if agent:
+                agent.last_seen = time.time()
+            return agent
+    
+    def capacity(self):
+        with scheduler_lock:
+            return sum(agent.max_jobs for agent in self.agents.values())
+    
+    def drop(self, agent, reason):
+        """Forget an agent and put its unfinished jobs back at the front of the queue"""
+        with scheduler_lock:
+            self.agents.pop(agent.id, None)
+            for worker in reversed(agent.workers()):
+                if worker.stopped:
+                    # finish_worker frees the slot and the job's input path
+                    record_stopped(worker)
+                    finish_worker(worker)
+                    continue
+                del active_workers[worker.job.id]
+                reset_job(worker.job)
+                encoding_queue.push(worker.job)
+                encoding_queue.move_to_top(worker.job.id)
+                job_store.update_job(worker.job)
+                job_store.save_positions([worker.job])
+                print(f"Re-queued {worker.job.filename} from agent {agent.name}")
+        print(f"Agent dropped: {agent.name} ({reason})")
+        process_queue()
+    
+    def run(self):
+        while True:
+            time.sleep(AGENT_POLL_INTERVAL)
+            cutoff = time.time() - self.timeout
+            with scheduler_lock:
+                silent = [agent for agent in self.agents.values() if agent.last_seen < cutoff]
+            for agent in silent:
+                self.drop(agent, "timed out")
+    
+    def dispatch(self, agent):
+        """Hand the next queued job to an agent, or None if it should wait.
+        When several agents have room, the one with the most free cores goes first."""
+        global queue_running
+        with scheduler_lock:
+            if not queue_running or agent.free_slots() <= 0:
+                return None
+            recent = time.time() - AGENT_POLL_INTERVAL * 1.5
+            candidates = [a for a in self.agents.values() if a.last_seen >= recent and a.free_slots() > 0]
+            if max(candidates, key=lambda a: a.free_cores(), default=agent) is not agent:
+                return None
+            
+            next_job, preset = pop_runnable_job()
+            if next_job is None:
+                if not running_workers():
+                    queue_running = False
+                return None
+            
+            used_slots = {w.slot for w in active_workers.values()}
+            worker = EncodingWorker(next(s for s in itertools.count() if s not in used_slots), next_job)
+            worker.preset = preset
+            worker.agent = agent
+            active_workers[next_job.id] = worker
         
-        current_job = None
+        job = next_job
+        job.status = "encoding"
+        job.start_time = datetime.now().isoformat()
+        job_store.update_job(job)
+        if job.media_info:
+            worker.details['total_frames'] = job.media_info['frame_count']
+        worker.details['start_timestamp'] = datetime.now()
+        log_event(worker.details, f"Dispatched to agent {agent.name}")
+        return worker
+
+def reset_job(job):
+    """Return an interrupted job to its queued state"""
+    job.status = "queued"
+    job.progress = 0
+    job.start_time = None
+    job.end_time = None
+    job.current_fps = 0.0
+    job.average_fps = 0.0
+    job.time_elapsed = '00:00'
+    job.time_remaining = '--:--'
+    job.eta = '--:--'
+    job.current_output_size = 0
+
+agent_registry = AgentRegistry(AGENT_TIMEOUT)
+
+def agent_request():
+    """(authorized, JSON body) for a call from an agent, checked against AGENT_TOKEN"""
+    if AGENT_TOKEN and not hmac.compare_digest(request.headers.get("X-Agent-Token", ""), AGENT_TOKEN):
+        return False, None
+    return True, request.get_json(silent=True) or {}
+
+@app.post("/agents/register")
+def register_agent():
+    ok, data = agent_request()
+    if not ok:
+        return jsonify({"error": "Invalid agent token"}), 403
     
-    paused = False
-    status_message = "Stopped"
-    progress_percent = 0
+    try:
+        cores = max(1, int(data.get("cores", 1)))
+        max_jobs = max(1, int(data.get("max_jobs", 1)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "cores and max_jobs must be integers"}), 400
     
-    # Start next job in queue
-    process_queue()
+    agent = agent_registry.register(str(data.get("name") or request.remote_addr), cores, max_jobs)
+    return jsonify({
+        'agent_id': agent.id,
+        'poll_interval': AGENT_POLL_INTERVAL,
+        'report_interval': AGENT_REPORT_INTERVAL
+    })
+
+@app.get("/agents")
+def list_agents():
+    with scheduler_lock:
+        return jsonify([agent.to_dict() for agent in agent_registry.agents.values()])
+
+@app.post("/agents/<agent_id>/poll")
+def poll_agent(agent_id):
+    ok, data = agent_request()
+    if not ok:
+        return jsonify({"error": "Invalid agent token"}), 403
+    agent = agent_registry.touch(agent_id)
+    if agent is None:
+        return jsonify({"error": "Unknown agent"}), 404
     
-    return jsonify({"status": "stopped"})
+    try:
+        agent.external_load = min(1.0, max(0.0, float(data.get("external_load", 0.0))))
+    except (TypeError, ValueError):
+        pass
+    
+    worker = agent_registry.dispatch(agent)
+    if worker is None:
+        return jsonify({'job': None})
+    
+    job = worker.job
+    input_path = job.file_path if job.file_path else os.path.join(MEDIA_DIR, job.filename)
+    preset_path = os.path.join(PRESET_DIR, job.preset)
+    try:
+        with open(preset_path) as f:
+            preset = f.read()
+    except OSError as e:
+        record_failed(worker, str(e), f"✗ Could not read preset: {e}")
+        finish_worker(worker)
+        return jsonify({'job': None})
+    
+    output_file = os.path.splitext(job.filename)[0] + f".{job.output_format}"
+    worker.cache_key = output_cache.key_for(input_path, preset_path, job.output_format)
+    if worker.cache_key and output_cache.fetch(worker.cache_key, os.path.join(OUTPUT_DIR, output_file)):
+        log_event(worker.details, "Identical encode found in the output cache, reusing it")
+        record_completed(worker, output_file, get_file_size(os.path.join(OUTPUT_DIR, output_file)))
+        finish_worker(worker)
+        return jsonify({'job': None})
+    
+    # The agent gets its share of cores as the encoder thread count
+    return jsonify({'job': {
+        'id': job.id,
+        'filename': job.filename,
+        'input': os.path.relpath(input_path, MEDIA_DIR),
+        'preset_name': job.preset,
+        'preset': preset,
+        'output_format': job.output_format,
+        'output_file': output_file,
+        'encopts': build_thread_options(worker.preset, max(1, agent.cores // agent.max_jobs)),
+        'media_info': job.media_info
+    }})
+
+def find_agent_worker(agent_id, job_id):
+    """(agent, worker) for an agent's job report; either is None if unknown"""
+    agent = agent_registry.touch(agent_id)
+    if agent is None:
+        return None, None
+    worker = active_workers.get(job_id)
+    if worker is None or worker.agent is not agent:
+        return agent, None
+    return agent, worker
+
+@app.post("/agents/<agent_id>/jobs/<int:job_id>/progress")
+def agent_job_progress(agent_id, job_id):
+    ok, data = agent_request()
+    if not ok:
+        return jsonify({"error": "Invalid agent token"}), 403
+    agent, worker = find_agent_worker(agent_id, job_id)
+    if worker is None:
+        # Cancelled or re-queued meanwhile: the agent should drop it
+        return jsonify({"error": "Unknown agent" if agent is None else "Job not assigned to this agent",
+                        "stop": "cancelled"}), 404
+    
+    for message in data.get("log", []):
+        log_event(worker.details, message)
+    if data.get("update"):
+        apply_progress_update(worker, data["update"])
+    if "output_bytes" in data:
+        output_monitor.observe(worker, data["output_bytes"])
+    
+    # Control requests ride on the response
+    return jsonify({
+        'paused': worker.paused,
+        'stop': (worker.stop_reason or "stopped") if worker.stopped else None
+    })
+
+@app.post("/agents/<agent_id>/jobs/<int:job_id>/finish")
+def agent_job_finish(agent_id, job_id):
+    global status_message
+    
+    ok, data = agent_request()
+    if not ok:
+        return jsonify({"error": "Invalid agent token"}), 403
+    agent, worker = find_agent_worker(agent_id, job_id)
+    if worker is None:
+        return jsonify({"error": "Unknown agent" if agent is None else "Job not assigned to this agent"}), 404
+    
+    for message in data.get("log", []):
+        log_event(worker.details, message)
+    
+    if worker.stopped or data.get("stopped"):
+        record_stopped(worker)
+    elif data.get("returncode") == 0:
+        record_completed(worker, data.get("output_file", ""), round(data.get("output_bytes", 0) / (1024 * 1024), 2))
+        if worker.cache_key:
+            job = worker.job
+            finalizer.submit(output_cache.store, worker.cache_key,
+                             os.path.join(OUTPUT_DIR, os.path.splitext(job.filename)[0] + f".{job.output_format}"))
+    elif data.get("error"):
+        record_failed(worker, data["error"], f"✗ Encoding error on {agent.name}: {data['error']}")
+        status_message = f"Error: {worker.job.filename} - {data['error']}"
+    else:
+        returncode = data.get("returncode")
+        record_failed(worker, f"Process exited with code {returncode}",
+                      f"✗ Encoding failed on {agent.name} with return code {returncode}", returncode)
+    
+    finish_worker(worker)
+    return jsonify({"status": "recorded"})
 
 @app.post("/upload-preset")
 def upload_preset():
@@ -844,43 +2786,291 @@ def upload_preset():
         return jsonify({"error": "Only .json files allowed"}), 400
     
     filename = secure_filename(file.filename)
-    os.makedirs(PRESET_DIR, exist_ok=True)
-    file.save(os.path.join(PRESET_DIR, filename))
+    try:
+        preset = preset_registry.save(filename, file.read())
+    except ValueError as e:
+        return jsonify({"error": f"Invalid preset: {e}"}), 400
+    
+    return jsonify({"status": "saved", "filename": filename, "preset": preset.to_dict() if preset else None})
+
+class StatsSampler:
+    """Background thread that samples host and encoder process stats into a ring buffer"""
+    def __init__(self, interval, history_size):
+        self.interval = interval
+        self.samples = deque(maxlen=history_size)
+        self.lock = threading.Lock()
+        self.processes = {}  # pid -> psutil.Process, kept so cpu_percent() has a baseline
+        self.thread = None
+    
+    def ensure_running(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            # The first cpu_percent() call only sets the baseline
+            psutil.cpu_percent(interval=None)
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+    
+    def sample(self):
+        """Take one sample without blocking; CPU figures cover the time since the last one"""
+        processes = []
+        seen = set()
+        for worker in get_active_workers():
+            for process in worker.processes():
+                pid = process.pid
+                try:
+                    p = self.processes.get(pid)
+                    if p is None:
+                        p = psutil.Process(pid)
+                        p.cpu_percent()
+                        self.processes[pid] = p
+                    seen.add(pid)
+                    processes.append({
+                        'job_id': worker.job.id,
+                        'pid': pid,
+                        'cpu': p.cpu_percent(),
+                        'ram_mb': round(p.memory_info().rss / (1024 * 1024), 1),
+                        'suspended': p.status() == psutil.STATUS_STOPPED
+                    })
+                except psutil.Error:
+                    pass
+        
+        # Forget processes that have exited
+        for pid in list(self.processes):
+            if pid not in seen:
+                del self.processes[pid]
+        
+        now = datetime.now()
+        return {
+            'time': now.timestamp(),
+            'timestamp': now.strftime("%H:%M:%S"),
+            'cpu': psutil.cpu_percent(interval=None),
+            'ram': psutil.virtual_memory().percent,
+            'disk': psutil.disk_usage('/').percent,
+            'process_cpu': round(sum(p['cpu'] for p in processes), 1),
+            'process_ram_mb': round(sum(p['ram_mb'] for p in processes), 1),
+            'processes': processes
+        }
+    
+    def run(self):
+        while True:
+            try:
+                sample = self.sample()
+                with self.lock:
+                    self.samples.append(sample)
+            except Exception as e:
+                print(f"Stats sampler error: {e}")
+            time.sleep(self.interval)
+    
+    def latest(self):
+        self.ensure_running()
+        with self.lock:
+            if self.samples:
+                return self.samples[-1]
+        # Nothing recorded yet; answer with an immediate sample
+        sample = self.sample()
+        with self.lock:
+            self.samples.append(sample)
+        return sample
     
-    return jsonify({"status": "saved", "filename": filename})
+    def history(self, seconds):
+        self.ensure_running()
+        cutoff = time.time() - seconds
+        with self.lock:
+            return [sample for sample in self.samples if sample['time'] >= cutoff]
+
+stats_sampler = StatsSampler(STATS_SAMPLE_INTERVAL, STATS_HISTORY_SIZE)
+
+def collect_system_stats():
+    """Latest host and encoder process stats, shared by /system-stats and the /events stream"""
+    sample = stats_sampler.latest()
+    return {
+        'cpu': sample['cpu'],
+        'ram': sample['ram'],
+        'disk': sample['disk'],
+        'process_cpu': sample['process_cpu'],
+        'process_ram': f"{sample['process_ram_mb']:.1f} MB",
+        'process_ram_mb': sample['process_ram_mb'],
+        'active_processes': len(sample['processes']),
+        'suspended_processes': sum(1 for p in sample['processes'] if p['suspended']),
+        'timestamp': sample['timestamp']
+    }
 
 @app.get("/system-stats")
 def get_system_stats():
-    cpu = psutil.cpu_percent(interval=0.2)
-    ram = psutil.virtual_memory().percent
-    disk = psutil.disk_usage('/').percent
-    
-    # Process stats if encoding
-    process_cpu = 0
-    process_ram = 0
-    if current_process:
-        try:
-            p = psutil.Process(current_process.pid)
-            process_cpu = p.cpu_percent(interval=0.1)
-            process_ram = p.memory_info().rss / (1024 * 1024)  # MB
-        except:
-            pass
+    return jsonify(collect_system_stats())
+
+@app.get("/system-stats/history")
+def get_system_stats_history():
+    seconds = request.args.get("seconds", default=300, type=int)
+    seconds = max(1, min(seconds, int(STATS_HISTORY_SIZE * STATS_SAMPLE_INTERVAL)))
     
     return jsonify({
-        'cpu': cpu,
-        'ram': ram,
-        'disk': disk,
-        'process_cpu': process_cpu,
-        'process_ram': f"{process_ram:.1f} MB",
-        'process_ram_mb': process_ram,
-        'timestamp': datetime.now().strftime("%H:%M:%S")
+        'interval': STATS_SAMPLE_INTERVAL,
+        'samples': stats_sampler.history(seconds)
     })
 
-if __name__ == "__main__":
-    # Create directories if they don't exist
-    os.makedirs(MEDIA_DIR, exist_ok=True)
-    os.makedirs(PRESET_DIR, exist_ok=True)
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    os.makedirs(TEMP_DIR, exist_ok=True)
+@app.get("/metrics")
+def get_metrics():
+    # Counters and histograms are kept as jobs run; queue and worker gauges are read now
+    now = time.time()
+    queued = encoding_queue.ordered()
+    depth = {(priority,): 0 for priority in PRIORITY_CLASSES}
+    for job in queued:
+        depth[(job.priority,)] += 1
+    queue_depth_metric.replace(depth)
+    oldest_queued_metric.set(round(max((now - job.queued_at for job in queued), default=0), 3))
+    
+    active = {}
+    for worker in get_active_workers():
+        key = ("remote" if worker.agent else "local", "paused" if worker.paused else "encoding")
+        active[key] = active.get(key, 0) + 1
+    active_jobs_metric.replace(active)
+    
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def sweep_temp_files(interrupted):
+    """Remove partial outputs left by encodes and copies that never finished"""
+    for directory in {TEMP_DIR, encode_temp_dir}:
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if not name.startswith("temp_"):
+                continue
+            try:
+                os.remove(os.path.join(directory, name))
+                print(f"Removed stale temp file: {name}")
+            except OSError as e:
+                print(f"Error removing stale temp file {name}: {e}")
+    
+    # An interrupted copy leaves its .part beside the final output
+    for job in interrupted:
+        part_path = os.path.join(OUTPUT_DIR, os.path.splitext(job.filename)[0] + f".{job.output_format}.part")
+        if os.path.exists(part_path):
+            try:
+                os.remove(part_path)
+                print(f"Removed partial output: {os.path.basename(part_path)}")
+            except OSError as e:
+                print(f"Error removing partial output {part_path}: {e}")
+
+def restore_state():
+    """Rebuild the queue and recent history from job_store after a restart or crash"""
+    interrupted = []
+    job_ids.seed(job_store.max_job_id())
+    for row in job_store.load_jobs():
+        job = EncodingJob(row['id'], row['filename'], row['preset'], row['output_format'], row['file_path'])
+        job.input_size = row['input_size']
+        if row['priority'] in PRIORITY_CLASSES:
+            job.priority = row['priority']
+        queued_paths.setdefault(input_path_key(job_input_path(job)), job)
+        encoding_queue.push(job, row['position'])
+        if row['status'] != "queued":
+            # Interrupted mid-encode: start it again from the top of its class
+            print(f"Re-queued interrupted job: {job.filename}")
+            job_store.update_job(job)
+            interrupted.append(job)
+        
+        def set_media_info(info, job=job):
+            job.media_info = info
+        media_prober.submit(job_input_path(job), set_media_info)
+    
+    for job in reversed(interrupted):
+        encoding_queue.move_to_top(job.id)
+    job_store.save_positions(interrupted)
+    encoding_history.extend(job_store.recent_history(HISTORY_CACHE_SIZE))
+    for entry in job_store.recent_history(MODEL_HISTORY_ROWS):
+        throughput_model.add(entry)
+    
+    # Nothing is encoding yet, so every temp output is left over
+    sweep_temp_files(interrupted)
+    if log_spooler:
+        log_spooler.prune(LOG_RETENTION_DAYS)
+
+class EncodingEngine:
+    """The scheduler side of the app: restored queue, encode threads and
+    background services, shared by every request thread of one process
+
+    Nothing runs until start(). A lock file beside the job store lets only
+    one process start the engine, so a second copy of the app (or a second
+    server worker process) can't restore the same queue and encode every job
+    twice; scale request handling with threads instead.
+    """
+    def __init__(self, lock_path):
+        self.lock_path = lock_path
+        self.lock = threading.Lock()
+        self.lock_file = None
+        self.started = False
+        self.stopping = False
+    
+    def acquire_lock_file(self):
+        if fcntl is None:
+            return
+        lock_file = open(self.lock_path, "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(f"Another process is running the encoding engine ({self.lock_path})")
+        lock_file.truncate(0)
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self.lock_file = lock_file
     
+    def start(self):
+        """Take the engine lock and restore the queue; safe to call more than once"""
+        with self.lock:
+            if self.started:
+                return
+            self.acquire_lock_file()
+            # Only the lock holder may touch the job store and the output cache
+            job_store.open()
+            output_cache.load()
+            # Create directories if they don't exist
+            for directory in (MEDIA_DIR, PRESET_DIR, OUTPUT_DIR, TEMP_DIR):
+                os.makedirs(directory, exist_ok=True)
+            self.place_temp_files()
+            restore_state()
+            self.started = True
+            # Stop local encoders when the process exits, whichever server runs the app
+            atexit.register(self.shutdown)
+    
+    def place_temp_files(self):
+        """Encode onto OUTPUT_DIR's filesystem when TEMP_DIR is elsewhere, so
+        finishing a job is a rename rather than a copy"""
+        global encode_temp_dir
+        encode_temp_dir = encode_directory(TEMP_DIR, OUTPUT_DIR)
+        if encode_temp_dir != TEMP_DIR:
+            print(f"TEMP_DIR is not on the output filesystem; encoding into {encode_temp_dir}")
+    
+    def shutdown(self):
+        """Stop local encoders and start nothing new; their jobs stay stored as
+        interrupted, so the next start re-queues them at the top; later calls do nothing"""
+        global queue_running
+        
+        with scheduler_lock:
+            if self.stopping:
+                return
+            self.stopping = True
+            queue_running = False
+            # Copies in the finalize pool run to the end
+            workers = [w for w in active_workers.values() if w.agent is None and w.job.status != "finalizing"]
+        # Marked stopped before their encoders go, so they don't end up as failures
+        stop_workers(workers, "interrupted", timeout=2)
+
+engine = EncodingEngine(JOB_STORE_FILE + ".lock")
+
+@app.before_request
+def start_engine():
+    """Start the engine on the first request when the app is served directly
+    (flask run, gunicorn app:app) rather than through serve.py"""
+    if not engine.started:
+        try:
+            engine.start()
+        except RuntimeError as e:
+            return jsonify({"error": f"Encoding engine unavailable: {e}"}), 503
+
+if __name__ == "__main__":
+    # Development server; serve.py is the production entry point
+    engine.start()
     app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
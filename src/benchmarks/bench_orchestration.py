@@ -0,0 +1,296 @@
+"""Orchestration benchmark: the app under load, with no real video.
+
+Runs the app in-process against fake_handbrake.py (installed on PATH as
+HandBrakeCLI), which replays the captured logs in benchmarks/logs at a fixed
+line rate. Three phases:
+
+  parser   ProgressParser cost per replayed line
+  encode   a batch of jobs through process_queue/run_encode while client
+           threads poll /queue, /files and /encoding-details; reports
+           jobs/hour, the gap between one job finishing and the next starting,
+           and API latencies under encode load
+  queue    the same API load against a large queue that isn't running
+
+All state lives in a temporary directory; config.env is not read.
+
+    cd src && python benchmarks/bench_orchestration.py [--jobs N] [--save FILE] [--compare FILE]
+
+With --compare, exits 1 if a latency grew or jobs/hour fell by more than
+--tolerance against the saved results.
+"""
+import argparse
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SRC_DIR)
+
+ENDPOINTS = ("/queue", "/files", "/encoding-details")
+
+# Preset the fake encodes run with; only the registry and thread options read it
+BENCH_PRESET = {"PresetList": [{"PresetName": "Bench", "VideoEncoder": "x264", "VideoQualitySlider": 22,
+                                "PictureWidth": 1920, "PictureHeight": 1080, "FileFormat": "av_mp4"}]}
+
+def percentile(values, fraction):
+    """Nearest-rank percentile; None for no values"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def summarize_ms(seconds):
+    return {
+        'count': len(seconds),
+        'p50_ms': round(percentile(seconds, 0.5) * 1000, 3) if seconds else None,
+        'p99_ms': round(percentile(seconds, 0.99) * 1000, 3) if seconds else None
+    }
+
+def prepare_environment(root, args):
+    """Media, preset and app directories under root, a HandBrakeCLI on PATH,
+    and the app's settings in the environment (read when app is imported)"""
+    media_dir = os.path.join(root, "media")
+    preset_dir = os.path.join(root, "presets")
+    bin_dir = os.path.join(root, "bin")
+    for directory in (media_dir, preset_dir, bin_dir):
+        os.makedirs(directory)
+
+    # Sources only need to exist; the fake encoder never reads them
+    for i in range(args.library_size):
+        season = os.path.join(media_dir, f"Show {i // 100:02d}")
+        os.makedirs(season, exist_ok=True)
+        with open(os.path.join(season, f"episode_{i:04d}.mkv"), "wb") as f:
+            f.write(b"\0" * 4096)
+    with open(os.path.join(preset_dir, "bench.json"), "w") as f:
+        json.dump(BENCH_PRESET, f)
+
+    handbrake = os.path.join(bin_dir, "HandBrakeCLI")
+    with open(handbrake, "w") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(BENCH_DIR, "fake_handbrake.py")}" "$@"\n')
+    os.chmod(handbrake, os.stat(handbrake).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    os.environ.update({
+        'PATH': bin_dir + os.pathsep + os.environ.get('PATH', ''),
+        'MEDIA_DIR': media_dir,
+        'PRESET_DIR': preset_dir,
+        'OUTPUT_DIR': os.path.join(root, "output"),
+        'TEMP_DIR': os.path.join(root, "temp"),
+        'LOG_DIR': os.path.join(root, "logs"),
+        'JOB_STORE_FILE': os.path.join(root, "encoder.db"),
+        'PROBE_CACHE_FILE': os.path.join(root, "probe_cache.json"),
+        'MEDIA_INDEX_FILE': os.path.join(root, "media_index.json"),
+        'OUTPUT_CACHE_SIZE_GB': "0",
+        'SPLIT_SEGMENTS': "0",
+        'PROGRESS_FORMAT': "text",
+        'MAX_CONCURRENT_JOBS': str(args.concurrency),
+        'BATCH_ADD_LIMIT': str(args.library_size),
+        'FAKE_HANDBRAKE_RATE': str(args.rate),
+        'FAKE_HANDBRAKE_OUTPUT_MB': str(args.output_mb)
+    })
+    for directory in ("output", "temp", "logs"):
+        os.makedirs(os.path.join(root, directory))
+
+def bench_parser(repeat):
+    from progress_parser import ProgressParser
+    from fake_handbrake import load_log
+
+    lines = load_log()
+    parser = ProgressParser()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            parser.feed(line)
+    elapsed = time.perf_counter() - start
+    return {'lines': len(lines) * repeat, 'ns_per_line': round(elapsed * 1e9 / (len(lines) * repeat))}
+
+class LoadGenerator:
+    """Client threads requesting the endpoints round-robin until stopped"""
+    def __init__(self, app, threads):
+        self.app = app
+        self.threads = threads
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors = 0
+        self.workers = []
+
+    def start(self):
+        for i in range(self.threads):
+            thread = threading.Thread(target=self.run, args=(i,))
+            thread.daemon = True
+            thread.start()
+            self.workers.append(thread)
+
+    def run(self, offset):
+        client = self.app.test_client()
+        i = offset
+        while not self.stopping.is_set():
+            endpoint = ENDPOINTS[i % len(ENDPOINTS)]
+            i += 1
+            start = time.perf_counter()
+            response = client.get(endpoint)
+            response.get_data()
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                if response.status_code >= 400:
+                    self.errors += 1
+                else:
+                    self.latencies[endpoint].append(elapsed)
+
+    def stop(self):
+        self.stopping.set()
+        for thread in self.workers:
+            thread.join()
+        result = {endpoint: summarize_ms(values) for endpoint, values in self.latencies.items()}
+        result['errors'] = self.errors
+        return result
+
+def dispatch_gaps(jobs, concurrency):
+    """Seconds from a job finishing to the next job starting in the freed slot"""
+    starts = sorted(datetime.fromisoformat(job.start_time) for job in jobs if job.start_time)
+    ends = sorted(datetime.fromisoformat(job.end_time) for job in jobs if job.end_time)
+    gaps = []
+    # The first wave starts without waiting for anything
+    for start in starts[concurrency:]:
+        finished = [end for end in ends if end <= start]
+        if finished:
+            gaps.append((start - finished[-1]).total_seconds())
+    return gaps
+
+def bench_encode(app_module, args):
+    client = app_module.app.test_client()
+    response = client.post("/queue/add-batch", json={
+        'directory': "", 'recursive': True, 'preset': "bench.json"
+    })
+    added = response.get_json().get('added', [])[:args.jobs]
+    # Encode only the first --jobs files; the queue phase queues the whole library
+    keep = {item['id'] for item in added}
+    jobs = [job for job in app_module.encoding_queue.ordered() if job.id in keep]
+    for job in app_module.encoding_queue.ordered():
+        if job.id not in keep:
+            client.post("/queue/remove", json={'id': job.id})
+
+    load = LoadGenerator(app_module.app, args.clients)
+    load.start()
+    start = time.perf_counter()
+    client.post("/start")
+    deadline = start + args.timeout
+    while time.perf_counter() < deadline:
+        if all(job.status in ("completed", "failed") for job in jobs):
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    latencies = load.stop()
+
+    completed = [job for job in jobs if job.status == "completed"]
+    gaps = dispatch_gaps(jobs, args.concurrency)
+    return {
+        'jobs': len(jobs),
+        'completed': len(completed),
+        'seconds': round(elapsed, 3),
+        'jobs_per_hour': round(len(completed) / elapsed * 3600, 1) if elapsed else None,
+        'dispatch_gap': summarize_ms(gaps),
+        'api': latencies
+    }
+
+def bench_queue(app_module, args):
+    client = app_module.app.test_client()
+    client.post("/stop")
+    client.post("/queue/clear")
+    client.post("/queue/add-batch", json={'directory': "", 'recursive': True, 'preset': "bench.json"})
+    queued = len(app_module.encoding_queue)
+
+    load = LoadGenerator(app_module.app, args.clients)
+    load.start()
+    time.sleep(args.duration)
+    return {'queued': queued, 'api': load.stop()}
+
+def regressions(current, baseline, tolerance):
+    """Descriptions of every metric worse than the baseline by more than tolerance"""
+    found = []
+    def check(name, now, before, higher_is_worse=True):
+        if now is None or not before:
+            return
+        change = (now - before) / before
+        if (change if higher_is_worse else -change) > tolerance:
+            found.append(f"{name}: {before} -> {now} ({change:+.0%})")
+
+    check("parser ns/line", current['parser']['ns_per_line'], baseline['parser']['ns_per_line'])
+    check("jobs/hour", current['encode']['jobs_per_hour'], baseline['encode']['jobs_per_hour'], False)
+    check("dispatch gap p50", current['encode']['dispatch_gap']['p50_ms'], baseline['encode']['dispatch_gap']['p50_ms'])
+    for phase in ("encode", "queue"):
+        for endpoint in ENDPOINTS:
+            check(f"{phase} {endpoint} p99", current[phase]['api'][endpoint]['p99_ms'],
+                  baseline[phase]['api'][endpoint]['p99_ms'])
+    return found
+
+def report(results):
+    print(f"parser: {results['parser']['ns_per_line']} ns/line")
+    encode = results['encode']
+    print(f"encode: {encode['completed']}/{encode['jobs']} jobs in {encode['seconds']} s,"
+          f" {encode['jobs_per_hour']} jobs/hour, dispatch gap p50 {encode['dispatch_gap']['p50_ms']} ms"
+          f" p99 {encode['dispatch_gap']['p99_ms']} ms")
+    for phase, title in (("encode", "while encoding"), ("queue", f"{results['queue']['queued']} queued")):
+        api = results[phase]['api']
+        print(f"api ({title}, {api['errors']} errors):")
+        for endpoint in ENDPOINTS:
+            stats = api[endpoint]
+            print(f"  {endpoint:<20} {stats['count']:7d} requests  p50 {stats['p50_ms']} ms  p99 {stats['p99_ms']} ms")
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--jobs", type=int, default=20, help="jobs encoded in the encode phase")
+    arg_parser.add_argument("--concurrency", type=int, default=2, help="MAX_CONCURRENT_JOBS")
+    arg_parser.add_argument("--rate", type=float, default=2000, help="replayed log lines per second per encode")
+    arg_parser.add_argument("--output-mb", type=float, default=1, help="size of each fake output")
+    arg_parser.add_argument("--library-size", type=int, default=1000, help="media files, also the queue phase's queue length")
+    arg_parser.add_argument("--clients", type=int, default=4, help="concurrent API client threads")
+    arg_parser.add_argument("--duration", type=float, default=5, help="seconds of API load in the queue phase")
+    arg_parser.add_argument("--parser-repeat", type=int, default=50, help="passes over the log in the parser phase")
+    arg_parser.add_argument("--timeout", type=float, default=600, help="give up on the encode phase after this long")
+    arg_parser.add_argument("--save", help="write the results to this JSON file")
+    arg_parser.add_argument("--compare", help="baseline results JSON to check against")
+    arg_parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional regression")
+    arg_parser.add_argument("--keep", action="store_true", help="keep the temporary directory")
+    args = arg_parser.parse_args()
+    args.jobs = min(args.jobs, args.library_size)
+
+    root = tempfile.mkdtemp(prefix="encoder-bench-")
+    cwd = os.getcwd()
+    try:
+        prepare_environment(root, args)
+        # Relative paths in the app (templates aside) resolve inside root
+        os.chdir(root)
+        import app as app_module
+        app_module.engine.start()
+
+        results = {'parser': bench_parser(args.parser_repeat)}
+        results['encode'] = bench_encode(app_module, args)
+        results['queue'] = bench_queue(app_module, args)
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"Kept {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report(results)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if found else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Micro-benchmark for the HandBrake progress parser.
+
+Replays the captured HandBrakeCLI logs in benchmarks/logs through the
+per-line regex scan run_encode used before ProgressParser, and through
+ProgressParser, and reports the per-line cost of each.
+
+    cd src && python benchmarks/bench_progress_parser.py [--repeat N]
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from progress_parser import ProgressParser
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+
+def legacy_parse(line):
+    """The previous run_encode line handling: lowercase per check, uncompiled patterns"""
+    update = {}
+    line_lower = line.lower()
+    for pattern in [
+        r'eta\s+(\d{1,2})h(\d{1,2})m(\d{1,2})s',
+        r'eta\s+(\d{1,2}):(\d{1,2}):(\d{1,2})',
+        r'eta\s+(\d{1,2}):(\d{1,2})',
+    ]:
+        match = re.search(pattern, line_lower)
+        if match:
+            groups = [int(g) for g in match.groups()]
+            if len(groups) == 3:
+                update['eta_seconds'] = groups[0] * 3600 + groups[1] * 60 + groups[2]
+            else:
+                update['eta_seconds'] = groups[0] * 60 + groups[1]
+            break
+    fps_match = re.search(r'(\d+\.\d+|\d+)\s*fps', line.lower())
+    if fps_match:
+        update['fps'] = float(fps_match.group(1))
+    frame_match = re.search(r'frame\s+(\d+)\s+of\s+(\d+)', line.lower())
+    if frame_match:
+        update['frame'] = int(frame_match.group(1))
+        update['total_frames'] = int(frame_match.group(2))
+    if "%" in line and "encoding" in line.lower():
+        percent_match = re.search(r'(\d+\.\d+|\d+)\s*%', line)
+        if percent_match:
+            update['percent'] = float(percent_match.group(1))
+    return update or None
+
+def load_lines():
+    lines = []
+    for path in sorted(glob.glob(os.path.join(LOG_DIR, "*.log"))):
+        with open(path) as f:
+            lines.extend(f)
+    return lines
+
+def bench(name, parse, lines, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            parse(line)
+    elapsed = time.perf_counter() - start
+    count = len(lines) * repeat
+    print(f"{name:<16} {elapsed * 1e9 / count:8.0f} ns/line {count / elapsed:12.0f} lines/s")
+    return elapsed
+
+def check_agreement(lines):
+    """Both parsers must agree on progress, FPS and ETA for progress lines"""
+    parser = ProgressParser()
+    mismatches = 0
+    for line in lines:
+        if not line.startswith('Encoding'):
+            continue
+        old, new = legacy_parse(line) or {}, parser.parse(line) or {}
+        for key in ('percent', 'fps', 'eta_seconds'):
+            if old.get(key) != new.get(key):
+                mismatches += 1
+    return mismatches
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--repeat", type=int, default=200, help="passes over the captured logs")
+    args = arg_parser.parse_args()
+
+    lines = load_lines()
+    if not lines:
+        sys.exit(f"No captured logs found in {LOG_DIR}")
+
+    print(f"{len(lines)} captured lines x {args.repeat} passes")
+    legacy = bench("legacy regex", legacy_parse, lines, args.repeat)
+    current = bench("ProgressParser", ProgressParser().parse, lines, args.repeat)
+    print(f"speedup: {legacy / current:.1f}x")
+
+    mismatches = check_agreement(lines)
+    print(f"progress line mismatches: {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
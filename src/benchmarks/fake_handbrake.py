@@ -0,0 +1,79 @@
+"""HandBrakeCLI stand-in that replays a captured verbose log.
+
+Installed on PATH as HandBrakeCLI by bench_orchestration.py. Understands the
+subset of options the app passes:
+
+    --help                 usage text (without --json, so the app reads verbose text)
+    -i FILE --scan         the scan part of the log (everything before the first
+                           "Encoding:" line)
+    -i FILE -o FILE ...    the whole log, line by line, while the output file grows
+
+Settings come from the environment:
+
+    FAKE_HANDBRAKE_LOG          log to replay (default: the first log in benchmarks/logs)
+    FAKE_HANDBRAKE_RATE         lines written per second (default 2000, 0 = no delay)
+    FAKE_HANDBRAKE_OUTPUT_MB    output size at 100% (default 1)
+"""
+import glob
+import os
+import sys
+import time
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+
+def option(args, name):
+    return args[args.index(name) + 1] if name in args and args.index(name) + 1 < len(args) else None
+
+def load_log():
+    path = os.getenv("FAKE_HANDBRAKE_LOG") or sorted(glob.glob(os.path.join(LOG_DIR, "*.log")))[0]
+    with open(path) as f:
+        return f.readlines()
+
+def scan(lines):
+    for line in lines:
+        if line.startswith("Encoding:"):
+            break
+        sys.stdout.write(line)
+
+def encode(lines, output_path):
+    rate = float(os.getenv("FAKE_HANDBRAKE_RATE", "2000"))
+    output_bytes = int(float(os.getenv("FAKE_HANDBRAKE_OUTPUT_MB", "1")) * 1024 * 1024)
+    progress_lines = sum(1 for line in lines if line.startswith("Encoding:"))
+    written = 0
+    seen = 0
+    start = time.perf_counter()
+    with open(output_path, "wb") as output:
+        for i, line in enumerate(lines):
+            sys.stdout.write(line)
+            sys.stdout.flush()
+            if line.startswith("Encoding:"):
+                # Grow the output in step with the replayed progress
+                seen += 1
+                target = output_bytes * seen // progress_lines
+                output.write(b"\0" * (target - written))
+                output.flush()
+                written = target
+            if rate > 0:
+                delay = start + (i + 1) / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        output.write(b"\0" * (output_bytes - written))
+
+def main():
+    args = sys.argv[1:]
+    if "--help" in args:
+        print("Usage: HandBrakeCLI [options] -i <source> -o <destination>")
+        return 0
+    lines = load_log()
+    if "--scan" in args:
+        scan(lines)
+        return 0
+    output_path = option(args, "-o")
+    if not output_path:
+        print("Missing output file name. Run HandBrakeCLI --help for syntax.", file=sys.stderr)
+        return 1
+    encode(lines, output_path)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
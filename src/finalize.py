@@ -0,0 +1,134 @@
+import concurrent.futures
+import os
+import threading
+
+# Hidden directory in the output directory for encodes when TEMP_DIR is on
+# another filesystem
+OUTPUT_ENCODE_DIR = ".encoding"
+
+# Bytes per copy_file_range/sendfile call
+COPY_CHUNK = 64 * 1024 * 1024
+
+def same_filesystem(path_a, path_b):
+    try:
+        return os.stat(path_a).st_dev == os.stat(path_b).st_dev
+    except OSError:
+        return False
+
+def encode_directory(temp_dir, output_dir):
+    """Where encoders should write: temp_dir if it shares output_dir's
+    filesystem, else a hidden directory inside output_dir, so a finished
+    output is published with a rename instead of a copy"""
+    if same_filesystem(temp_dir, output_dir):
+        return temp_dir
+    directory = os.path.join(output_dir, OUTPUT_ENCODE_DIR)
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        print(f"Error creating {directory}, finished outputs will be copied from {temp_dir}: {e}")
+        return temp_dir
+    return directory
+
+def fsync_directory(path):
+    """Make a rename in a directory durable (not possible on Windows)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def copy_contents(src, dst, size):
+    """Copy size bytes from src to dst in the kernel where the platform allows
+    it: copy_file_range, then sendfile, then a plain read/write loop. Returns
+    the number of bytes copied."""
+    copied = 0
+    for method in ("copy_file_range", "sendfile"):
+        if not hasattr(os, method):
+            continue
+        try:
+            while copied < size:
+                count = min(COPY_CHUNK, size - copied)
+                if method == "copy_file_range":
+                    sent = os.copy_file_range(src.fileno(), dst.fileno(), count, copied, copied)
+                else:
+                    # sendfile writes at dst's file position
+                    os.lseek(dst.fileno(), copied, os.SEEK_SET)
+                    sent = os.sendfile(dst.fileno(), src.fileno(), copied, count)
+                if sent == 0:
+                    # Some filesystems report 0 instead of an error: try the next method
+                    break
+                copied += sent
+        except OSError:
+            # Not supported between these files: carry on from here with the next method
+            continue
+        if copied >= size:
+            return copied
+    src.seek(copied)
+    dst.seek(copied)
+    while True:
+        chunk = src.read(COPY_CHUNK)
+        if not chunk:
+            return copied
+        dst.write(chunk)
+        copied += len(chunk)
+
+def copy_file(source, destination):
+    """Copy source to destination + ".part", flush it to disk and rename it into
+    place, so readers only ever see the complete file; raises OSError if the
+    copy comes out a different size than the source"""
+    part_path = destination + ".part"
+    with open(source, "rb") as src, open(part_path, "wb") as dst:
+        size = os.fstat(src.fileno()).st_size
+        copied = copy_contents(src, dst, size)
+        dst.flush()
+        os.fsync(dst.fileno())
+        written = os.fstat(dst.fileno()).st_size
+    if copied != size or written != size:
+        raise OSError(f"Incomplete copy of {source}: {written} of {size} bytes written")
+    os.replace(part_path, destination)
+
+def publish(source, destination):
+    """Move a finished output into place atomically: a rename on the same
+    filesystem, else a .part copy and rename. The source is removed only once
+    the copy is complete. Returns True if it was copied."""
+    if same_filesystem(source, os.path.dirname(os.path.abspath(destination))):
+        # On disk before it becomes visible under its final name
+        with open(source, "rb") as f:
+            try:
+                os.fsync(f.fileno())
+            except OSError:
+                pass
+        os.replace(source, destination)
+        copied = False
+    else:
+        try:
+            copy_file(source, destination)
+        except BaseException:
+            if os.path.exists(destination + ".part"):
+                os.remove(destination + ".part")
+            raise
+        os.remove(source)
+        copied = True
+    fsync_directory(os.path.dirname(os.path.abspath(destination)))
+    return copied
+
+class Finalizer:
+    """Background I/O pool for finished outputs: cross-filesystem copies and
+    output cache copies, so neither runs on an encode or request thread"""
+    def __init__(self, workers):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def submit(self, fn, *args):
+        """Future for fn(*args), e.g. publish(source, destination)"""
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="finalize")
+        return self.executor.submit(fn, *args)
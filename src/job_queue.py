@@ -0,0 +1,209 @@
+import heapq
+import itertools
+import threading
+
+# Priority classes, most urgent first; a class is always served before the next
+PRIORITY_CLASSES = {'high': 0, 'normal': 1, 'low': 2}
+
+class JobQueue:
+    """Queued jobs in a heap ordered by (priority class, position)
+
+    A job's position is a float sort key within its class: an arrival counter
+    for first-in-first-out ordering, or an estimated encode time for
+    shortest-job-first. Removed or moved jobs leave a dead entry behind that
+    pop() skips, so adding, removing, taking the next job and moving a job to
+    the top or bottom of its class are all O(log n). Listing the queue sorts
+    the live entries once per change; moving a job one place up or down
+    trades keys with its neighbour and patches that listing instead.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.heap = []  # [class, position, seq, serial, job]; job is None once the entry is dead
+        self.entries = {}  # job id -> live heap entry
+        self.counter = itertools.count()
+        self.low_water = {}  # class -> lowest position handed out
+        self.high_water = {}  # class -> highest position handed out
+        self.snapshot = None  # ordered jobs, rebuilt after a change
+        self.index = {}  # job id -> index in snapshot
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.ordered())
+
+    def get(self, job_id):
+        with self.lock:
+            entry = self.entries.get(job_id)
+            return entry[-1] if entry else None
+
+    def push(self, job, position=None):
+        """Queue a job at a position in its class (default: the end of the class)"""
+        with self.lock:
+            rank = PRIORITY_CLASSES[job.priority]
+            if position is None:
+                position = self.high_water.get(rank, -1) + 1
+            self.place(job, position)
+            self.snapshot = None
+
+    def place(self, job, position, seq=None):
+        """Give a job a new heap entry at a position in its class (ties go by
+        seq, default: after everything placed so far), leaving the snapshot to
+        the caller (caller holds the lock)"""
+        rank = PRIORITY_CLASSES[job.priority]
+        old = self.entries.get(job.id)
+        if old is not None:
+            old[-1] = None
+        job.queue_position = position
+        self.low_water[rank] = min(position, self.low_water.get(rank, position))
+        self.high_water[rank] = max(position, self.high_water.get(rank, position))
+        serial = next(self.counter)
+        # A reused seq is told apart from its dead entry by the serial
+        entry = [rank, position, serial if seq is None else seq, serial, job]
+        self.entries[job.id] = entry
+        heapq.heappush(self.heap, entry)
+
+        # Drop dead entries once they outnumber the live ones
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = list(self.entries.values())
+            heapq.heapify(self.heap)
+
+    def remove(self, job_id):
+        """Take a job out of the queue; returns it, or None if it isn't queued"""
+        with self.lock:
+            entry = self.entries.pop(job_id, None)
+            if entry is None:
+                return None
+            job = entry[-1]
+            entry[-1] = None
+            self.snapshot = None
+            return job
+
+    def pop(self):
+        """The next job to encode, or None if the queue is empty"""
+        with self.lock:
+            while self.heap:
+                entry = heapq.heappop(self.heap)
+                job = entry[-1]
+                if job is not None:
+                    del self.entries[job.id]
+                    self.snapshot = None
+                    return job
+            return None
+
+    def clear(self):
+        """Empty the queue; returns the jobs that were in it"""
+        with self.lock:
+            jobs = self.ordered()
+            self.heap = []
+            self.entries = {}
+            self.snapshot = None
+            return jobs
+
+    def ordered(self):
+        """Queued jobs in the order they will be encoded"""
+        with self.lock:
+            if self.snapshot is None:
+                self.snapshot = [entry[-1] for entry in sorted(self.entries.values())]
+                self.index = {job.id: i for i, job in enumerate(self.snapshot)}
+            return self.snapshot
+
+    def move_to_top(self, job_id):
+        """Put a job ahead of everything else in its class"""
+        with self.lock:
+            job = self.get(job_id)
+            if job is None:
+                return []
+            self.push(job, self.low_water[PRIORITY_CLASSES[job.priority]] - 1)
+            return [job]
+
+    def move_to_bottom(self, job_id):
+        """Put a job behind everything else in its class"""
+        with self.lock:
+            job = self.get(job_id)
+            if job is None:
+                return []
+            self.push(job, self.high_water[PRIORITY_CLASSES[job.priority]] + 1)
+            return [job]
+
+    def move_one(self, job_id, step):
+        """Move a job one place up (step -1) or down (step 1) in the queue order
+        by trading sort keys with the neighbour it passes. Passing the edge of
+        its class, the job joins the neighbour's class and both go to that
+        edge. Returns the jobs whose class or position changed."""
+        with self.lock:
+            order = self.ordered()
+            index = self.index.get(job_id)
+            if index is None or not 0 <= index + step < len(order):
+                return []
+            job, other = order[index], order[index + step]
+
+            if job.priority == other.priority:
+                # The whole (position, seq) key, so ties with other jobs keep their order
+                job_key, other_key = self.entries[other.id][1:3], self.entries[job.id][1:3]
+                self.place(job, *job_key)
+                self.place(other, *other_key)
+            else:
+                rank = PRIORITY_CLASSES[other.priority]
+                job.priority = other.priority
+                if step < 0:
+                    self.place(job, self.high_water[rank] + 1)
+                    self.place(other, self.high_water[rank] + 1)
+                else:
+                    self.place(job, self.low_water[rank] - 1)
+                    self.place(other, self.low_water[rank] - 1)
+
+            # Same order with the two swapped; a new list, since readers may
+            # still be iterating the old one
+            order = list(order)
+            order[index], order[index + step] = other, job
+            self.snapshot = order
+            self.index[job.id], self.index[other.id] = index + step, index
+            return [job, other]
+
+    def move_to(self, job_id, index):
+        """Put a job at an index of the queue order. Landing between jobs of
+        another priority class moves it into the nearest class that keeps the
+        order. Returns the jobs whose class or position changed."""
+        with self.lock:
+            job = self.get(job_id)
+            if job is None:
+                return []
+            others = [other for other in self.ordered() if other is not job]
+            index = max(0, min(index, len(others)))
+            before = others[index - 1] if index > 0 else None
+            after = others[index] if index < len(others) else None
+
+            rank = PRIORITY_CLASSES[job.priority]
+            if before is not None:
+                rank = max(rank, PRIORITY_CLASSES[before.priority])
+            if after is not None:
+                rank = min(rank, PRIORITY_CLASSES[after.priority])
+            job.priority = next(name for name, value in PRIORITY_CLASSES.items() if value == rank)
+            if before is not None and before.priority != job.priority:
+                before = None
+            if after is not None and after.priority != job.priority:
+                after = None
+
+            if before is None and after is None:
+                # Alone in its class at that spot
+                position = job.queue_position
+            elif after is None:
+                position = before.queue_position + 1
+            elif before is None:
+                position = after.queue_position - 1
+            else:
+                position = (before.queue_position + after.queue_position) / 2
+                if not before.queue_position < position < after.queue_position:
+                    # Out of float precision between the two: renumber the class
+                    return self.renumber(job, index, others)
+            self.push(job, position)
+            return [job]
+
+    def renumber(self, job, index, others):
+        """Give a job's whole class fresh, evenly spaced positions with the job at index"""
+        order = others[:index] + [job] + others[index:]
+        changed = [other for other in order if other.priority == job.priority]
+        for position, other in enumerate(changed):
+            self.push(other, float(position))
+        return changed
@@ -0,0 +1,172 @@
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    position REAL NOT NULL,
+    priority TEXT NOT NULL DEFAULT 'normal',
+    filename TEXT NOT NULL,
+    file_path TEXT,
+    preset TEXT NOT NULL,
+    output_format TEXT NOT NULL,
+    status TEXT NOT NULL,
+    input_size REAL NOT NULL DEFAULT 0,
+    start_time TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER,
+    filename TEXT NOT NULL,
+    preset TEXT,
+    format TEXT,
+    input_size REAL,
+    output_size REAL,
+    average_fps REAL,
+    start_time TEXT,
+    end_time TEXT,
+    duration TEXT,
+    reduction TEXT,
+    width INTEGER,
+    height INTEGER,
+    frame_count INTEGER,
+    source_duration REAL
+);
+"""
+
+HISTORY_COLUMNS = ('filename', 'preset', 'format', 'input_size', 'output_size', 'average_fps',
+                   'start_time', 'end_time', 'duration', 'reduction',
+                   'width', 'height', 'frame_count', 'source_duration')
+
+# Columns added since the first schema, created on open in older stores
+MIGRATIONS = {
+    'jobs': {'priority': "TEXT NOT NULL DEFAULT 'normal'"},
+    'history': {'width': "INTEGER", 'height': "INTEGER", 'frame_count': "INTEGER", 'source_duration': "REAL"}
+}
+
+class JobStore:
+    """SQLite (WAL mode) record of queued/active jobs and encode history
+
+    Every queue change is one short transaction, so after a crash the queue
+    can be rebuilt exactly as it was. Write failures are logged and the app
+    keeps running from memory. Nothing touches the database until open();
+    reading or writing before that raises RuntimeError.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def open(self):
+        """Connect, creating or migrating the schema"""
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: committed transactions survive a process crash
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        for table, added in MIGRATIONS.items():
+            columns = {row['name'] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            for column, declaration in added.items():
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def connection(self):
+        """The open connection (caller holds the lock)"""
+        if self.conn is None:
+            raise RuntimeError("Job store is not open: the encoding engine has not been started")
+        return self.conn
+
+    def write(self, operation, *args):
+        """Run one write transaction; errors are logged so encoding carries on"""
+        with self.lock:
+            self.connection()
+            try:
+                with self.conn:
+                    return operation(*args)
+            except sqlite3.Error as e:
+                print(f"Job store error: {e}")
+                return None
+
+    def read(self, sql, params=()):
+        with self.lock:
+            try:
+                return [dict(row) for row in self.connection().execute(sql, params)]
+            except sqlite3.Error as e:
+                print(f"Job store error: {e}")
+                return []
+
+    def add_job(self, job):
+        """Store a newly queued job with its queue position and priority class"""
+        self.add_jobs([job])
+
+    def add_jobs(self, jobs):
+        """Store newly queued jobs in one transaction"""
+        now = time.time()
+        self.write(lambda: self.conn.executemany(
+            "INSERT OR REPLACE INTO jobs (id, position, priority, filename, file_path, preset, output_format,"
+            " status, input_size, start_time, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(job.id, job.queue_position, job.priority, job.filename, job.file_path, job.preset,
+              job.output_format, job.status, job.input_size, job.start_time, now) for job in jobs]
+        ))
+
+    def update_job(self, job):
+        """Record a job's status change"""
+        self.write(lambda: self.conn.execute(
+            "UPDATE jobs SET status = ?, input_size = ?, start_time = ?, updated_at = ? WHERE id = ?",
+            (job.status, job.input_size, job.start_time, time.time(), job.id)
+        ))
+
+    def save_positions(self, jobs):
+        """Store the queue position and priority class of jobs that moved"""
+        self.write(lambda: self.conn.executemany(
+            "UPDATE jobs SET position = ?, priority = ? WHERE id = ?",
+            [(job.queue_position, job.priority, job.id) for job in jobs]
+        ))
+
+    def delete_jobs(self, job_ids):
+        self.write(lambda: self.conn.executemany(
+            "DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids]
+        ))
+
+    def finish_job(self, job_id, history_entry=None):
+        """Drop a finished job and add its history row in one transaction;
+        returns the history id"""
+        def finish():
+            self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            if history_entry is None:
+                return None
+            cursor = self.conn.execute(
+                f"INSERT INTO history (job_id, {', '.join(HISTORY_COLUMNS)})"
+                f" VALUES (?{', ?' * len(HISTORY_COLUMNS)})",
+                (job_id,) + tuple(history_entry.get(column) for column in HISTORY_COLUMNS)
+            )
+            return cursor.lastrowid
+        return self.write(finish)
+
+    def load_jobs(self):
+        """Stored jobs, interrupted (non-queued) ones first, then in queue order"""
+        return self.read("SELECT * FROM jobs ORDER BY status = 'queued', position, id")
+
+    def max_job_id(self):
+        """Highest job id used by a stored job or history row (0 if none)"""
+        rows = self.read("SELECT MAX(id) AS id FROM jobs UNION ALL SELECT MAX(job_id) FROM history")
+        return max((row['id'] or 0 for row in rows), default=0)
+
+    def recent_history(self, limit):
+        """The newest history rows, oldest first"""
+        rows = self.read("SELECT * FROM history ORDER BY id DESC LIMIT ?", (limit,))
+        rows.reverse()
+        return rows
+
+    def history_page(self, limit, before=None):
+        """(rows newest first with id < before, total row count), using the primary key index"""
+        if before is None:
+            rows = self.read("SELECT * FROM history ORDER BY id DESC LIMIT ?", (limit,))
+        else:
+            rows = self.read("SELECT * FROM history WHERE id < ? ORDER BY id DESC LIMIT ?", (before, limit))
+        total = self.read("SELECT COUNT(*) AS total FROM history")
+        return rows, total[0]['total'] if total else 0
@@ -0,0 +1,111 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+class LogBuffer:
+    """Fixed-capacity, thread-safe ring of log lines numbered 1, 2, 3, ...
+
+    Old lines fall off the front as new ones arrive, so readers ask for the
+    lines after the last sequence number they saw. Every line is also handed
+    to the spooler, if there is one, to be kept in full on disk.
+    """
+    def __init__(self, capacity, spooler=None, spool_path=None):
+        self.lock = threading.Lock()
+        self.lines = deque(maxlen=capacity)
+        self.last_seq = 0
+        self.spooler = spooler
+        self.spool_path = spool_path
+
+    def append(self, message, log_type='info'):
+        entry = {
+            'seq': 0,
+            'timestamp': datetime.now().isoformat(),
+            'message': message,
+            'type': log_type
+        }
+        with self.lock:
+            self.last_seq += 1
+            entry['seq'] = self.last_seq
+            self.lines.append(entry)
+            # Under the lock so the file gets lines in sequence order
+            if self.spooler and self.spool_path:
+                self.spooler.write(self.spool_path, entry)
+        return entry['seq']
+
+    def first_seq(self):
+        """Sequence number of the oldest line still held (last_seq + 1 when empty)"""
+        with self.lock:
+            return self.last_seq - len(self.lines) + 1
+
+    def after(self, seq, limit=None):
+        """Lines numbered above seq, oldest first, at most limit of them"""
+        with self.lock:
+            # Sequence numbers are contiguous, so the start is an offset, not a search
+            start = max(0, len(self.lines) - (self.last_seq - seq))
+            stop = len(self.lines) if limit is None else min(len(self.lines), start + limit)
+            return list(itertools.islice(self.lines, start, stop))
+
+    def tail(self, count):
+        """The newest count lines, oldest first"""
+        return self.after(self.last_seq - count)
+
+class LogSpooler:
+    """Background thread appending log lines to per-job files, so encode
+    threads never wait on disk"""
+    def __init__(self, directory):
+        self.directory = directory
+        self.pending = queue.Queue()
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+    def path_for(self, job_id):
+        return os.path.join(self.directory, f"job_{job_id}.log")
+
+    def write(self, path, entry):
+        self.ensure_running()
+        self.pending.put((path, entry))
+
+    def ensure_running(self):
+        with self.start_lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            # Write whatever has piled up in one open() per file
+            batch = [self.pending.get()]
+            while True:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            by_path = {}
+            for path, entry in batch:
+                by_path.setdefault(path, []).append(
+                    f"{entry['timestamp']} [{entry['type']}] {entry['message']}\n")
+            for path, lines in by_path.items():
+                try:
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.writelines(lines)
+                except OSError as e:
+                    print(f"Error writing log file {path}: {e}")
+
+    def prune(self, max_age_days):
+        """Delete job logs older than max_age_days (0 keeps them forever)"""
+        if max_age_days <= 0 or not os.path.isdir(self.directory):
+            return
+        cutoff = time.time() - max_age_days * 86400
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.startswith("job_") and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError as e:
+                print(f"Error removing old log file {entry.name}: {e}")
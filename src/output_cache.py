@@ -0,0 +1,166 @@
+import functools
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks, plain copies only
+    fcntl = None
+
+# Input fingerprint: file size plus this many evenly spaced blocks
+SAMPLE_BLOCKS = 16
+SAMPLE_BLOCK_SIZE = 64 * 1024
+
+# Linux ioctl that makes a copy-on-write clone (btrfs, XFS)
+FICLONE = 0x40049409
+
+@functools.lru_cache(maxsize=1024)
+def sample_hash(path, size, mtime_ns):
+    """Hash of a file's size and sampled blocks; size and mtime key the memo so
+    an unchanged file is never read twice"""
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        if size <= SAMPLE_BLOCKS * SAMPLE_BLOCK_SIZE:
+            digest.update(f.read())
+        else:
+            step = (size - SAMPLE_BLOCK_SIZE) // (SAMPLE_BLOCKS - 1)
+            for i in range(SAMPLE_BLOCKS):
+                f.seek(i * step)
+                digest.update(f.read(SAMPLE_BLOCK_SIZE))
+    return digest.hexdigest()
+
+def clone_file(source, destination):
+    """Place a copy of source at destination: a reflink, else a plain copy. The
+    destination is written under a temporary name and renamed into place."""
+    # Already the same file; copying it onto itself would truncate it
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        return
+    temp_path = destination + ".cache-tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        if fcntl is None:
+            raise OSError("reflink not supported")
+        with open(source, "rb") as src, open(temp_path, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, destination)
+
+class OutputCache:
+    """Finished encodes keyed by input content, preset contents and output format
+
+    A re-queued source with an unchanged preset is completed by placing the
+    cached result in the output directory instead of encoding it again.
+    Entries are evicted least recently used first once the cache grows past
+    max_bytes; a file's access time records its last use, so the order
+    survives a restart. A max_bytes of 0 disables the cache.
+
+    Entries are reflinked or copied both in and out, never hardlinked, so an
+    output and its cache entry never share an inode.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # file name -> size, least recently used first
+        self.total_bytes = 0
+
+    def load(self):
+        """Index the cache directory, dropping unfinished copies and entries
+        past the budget"""
+        if self.max_bytes <= 0:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".cache-tmp"):
+                    os.remove(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_atime, entry.name, stat.st_size))
+        except OSError as e:
+            print(f"Error loading output cache: {e}")
+            return
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+        self.evict()
+
+    def key_for(self, input_path, preset_path, output_format):
+        """Cache key for an encode, or None if the cache is off or a file can't be read"""
+        if self.max_bytes <= 0:
+            return None
+        try:
+            stat = os.stat(input_path)
+            input_hash = sample_hash(os.path.abspath(input_path), stat.st_size, stat.st_mtime_ns)
+            with open(preset_path, "rb") as f:
+                preset_hash = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+        except OSError:
+            return None
+        return hashlib.blake2b(f"{input_hash}:{preset_hash}:{output_format}".encode(),
+                               digest_size=20).hexdigest()
+
+    def entry_name(self, key, output_path):
+        return key + os.path.splitext(output_path)[1]
+
+    def fetch(self, key, output_path):
+        """Place a cached result at output_path; returns False on a miss"""
+        name = self.entry_name(key, output_path)
+        with self.lock:
+            if name not in self.entries:
+                return False
+            self.entries.move_to_end(name)
+        path = os.path.join(self.directory, name)
+        try:
+            # Only the access time: it orders eviction, the mtime stays the encode's
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+            clone_file(path, output_path)
+        except OSError as e:
+            print(f"Error reading output cache: {e}")
+            with self.lock:
+                self.forget(name)
+            return False
+        return True
+
+    def store(self, key, output_path):
+        """Keep a finished encode for later identical jobs"""
+        try:
+            size = os.path.getsize(output_path)
+        except OSError:
+            return
+        if size > self.max_bytes:
+            return
+        name = self.entry_name(key, output_path)
+        try:
+            clone_file(output_path, os.path.join(self.directory, name))
+        except OSError as e:
+            print(f"Error writing output cache: {e}")
+            return
+        with self.lock:
+            self.forget(name)
+            self.entries[name] = size
+            self.total_bytes += size
+        self.evict()
+
+    def forget(self, name):
+        """Drop an entry from the index (caller holds the lock)"""
+        size = self.entries.pop(name, None)
+        if size is not None:
+            self.total_bytes -= size
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits its budget"""
+        with self.lock:
+            while self.total_bytes > self.max_bytes and self.entries:
+                name = next(iter(self.entries))
+                self.forget(name)
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError as e:
+                    print(f"Error evicting cached output {name}: {e}")
@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+
+# HandBrake video encoders that run on a GPU or media engine; they need a core
+# or two for decoding and filters rather than a full share of the CPU
+HARDWARE_ENCODER_PREFIXES = ('nvenc_', 'qsv_', 'vce_', 'vt_', 'mf_')
+
+# VideoQualityType values in HandBrake presets
+QUALITY_TYPES = {1: 'bitrate', 2: 'constant'}
+
+def parse_preset(content):
+    """The settings the app uses from a HandBrake preset export; ValueError if
+    it is not one HandBrakeCLI could import"""
+    try:
+        data = json.loads(content)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"not valid JSON: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    presets = data.get('PresetList', [data])
+    if not isinstance(presets, list) or not presets or not isinstance(presets[0], dict):
+        raise ValueError("PresetList is empty")
+    preset = presets[0]
+    # Presets exported inside a folder are nested one level down
+    while preset.get('Folder'):
+        children = preset.get('ChildrenArray')
+        if not isinstance(children, list) or not children or not isinstance(children[0], dict):
+            raise ValueError("preset folder is empty")
+        preset = children[0]
+
+    encoder = preset.get('VideoEncoder')
+    if not isinstance(encoder, str) or not encoder:
+        raise ValueError("no VideoEncoder")
+    for field in ('PictureWidth', 'PictureHeight', 'VideoAvgBitrate'):
+        value = preset.get(field)
+        if value is not None and (not isinstance(value, (int, float)) or value < 0):
+            raise ValueError(f"{field} must be a non-negative number")
+    quality = preset.get('VideoQualitySlider')
+    if quality is not None and not isinstance(quality, (int, float)):
+        raise ValueError("VideoQualitySlider must be a number")
+    extra = preset.get('VideoOptionExtra') or ''
+    if not isinstance(extra, str):
+        raise ValueError("VideoOptionExtra must be a string")
+
+    quality_type = QUALITY_TYPES.get(preset.get('VideoQualityType'), 'constant')
+    return {
+        'name': preset.get('PresetName') or '',
+        'encoder': encoder,
+        'width': preset.get('PictureWidth') or None,
+        'height': preset.get('PictureHeight') or None,
+        'quality_type': quality_type,
+        'quality': preset.get('VideoAvgBitrate') if quality_type == 'bitrate' else quality,
+        'format': (preset.get('FileFormat') or '').replace('av_', '') or None,
+        'extra_options': extra
+    }
+
+class Preset:
+    """One preset file: its parsed settings, or why it can't be used"""
+    __slots__ = ('file', 'stamp', 'error', 'name', 'encoder', 'width', 'height',
+                 'quality_type', 'quality', 'format', 'extra_options')
+
+    def __init__(self, file, stamp, settings=None, error=None):
+        self.file = file
+        self.stamp = stamp  # (mtime_ns, size) the settings were read at
+        self.error = error
+        settings = settings or {}
+        self.name = settings.get('name') or os.path.splitext(file)[0]
+        self.encoder = settings.get('encoder', '')
+        self.width = settings.get('width')
+        self.height = settings.get('height')
+        self.quality_type = settings.get('quality_type')
+        self.quality = settings.get('quality')
+        self.format = settings.get('format')
+        self.extra_options = settings.get('extra_options', '')
+
+    @property
+    def hardware(self):
+        return self.encoder.startswith(HARDWARE_ENCODER_PREFIXES)
+
+    def to_dict(self):
+        return {
+            'file': self.file,
+            'name': self.name,
+            'encoder': self.encoder,
+            'hardware': self.hardware,
+            'width': self.width,
+            'height': self.height,
+            'quality_type': self.quality_type,
+            'quality': self.quality,
+            'format': self.format,
+            'error': self.error
+        }
+
+class PresetRegistry:
+    """Preset files in a directory, each parsed and validated once per change
+
+    Listing stats only the directory, whose mtime moves when a preset is
+    added, removed or replaced. Looking up one preset stats its file, so an
+    edit in place is picked up before a job starts with it.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.presets = {}  # file name -> Preset
+        self.directory_mtime = None
+
+    def load(self, file, stat):
+        """The cached Preset for a file, re-read if it changed since"""
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            preset = self.presets.get(file)
+        if preset is not None and preset.stamp == stamp:
+            return preset
+        try:
+            with open(os.path.join(self.directory, file), "rb") as f:
+                preset = Preset(file, stamp, parse_preset(f.read()))
+        except ValueError as e:
+            preset = Preset(file, stamp, error=str(e))
+        except OSError as e:
+            preset = Preset(file, stamp, error=f"could not read: {e}")
+        with self.lock:
+            self.presets[file] = preset
+        return preset
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            with self.lock:
+                self.presets.clear()
+                self.directory_mtime = None
+            return
+        if mtime == self.directory_mtime:
+            return
+
+        files = set()
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".json") and entry.is_file():
+                    files.add(entry.name)
+                    self.load(entry.name, entry.stat())
+        except OSError as e:
+            print(f"Error listing presets: {e}")
+            return
+        with self.lock:
+            for file in list(self.presets):
+                if file not in files:
+                    del self.presets[file]
+            self.directory_mtime = mtime
+
+    def all(self):
+        """Every preset file, valid or not, by file name"""
+        self.refresh()
+        with self.lock:
+            return [self.presets[file] for file in sorted(self.presets)]
+
+    def get(self, file):
+        """The Preset for a file name, or None if there is no such preset"""
+        if not file or file != os.path.basename(file) or not file.endswith(".json"):
+            return None
+        try:
+            stat = os.stat(os.path.join(self.directory, file))
+        except OSError:
+            with self.lock:
+                self.presets.pop(file, None)
+            return None
+        return self.load(file, stat)
+
+    def save(self, file, content):
+        """Validate and store an uploaded preset; ValueError if it is invalid"""
+        parse_preset(content)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, file)
+        with open(path + ".tmp", "wb") as f:
+            f.write(content)
+        os.replace(path + ".tmp", path)
+        return self.get(file)
@@ -0,0 +1,53 @@
+import functools
+import os
+import subprocess
+import psutil
+
+@functools.lru_cache(maxsize=1)
+def handbrake_supports_json():
+    """Whether the installed HandBrakeCLI understands --json (checked once)"""
+    try:
+        result = subprocess.run(
+            ["HandBrakeCLI", "--help"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            timeout=10
+        )
+        return "--json" in result.stdout
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+def pin_process_tree(pid, cpus):
+    """Pin a process, its threads and its children to a CPU set"""
+    try:
+        root = psutil.Process(pid)
+        for proc in [root] + root.children(recursive=True):
+            proc.cpu_affinity(cpus)
+            # psutil only pins the main thread; pin encoder threads as well
+            if hasattr(os, 'sched_setaffinity'):
+                for thread in proc.threads():
+                    try:
+                        os.sched_setaffinity(thread.id, cpus)
+                    except OSError:
+                        pass
+    except (AttributeError, psutil.Error, OSError):
+        pass
+
+def signal_process_tree(pid, suspend):
+    """Suspend (SIGSTOP) or resume (SIGCONT) a process and all of its children"""
+    try:
+        root = psutil.Process(pid)
+        procs = [root] + root.children(recursive=True)
+    except psutil.Error:
+        return False
+
+    for proc in procs:
+        try:
+            if suspend:
+                proc.suspend()
+            else:
+                proc.resume()
+        except psutil.Error:
+            pass
+    return True
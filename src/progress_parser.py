@@ -0,0 +1,219 @@
+import json
+import re
+
+# HandBrakeCLI progress line, e.g.
+# "Encoding: task 1 of 1, 12.34 % (45.67 fps, avg 50.12 fps, ETA 00h12m34s)"
+PROGRESS_LINE = re.compile(
+    r'Encoding: task (\d+) of (\d+), (\d+(?:\.\d+)?) %'
+    r'(?: \((\d+(?:\.\d+)?) fps, avg (\d+(?:\.\d+)?) fps, ETA (\d+)h(\d+)m(\d+)s\))?'
+)
+
+# Fallback for other builds: every field in one alternation, scanned once per line
+GENERIC_FIELDS = re.compile(
+    r'eta\s+(?:(\d{1,2})h(\d{1,2})m(\d{1,2})s|(\d{1,2}):(\d{1,2})(?::(\d{1,2}))?)'
+    r'|(\d+(?:\.\d+)?)\s*fps'
+    r'|frame\s+(\d+)\s+of\s+(\d+)'
+    r'|(\d+(?:\.\d+)?)\s*%',
+    re.IGNORECASE
+)
+
+FRAME_FIELDS = re.compile(r'frame\s+(\d+)\s+of\s+(\d+)', re.IGNORECASE)
+
+class ProgressParser:
+    """Single-pass parser for HandBrakeCLI progress output"""
+    def parse(self, line):
+        """Return a dict with any of eta_seconds, fps, avg_fps, frame, total_frames,
+        percent, task and task_count found in the line, or None"""
+        # Progress lines: one anchored match gives every field
+        if line.startswith('Encoding'):
+            match = PROGRESS_LINE.match(line)
+            if match:
+                task, task_count, percent, fps, avg_fps, hours, minutes, seconds = match.groups()
+                update = {
+                    'task': int(task),
+                    'task_count': int(task_count),
+                    'percent': float(percent)
+                }
+                if fps is not None:
+                    update['fps'] = float(fps)
+                    update['avg_fps'] = float(avg_fps)
+                    update['eta_seconds'] = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+                return update
+
+        # Timestamped verbose log lines only ever carry frame counts
+        elif line.startswith('['):
+            if 'frame' not in line:
+                return None
+            match = FRAME_FIELDS.search(line)
+            if not match:
+                return None
+            return {'frame': int(match.group(1)), 'total_frames': int(match.group(2))}
+
+        return self.parse_generic(line)
+
+    def parse_generic(self, line):
+        """Scan a non-standard line for ETA, FPS, frame and percent fields"""
+        line_lower = line.lower()
+        if ('fps' not in line_lower and '%' not in line
+                and 'eta' not in line_lower and 'frame' not in line_lower):
+            return None
+
+        update = {}
+        for match in GENERIC_FIELDS.finditer(line):
+            (eta_h, eta_m, eta_s, clock_a, clock_b, clock_c,
+             fps, frame, total_frames, percent) = match.groups()
+            if eta_h is not None:
+                update.setdefault('eta_seconds', int(eta_h) * 3600 + int(eta_m) * 60 + int(eta_s))
+            elif clock_a is not None:
+                if clock_c is not None:
+                    # hh:mm:ss
+                    eta = int(clock_a) * 3600 + int(clock_b) * 60 + int(clock_c)
+                else:
+                    # mm:ss
+                    eta = int(clock_a) * 60 + int(clock_b)
+                update.setdefault('eta_seconds', eta)
+            elif fps is not None:
+                update.setdefault('fps', float(fps))
+            elif frame is not None:
+                if 'frame' not in update:
+                    update['frame'] = int(frame)
+                    update['total_frames'] = int(total_frames)
+            elif percent is not None:
+                update.setdefault('percent', float(percent))
+
+        # A bare percentage only counts as progress on encoding lines
+        if 'percent' in update and 'encoding' not in line_lower:
+            del update['percent']
+
+        return update or None
+
+    def feed(self, line):
+        """Return (update or None, message to log) for one line of output"""
+        return self.parse(line), line.strip()
+
+# Start of a "--json" block, e.g. 'Progress: {'
+JSON_BLOCK_START = re.compile(r'^([A-Za-z][A-Za-z ]*):\s*\{')
+
+# A block that grows past this without closing is dropped (HandBrake's are a few KB)
+MAX_JSON_BLOCK_BYTES = 1024 * 1024
+
+class JsonProgressParser:
+    """Incremental reader for HandBrakeCLI --json output
+
+    Collects 'Progress: {...}' blocks line by line and turns WORKING states
+    into progress updates. Lines outside JSON blocks (the verbose log) go
+    through a ProgressParser, so older builds without --json still work.
+    """
+    def __init__(self):
+        self.text_parser = ProgressParser()
+        self.block_name = None
+        self.block_lines = []
+        self.block_size = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, line):
+        """Return (update or None, message to log or None) for one line of output"""
+        # Block contents are indented, so a header inside a block means the
+        # previous one was cut short: drop it and start over
+        match = JSON_BLOCK_START.match(line)
+        if self.block_name is None and not match:
+            return self.text_parser.feed(line)
+        if match:
+            self.block_name = match.group(1)
+            self.block_lines = []
+            self.block_size = 0
+            self.depth = 0
+            self.in_string = False
+            self.escaped = False
+            line = line[match.end() - 1:]
+
+        self.block_lines.append(line)
+        self.block_size += len(line)
+        if not self.track_depth(line):
+            if self.block_size > MAX_JSON_BLOCK_BYTES:
+                self.block_name = None
+                self.block_lines = []
+            return None, None
+
+        name, text = self.block_name, ''.join(self.block_lines)
+        self.block_name = None
+        self.block_lines = []
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None, None
+
+        if name == 'Progress':
+            return self.parse_progress(data)
+        return None, None
+
+    def track_depth(self, line):
+        """Track brace depth outside JSON strings; True once the block is closed"""
+        for char in line:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+    def parse_progress(self, data):
+        """Turn one Progress block into (update, log message)"""
+        state = data.get('State')
+        if state == 'WORKING':
+            working = data.get('Working', {})
+            progress = float(working.get('Progress', 0.0))
+            pass_number = int(working.get('Pass', 1)) or 1
+            pass_count = int(working.get('PassCount', 1)) or 1
+            fps = float(working.get('Rate', 0.0))
+            avg_fps = float(working.get('RateAvg', 0.0))
+            pass_eta = int(working.get('ETASeconds', 0))
+
+            # Remaining passes are assumed to take as long as this one
+            eta = pass_eta
+            if 0 < progress < 1 and pass_number < pass_count:
+                eta += int(pass_eta / (1 - progress)) * (pass_count - pass_number)
+
+            update = {
+                'percent': ((pass_number - 1) + progress) / pass_count * 100,
+                'pass': pass_number,
+                'pass_count': pass_count,
+                'pass_percent': progress * 100,
+                'pass_eta_seconds': pass_eta,
+                'eta_seconds': eta
+            }
+            if fps or avg_fps:
+                update['fps'] = fps
+                update['avg_fps'] = avg_fps
+            message = (f"Encoding: pass {pass_number} of {pass_count}, {progress * 100:.2f} % "
+                       f"({fps:.2f} fps, avg {avg_fps:.2f} fps, ETA {format_eta(pass_eta)})")
+            return update, message
+
+        if state == 'MUXING':
+            return {'percent': 100.0, 'eta_seconds': 0}, "Muxing: this may take awhile..."
+
+        if state == 'WORKDONE':
+            error = data.get('WorkDone', {}).get('Error', 0)
+            return None, f"Work done (error code {error})"
+
+        if state == 'SCANNING':
+            scanning = data.get('Scanning', {})
+            return None, f"Scanning title {scanning.get('Title', 1)}: {float(scanning.get('Progress', 0.0)) * 100:.0f} %"
+
+        return None, None
+
+def format_eta(seconds):
+    """Format seconds the way HandBrake prints an ETA, e.g. '00h12m34s'"""
+    return f"{seconds // 3600:02d}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s"
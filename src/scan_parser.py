@@ -0,0 +1,121 @@
+import json
+import re
+
+# "JSON Title Set: {...}" printed by HandBrakeCLI --scan --json
+JSON_TITLE_SET = re.compile(r'^JSON Title Set:\s*\{', re.MULTILINE)
+
+# Text scan output, e.g.
+# "  + duration: 01:23:45"
+# "  + size: 1920x1080, pixel aspect: 1/1, display aspect: 1.78, 23.976 fps"
+TITLE_LINE = re.compile(r'^\+ title (\d+):')
+DURATION_LINE = re.compile(r'^\+ duration: (\d+):(\d{2}):(\d{2})')
+SIZE_LINE = re.compile(r'^\+ size: (\d+)x(\d+).*?(\d+(?:\.\d+)?) fps')
+TRACK_LINE = re.compile(r'^\+ (\d+), (.*)$')
+LANGUAGE_CODE = re.compile(r'\(iso639-2: (\w+)\)')
+
+def parse_scan_output(output):
+    """Duration, geometry, frame rate, frame count and tracks of the first title
+    in HandBrakeCLI --scan output (JSON or text), or None if nothing was found"""
+    match = JSON_TITLE_SET.search(output)
+    if match:
+        try:
+            data, _ = json.JSONDecoder().raw_decode(output, match.end() - 1)
+            info = parse_json_title_set(data)
+            if info:
+                return info
+        except ValueError:
+            pass
+    return parse_text_scan(output)
+
+def parse_json_title_set(data):
+    titles = data.get('TitleList') or []
+    if not titles:
+        return None
+    title = titles[0]
+
+    duration = title.get('Duration', {})
+    if 'Ticks' in duration:
+        # 90 kHz clock
+        seconds = duration['Ticks'] / 90000
+    else:
+        seconds = duration.get('Hours', 0) * 3600 + duration.get('Minutes', 0) * 60 + duration.get('Seconds', 0)
+
+    frame_rate = title.get('FrameRate', {})
+    fps = frame_rate['Num'] / frame_rate['Den'] if frame_rate.get('Den') else 0.0
+    geometry = title.get('Geometry', {})
+
+    audio_tracks = [
+        {'description': track.get('Description', ''), 'language': track.get('LanguageCode')}
+        for track in title.get('AudioList', [])
+    ]
+    subtitle_tracks = [
+        {'description': track.get('Name') or track.get('Language', ''), 'language': track.get('LanguageCode')}
+        for track in title.get('SubtitleList', [])
+    ]
+    return build_info(seconds, geometry.get('Width', 0), geometry.get('Height', 0), fps,
+                      audio_tracks, subtitle_tracks)
+
+def parse_text_scan(output):
+    seconds = None
+    width = height = 0
+    fps = 0.0
+    tracks = {'audio': [], 'subtitle': []}
+    section = None
+    in_title = False
+
+    for raw_line in output.splitlines():
+        line = raw_line.strip()
+        if not line.startswith('+'):
+            continue
+
+        title = TITLE_LINE.match(line)
+        if title:
+            # Only the first title is encoded
+            if in_title:
+                break
+            in_title = True
+            continue
+        if not in_title:
+            continue
+
+        # Track lists are the only doubly-indented entries we read
+        indent = len(raw_line) - len(raw_line.lstrip())
+        if indent <= 2:
+            section = None
+            if line.startswith('+ audio tracks'):
+                section = 'audio'
+            elif line.startswith('+ subtitle tracks'):
+                section = 'subtitle'
+            else:
+                duration = DURATION_LINE.match(line)
+                if duration:
+                    hours, minutes, secs = (int(g) for g in duration.groups())
+                    seconds = hours * 3600 + minutes * 60 + secs
+                size = SIZE_LINE.match(line)
+                if size:
+                    width, height, fps = int(size.group(1)), int(size.group(2)), float(size.group(3))
+        elif section:
+            track = TRACK_LINE.match(line)
+            if track:
+                language = LANGUAGE_CODE.search(track.group(2))
+                tracks[section].append({
+                    'description': track.group(2),
+                    'language': language.group(1) if language else None
+                })
+
+    if seconds is None:
+        return None
+    return build_info(seconds, width, height, fps, tracks['audio'], tracks['subtitle'])
+
+def build_info(seconds, width, height, fps, audio_tracks, subtitle_tracks):
+    total = int(seconds)
+    return {
+        'duration': round(seconds, 3),
+        'duration_display': f"{total // 3600:02d}:{total % 3600 // 60:02d}:{total % 60:02d}",
+        'width': width,
+        'height': height,
+        'fps': round(fps, 3),
+        'frame_count': int(round(seconds * fps)),
+        'audio_tracks': audio_tracks,
+        'subtitle_tracks': subtitle_tracks
+    }
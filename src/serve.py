@@ -0,0 +1,66 @@
+"""Production server: the app on waitress, with the encoding engine in this process.
+
+    python serve.py
+
+Requests, including the long-lived /events streams, are served by a pool of
+SERVER_THREADS threads; encodes run on their own threads beside them. Other
+WSGI servers work too, as long as they run a single process (any number of
+threads), since the engine refuses to start twice:
+
+    gunicorn --workers 1 --threads 48 'serve:create_app()'
+
+SERVER_HOST, SERVER_PORT, SERVER_THREADS and SERVER_CONNECTION_LIMIT are read
+from config.env like the app's other settings. SIGTERM and Ctrl+C stop the
+running encoders and leave their jobs queued for the next start.
+
+Under another server the engine stops its encoders from an atexit handler,
+which runs when the worker process exits normally. gunicorn can end a worker
+without running atexit handlers (e.g. after a timeout), so add a worker_exit
+hook to its config file as well:
+
+    def worker_exit(server, worker):
+        import app
+        app.engine.shutdown()
+"""
+import os
+import signal
+import sys
+from waitress import serve
+import app as encoder
+
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "5000"))
+# Each open /events stream holds one thread; keep this above MAX_EVENT_STREAMS
+SERVER_THREADS = max(encoder.MAX_EVENT_STREAMS + 8, int(os.getenv("SERVER_THREADS", "48")))
+SERVER_CONNECTION_LIMIT = int(os.getenv("SERVER_CONNECTION_LIMIT", "200"))
+
+def create_app():
+    """The WSGI app with the encoding engine started; the engine shuts down
+    at process exit"""
+    encoder.engine.start()
+    return encoder.app
+
+def main():
+    try:
+        application = create_app()
+    except RuntimeError as e:
+        sys.exit(f"Error starting encoder: {e}")
+
+    def shutdown(signum, frame):
+        print("Shutting down: stopping encoders")
+        encoder.engine.shutdown()
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    serve(
+        application,
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        threads=SERVER_THREADS,
+        connection_limit=SERVER_CONNECTION_LIMIT,
+        ident="encoder"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,23 @@
 // Global variables
 let selectedFiles = new Set();
-let pollInterval = null;
-let systemStatsInterval = null;
-let encodingDetailsInterval = null;
-let historyInterval = null;
-let filesData = [];
+let eventSource = null;
+let liveState = { queue: null, details: { jobs: {} }, stats: null };
+let jobLogs = {};
+let folderListings = new Map(); // folder path ('' is the root) -> { items, total }
 let queueData = [];
 let historyData = [];
+let recentHistory = [];  // newest encodes, kept current by the event stream
+let olderHistory = [];   // pages fetched with "Load older encodes"
+let historyExhausted = false;
 let currentSort = { field: 'name-asc', direction: 'asc' };
 let queueSort = { field: 'filename', direction: 'asc' };
 let historySort = { field: 'date', direction: 'desc' };
 let expandedFolders = new Set();
+let detailsJobId = null;
+let logJobId = null;  // job whose log is on screen, possibly one that just finished
+
+const FILES_PAGE_SIZE = 200;
+const HISTORY_PAGE_SIZE = 20;
 
 // DOM Elements
 const filesList = document.getElementById('filesList');
@@ -22,10 +29,12 @@ const queueTableBody = document.getElementById('queueTableBody');
 const currentJobContent = document.getElementById('currentJobContent');
 const startBtn = document.getElementById('startBtn');
 const pauseBtn = document.getElementById('pauseBtn');
+const releaseBtn = document.getElementById('releaseBtn');
 const resumeBtn = document.getElementById('resumeBtn');
 const stopBtn = document.getElementById('stopBtn'); // NEW: Stop button
 const cancelBtn = document.getElementById('cancelBtn');
 const historyTableBody = document.getElementById('historyTableBody');
+const historyMoreBtn = document.getElementById('historyMoreBtn');
 const statusText = document.getElementById('statusText');
 const globalProgressFill = document.getElementById('globalProgressFill');
 const globalProgressText = document.getElementById('globalProgressText');
@@ -40,11 +49,7 @@ const mobileStatusPanel = document.getElementById('mobileStatusPanel');
 document.addEventListener('DOMContentLoaded', () => {
     loadFiles();
     loadPresets();
-    loadHistory();
-    startPolling();
-    startSystemStatsPolling();
-    startEncodingDetailsPolling();
-    startHistoryPolling();
+    startEventStream();
     
     // Handle preset upload
     presetUpload.addEventListener('change', handlePresetUpload);
@@ -61,18 +66,52 @@ document.addEventListener('DOMContentLoaded', () => {
 });
 
 // File handling functions
-async function loadFiles() {
+function filesUrl(path, offset = 0, rescan = false) {
+    const params = new URLSearchParams({
+        path,
+        depth: 1,
+        offset,
+        limit: FILES_PAGE_SIZE,
+        sort: currentSort.field
+    });
+    if (rescan) params.set('refresh', '1');
+    return `/files?${params}`;
+}
+
+async function fetchFolder(path, offset = 0, rescan = false) {
+    const response = await fetch(filesUrl(path, offset, rescan));
+    if (!response.ok) {
+        throw new Error(`Failed to list ${path || 'media folder'} (${response.status})`);
+    }
+    return response.json();
+}
+
+async function loadFiles(rescan = false) {
     try {
         const loadingMessage = document.getElementById('loadingMessage');
         if (loadingMessage) {
             loadingMessage.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Loading files...';
         }
         
-        const response = await fetch('/files');
-        filesData = await response.json();
+        // Only the root and folders the user has open are fetched, one level each
+        const paths = ['', ...expandedFolders];
+        const results = await Promise.allSettled(
+            paths.map((path, index) => fetchFolder(path, 0, rescan && index === 0))
+        );
+        if (results[0].status === 'rejected') {
+            throw results[0].reason;
+        }
         
-        // Sort files
-        sortFilesData();
+        const listings = new Map();
+        results.forEach((result, index) => {
+            if (result.status === 'fulfilled') {
+                listings.set(paths[index], { items: result.value.items, total: result.value.total });
+            } else {
+                // The folder is gone; forget that it was open
+                expandedFolders.delete(paths[index]);
+            }
+        });
+        folderListings = listings;
         
         updateFilesList();
         
@@ -89,8 +128,24 @@ async function loadFiles() {
     }
 }
 
+async function loadMoreFiles(path) {
+    const listing = folderListings.get(path);
+    if (!listing) return;
+    
+    try {
+        const page = await fetchFolder(path, listing.items.length);
+        listing.items.push(...page.items);
+        listing.total = page.total;
+        updateFilesList();
+    } catch (error) {
+        console.error('Error loading files:', error);
+        showNotification('Failed to load more files', 'error');
+    }
+}
+
 function updateFilesList() {
-    if (filesData.length === 0) {
+    const rootListing = folderListings.get('');
+    if (!rootListing || rootListing.total === 0) {
         filesList.innerHTML = `
             <div class="list-empty">
                 <i class="fas fa-folder-open"></i>
@@ -104,20 +159,24 @@ function updateFilesList() {
     
     filesList.innerHTML = '';
     
-    // Flatten the hierarchical data for display
-    const flattenedFiles = flattenFiles(filesData, true);
+    // Flatten the loaded folders for display
+    const flattenedFiles = flattenFiles();
     
     flattenedFiles.forEach(item => {
+        if (item.type === 'more') {
+            filesList.appendChild(createLoadMoreRow(item));
+            return;
+        }
+        
         const extension = item.type === 'directory' ? 'folder' : getFileExtension(item.name);
         const fileType = getFileType(extension);
         const typeClass = `file-type-${extension.toLowerCase()}`;
         const modifiedDate = item.modified ? formatDate(item.modified) : 'N/A';
         const indent = item.level * 20;
         const isExpanded = expandedFolders.has(item.path);
-        const isHidden = item.parentPath && !expandedFolders.has(item.parentPath);
         
         const fileRow = document.createElement('div');
-        fileRow.className = `file-row ${item.type === 'directory' ? 'directory' : ''} ${isHidden ? 'hidden' : ''}`;
+        fileRow.className = `file-row ${item.type === 'directory' ? 'directory' : ''}`;
         fileRow.dataset.filename = item.name;
         fileRow.dataset.path = item.path;
         fileRow.dataset.type = item.type;
@@ -132,7 +191,7 @@ function updateFilesList() {
             : '<div class="file-checkbox-placeholder"></div>';
         
         // Folder toggle button
-        const folderToggle = item.type === 'directory' 
+        const folderToggle = item.type === 'directory' && item.child_count > 0
             ? `<div class="folder-toggle ${isExpanded ? 'expanded' : ''}" onclick="toggleFolder('${item.path}', event)">
                    <i class="fas fa-chevron-right"></i>
                </div>`
@@ -197,33 +256,76 @@ function updateFilesList() {
     updateSortIndicators();
 }
 
+function createLoadMoreRow(item) {
+    const row = document.createElement('div');
+    row.className = 'file-row load-more-row';
+    row.innerHTML = `
+        <div class="file-checkbox-cell">
+            <div class="file-checkbox-placeholder"></div>
+        </div>
+        <div class="file-info-cell">
+            <div class="file-indent" style="margin-left: ${item.level * 20}px">
+                <div class="folder-toggle-placeholder"></div>
+                <button class="btn btn-secondary btn-sm" onclick="loadMoreFiles('${item.path}')">
+                    <i class="fas fa-ellipsis-h"></i> Load ${Math.min(item.remaining, FILES_PAGE_SIZE)} more of ${item.remaining}
+                </button>
+            </div>
+        </div>
+    `;
+    return row;
+}
+
 // Helper functions
-function flattenFiles(items, includeHidden = false, parentPath = '', result = []) {
-    items.forEach(item => {
-        const flattenedItem = {
-            ...item,
-            parentPath: parentPath
-        };
-        result.push(flattenedItem);
+function flattenFiles(parentPath = '', result = []) {
+    const listing = folderListings.get(parentPath);
+    if (!listing) return result;
+    
+    listing.items.forEach(item => {
+        result.push({ ...item, parentPath: parentPath });
         
-        if (item.children && item.children.length > 0) {
-            if (includeHidden || expandedFolders.has(item.path)) {
-                flattenFiles(item.children, includeHidden, item.path, result);
-            }
+        if (item.type === 'directory' && expandedFolders.has(item.path)) {
+            flattenFiles(item.path, result);
         }
     });
+    
+    // Placeholder row for the rest of a paginated folder
+    if (listing.items.length < listing.total) {
+        result.push({
+            type: 'more',
+            path: parentPath,
+            level: parentPath ? parentPath.split('/').length : 0,
+            remaining: listing.total - listing.items.length
+        });
+    }
     return result;
 }
 
-function toggleFolder(path, event) {
+function countLoadedFiles() {
+    return flattenFiles().filter(f => f.type === 'file').length;
+}
+
+async function toggleFolder(path, event) {
     event.stopPropagation();
     
     if (expandedFolders.has(path)) {
         expandedFolders.delete(path);
-    } else {
-        expandedFolders.add(path);
+        updateFilesList();
+        return;
     }
     
+    // Folder contents are fetched the first time it is opened
+    if (!folderListings.has(path)) {
+        try {
+            const listing = await fetchFolder(path);
+            folderListings.set(path, { items: listing.items, total: listing.total });
+        } catch (error) {
+            console.error('Error loading folder:', error);
+            showNotification('Failed to load folder', 'error');
+            return;
+        }
+    }
+    
+    expandedFolders.add(path);
     updateFilesList();
 }
 
@@ -251,6 +353,15 @@ function getFileIcon(extension) {
     return 'fa-file';
 }
 
+function escapeHtml(value) {
+    return String(value ?? '')
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
 function formatDate(timestamp) {
     try {
         const date = new Date(timestamp * 1000);
@@ -264,69 +375,7 @@ function formatDate(timestamp) {
     }
 }
 
-// Sorting functions
-function sortFilesData() {
-    // Flatten files for sorting
-    const flattened = flattenFiles(filesData, true);
-    const [field, direction] = currentSort.field.split('-');
-    const dir = direction === 'desc' ? -1 : 1;
-    
-    flattened.sort((a, b) => {
-        let valA, valB;
-        
-        switch(field) {
-            case 'name':
-                valA = a.name.toLowerCase();
-                valB = b.name.toLowerCase();
-                break;
-            case 'size':
-                valA = a.size;
-                valB = b.size;
-                break;
-            case 'date':
-                valA = a.modified;
-                valB = b.modified;
-                break;
-            case 'type':
-                valA = a.type;
-                valB = b.type;
-                break;
-            default:
-                return 0;
-        }
-        
-        if (valA < valB) return -1 * dir;
-        if (valA > valB) return 1 * dir;
-        return 0;
-    });
-    
-    // Rebuild hierarchical structure
-    const sortedStructure = rebuildHierarchy(flattened);
-    filesData = sortedStructure;
-}
-
-function rebuildHierarchy(sortedItems) {
-    const result = [];
-    const map = new Map();
-    
-    // Create a map of all items
-    sortedItems.forEach(item => {
-        map.set(item.path, { ...item, children: [] });
-    });
-    
-    // Build hierarchy
-    sortedItems.forEach(item => {
-        const parentPath = item.parentPath;
-        if (parentPath && map.has(parentPath)) {
-            map.get(parentPath).children.push(map.get(item.path));
-        } else {
-            result.push(map.get(item.path));
-        }
-    });
-    
-    return result;
-}
-
+// Sorting functions (the server sorts each folder listing)
 function toggleSort(field) {
     const select = document.getElementById('sortSelect');
     if (currentSort.field === `${field}-asc`) {
@@ -338,15 +387,13 @@ function toggleSort(field) {
     }
     
     select.value = currentSort.field;
-    sortFilesData();
-    updateFilesList();
+    loadFiles();
 }
 
 function sortFiles() {
     const select = document.getElementById('sortSelect');
     currentSort.field = select.value;
-    sortFilesData();
-    updateFilesList();
+    loadFiles();
 }
 
 function updateSortIndicators() {
@@ -505,8 +552,7 @@ function toggleFileSelection(filepath, isSelected, filename) {
     }
     
     updateSelectAllCheckbox();
-    const fileCount = flattenFiles(filesData, true).filter(f => f.type === 'file').length;
-    updateCounts(fileCount, selectedFiles.size);
+    updateCounts(countLoadedFiles(), selectedFiles.size);
 }
 
 function selectAllFiles() {
@@ -574,8 +620,13 @@ async function loadPresets() {
         presetSelect.innerHTML = '<option value="">Select a preset...</option>';
         presets.forEach(preset => {
             const option = document.createElement('option');
-            option.value = preset;
-            option.textContent = preset;
+            option.value = preset.file;
+            option.textContent = formatPresetOption(preset);
+            if (preset.error) {
+                // Listed so the broken file can be spotted, but not selectable
+                option.disabled = true;
+                option.title = preset.error;
+            }
             presetSelect.appendChild(option);
         });
     } catch (error) {
@@ -584,28 +635,46 @@ async function loadPresets() {
     }
 }
 
-// Load history
-async function loadHistory() {
+function formatPresetOption(preset) {
+    if (preset.error) {
+        return `${preset.file} (invalid: ${preset.error})`;
+    }
+    const details = [preset.encoder + (preset.hardware ? ' (HW)' : '')];
+    if (preset.width && preset.height) {
+        details.push(`${preset.width}x${preset.height}`);
+    }
+    if (preset.quality !== null) {
+        details.push(preset.quality_type === 'bitrate' ? `${preset.quality} kbps` : `RF ${preset.quality}`);
+    }
+    return `${preset.name} — ${details.join(', ')}`;
+}
+
+function combineHistory() {
+    const seen = new Set(recentHistory.map(job => job.id));
+    historyData = [...recentHistory, ...olderHistory.filter(job => !seen.has(job.id))];
+    sortHistoryData();
+    updateHistoryDisplay();
+}
+
+async function loadOlderHistory() {
+    const ids = historyData.map(job => job.id).filter(id => id != null);
+    if (ids.length === 0) return;
+    
     try {
-        const response = await fetch('/history');
-        historyData = await response.json();
-        
-        sortHistoryData();
-        updateHistoryDisplay();
-        
+        const response = await fetch(`/history?limit=${HISTORY_PAGE_SIZE}&before=${Math.min(...ids)}`);
+        const page = await response.json();
+        olderHistory.push(...page.items);
+        historyExhausted = page.next_before === null;
+        combineHistory();
     } catch (error) {
         console.error('Error loading history:', error);
+        showNotification('Failed to load older encodes', 'error');
     }
 }
 
-// Start history polling
-function startHistoryPolling() {
-    loadHistory();
-    historyInterval = setInterval(loadHistory, 3000);
-}
-
 function updateHistoryDisplay() {
     historyTableBody.innerHTML = '';
+    historyMoreBtn.style.display = !historyExhausted && historyData.length >= HISTORY_PAGE_SIZE ? '' : 'none';
     
     if (historyData.length === 0) {
         historyTableBody.innerHTML = `
@@ -626,8 +695,8 @@ function updateHistoryDisplay() {
         const reduction = job.reduction || '0%';
         
         row.innerHTML = `
-            <td>${job.filename}</td>
-            <td>${job.preset}</td>
+            <td>${escapeHtml(job.filename)}</td>
+            <td>${escapeHtml(job.preset)}</td>
             <td>${job.input_size} MB</td>
             <td>${job.output_size} MB</td>
             <td><span class="status-badge ${reduction.includes('-') ? 'status-error' : 'status-success'}">${reduction}</span></td>
@@ -655,37 +724,26 @@ async function addToQueue() {
     }
     
     try {
-        const files = Array.from(selectedFiles);
-        let successCount = 0;
-        let errorCount = 0;
+        // One request for the whole selection
+        const response = await fetch('/queue/add-batch', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({ 
+                files: Array.from(selectedFiles),
+                preset, 
+                format 
+            })
+        });
         
-        for (const filepath of files) {
-            try {
-                const response = await fetch('/queue/add', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({ 
-                        file: filepath.split('/').pop(), 
-                        path: filepath,
-                        preset, 
-                        format 
-                    })
-                });
-                
-                const data = await response.json();
-                
-                if (response.ok) {
-                    successCount++;
-                } else {
-                    errorCount++;
-                    console.error(`Failed to add ${filepath}:`, data.error);
-                }
-            } catch (error) {
-                errorCount++;
-                console.error(`Error adding ${filepath}:`, error);
-            }
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Failed to add files to queue');
         }
         
+        const successCount = data.added.length;
+        const errorCount = data.skipped.length;
+        data.skipped.forEach(item => console.error(`Failed to add ${item.path}:`, item.reason));
+        
         if (successCount > 0) {
             showNotification(`Added ${successCount} file${successCount !== 1 ? 's' : ''} to queue`, 'success');
         }
@@ -699,7 +757,7 @@ async function addToQueue() {
         
     } catch (error) {
         console.error('Error adding to queue:', error);
-        showNotification('Failed to add files to queue', 'error');
+        showNotification(error.message || 'Failed to add files to queue', 'error');
     }
 }
 
@@ -709,147 +767,225 @@ async function updateQueueDisplay() {
         const response = await fetch('/queue');
         const data = await response.json();
         
-        queueData = data.queue;
-        sortQueueData();
-        
-        // Update global status
-        statusText.textContent = data.status || 'Ready';
-        globalProgressFill.style.width = `${data.progress || 0}%`;
-        globalProgressText.textContent = `${Math.round(data.progress || 0)}%`;
-        
-        // Update status indicator
-        if (data.current) {
-            if (data.paused) {
-                updateStatusIndicator('paused');
-            } else if (data.stopped) {
-                updateStatusIndicator('stopped');
-            } else {
-                updateStatusIndicator('encoding');
-            }
-        } else if (data.queue.length > 0) {
-            updateStatusIndicator('queued');
+        renderQueue(data);
+    } catch (error) {
+        console.error('Error updating queue:', error);
+    }
+}
+
+function renderQueue(data) {
+    queueData = data.queue;
+    sortQueueData();
+    renderQueueEstimate(data.queue_estimate);
+    
+    // Update global status
+    statusText.textContent = data.status || 'Ready';
+    globalProgressFill.style.width = `${data.progress || 0}%`;
+    globalProgressText.textContent = `${Math.round(data.progress || 0)}%`;
+    
+    // Update status indicator
+    if (data.current) {
+        if (data.paused) {
+            updateStatusIndicator('paused');
+        } else if (data.stopped) {
+            updateStatusIndicator('stopped');
         } else {
-            updateStatusIndicator('idle');
+            updateStatusIndicator('encoding');
         }
+    } else if (data.queue.length > 0) {
+        updateStatusIndicator('queued');
+    } else {
+        updateStatusIndicator('idle');
+    }
+    
+    // Update current jobs (one per active worker slot)
+    const activeJobs = data.active || (data.current ? [data.current] : []);
+    if (activeJobs.length > 0) {
+        document.getElementById('currentJobProgress').style.width = `${data.progress}%`;
+        document.getElementById('currentJobPercent').textContent = `${Math.round(data.progress)}%`;
         
-        // Update current job
-        if (data.current) {
-            document.getElementById('currentJobProgress').style.width = `${data.current.progress}%`;
-            document.getElementById('currentJobPercent').textContent = `${Math.round(data.current.progress)}%`;
-            
-            const currentOutputSize = data.current.status === 'encoding' || data.current.status === 'paused'
-                ? (data.current.current_output_size || data.current.output_size)
-                : data.current.output_size;
-            
-            const reduction = data.current.input_size && currentOutputSize 
-                ? `${((data.current.input_size - currentOutputSize) / data.current.input_size * 100).toFixed(1)}%`
-                : '-';
-            
-            currentJobContent.innerHTML = `
-                <div class="job-info">
-                    <div class="job-info-label">File</div>
-                    <div class="job-info-value" style="word-break: break-word;">${data.current.filename}</div>
-                </div>
-                <div class="job-info">
-                    <div class="job-info-label">Preset</div>
-                    <div class="job-info-value">${data.current.preset}</div>
-                </div>
-                <div class="job-info">
-                    <div class="job-info-label">Format</div>
-                    <div class="job-info-value">${data.current.format.toUpperCase()}</div>
-                </div>
-                <div class="job-info">
-                    <div class="job-info-label">Input Size</div>
-                    <div class="job-info-value">${data.current.input_size || '0'} MB</div>
-                </div>
-                <div class="job-info">
-                    <div class="job-info-label">Output Size</div>
-                    <div class="job-info-value">${currentOutputSize || '0'} MB</div>
-                </div>
-                <div class="job-info">
-                    <div class="job-info-label">Reduction</div>
-                    <div class="job-info-value">${reduction}</div>
-                </div>
-            `;
-            
-            // Update control buttons
-            startBtn.disabled = true;
-            pauseBtn.disabled = data.current.status !== 'encoding' || data.paused;
-            resumeBtn.disabled = data.current.status !== 'paused' || !data.paused;
-            stopBtn.disabled = false; // Stop button always enabled when encoding
-            cancelBtn.disabled = false;
-            
-        } else {
-            document.getElementById('currentJobProgress').style.width = '0%';
-            document.getElementById('currentJobPercent').textContent = '0%';
-            currentJobContent.innerHTML = `<div class="no-job">No active encoding job</div>`;
-            
-            startBtn.disabled = data.queue.length === 0;
-            pauseBtn.disabled = true;
-            resumeBtn.disabled = true;
-            stopBtn.disabled = true; // Disable stop button when no encoding
-            cancelBtn.disabled = true;
-        }
+        currentJobContent.innerHTML = activeJobs
+            .map(job => renderActiveJob(job, activeJobs.length > 1))
+            .join('');
         
-        // Update queue table
-        queueTableBody.innerHTML = '';
+        // Update control buttons
+        startBtn.disabled = data.queue.length === 0 || activeJobs.length >= (data.max_concurrent || 1);
+        pauseBtn.disabled = activeJobs.every(job => job.paused);
+        releaseBtn.disabled = activeJobs.every(job => job.released);
+        resumeBtn.disabled = !activeJobs.some(job => job.paused);
+        stopBtn.disabled = false; // Stop button always enabled when encoding
+        cancelBtn.disabled = false;
         
-        if (data.queue.length === 0 && !data.current) {
-            queueTableBody.innerHTML = `
-                <tr>
-                    <td colspan="6" class="empty-queue">
-                        <i class="fas fa-inbox"></i>
-                        <p>Queue is empty. Add files to get started.</p>
-                    </td>
-                </tr>
-            `;
-            return;
-        }
+    } else {
+        document.getElementById('currentJobProgress').style.width = '0%';
+        document.getElementById('currentJobPercent').textContent = '0%';
+        currentJobContent.innerHTML = `<div class="no-job">No active encoding job</div>`;
         
-        // Add queued jobs
-        queueData.forEach((job, index) => {
-            const row = document.createElement('tr');
-            const statusClass = {
-                'queued': 'status-queued',
-                'encoding': 'status-encoding',
-                'paused': 'status-paused',
-                'completed': 'status-completed',
-                'failed': 'status-failed',
-                'cancelled': 'status-cancelled',
-                'stopped': 'status-stopped'
-            }[job.status] || 'status-queued';
-            
-            const statusText = job.status.charAt(0).toUpperCase() + job.status.slice(1);
-            
-            row.className = job.status;
-            
-            // REMOVED: Progress bar column entirely
-            row.innerHTML = `
-                <td>${job.filename}</td>
-                <td>${job.preset}</td>
-                <td>${job.format.toUpperCase()}</td>
-                <td>${job.input_size || '0'} MB</td>
-                <td><span class="status-badge ${statusClass}">${statusText}</span></td>
-                <td>
-                    <div class="action-buttons">
-                        <button onclick="moveInQueue('${job.id}', 'up')" class="btn btn-sm btn-secondary" ${index === 0 || job.status !== 'queued' ? 'disabled' : ''}>
-                            <i class="fas fa-arrow-up"></i>
-                        </button>
-                        <button onclick="moveInQueue('${job.id}', 'down')" class="btn btn-sm btn-secondary" ${index === queueData.length - 1 || job.status !== 'queued' ? 'disabled' : ''}>
-                            <i class="fas fa-arrow-down"></i>
-                        </button>
-                        <button onclick="removeFromQueue('${job.id}')" class="btn btn-sm btn-danger" ${job.status === 'encoding' || job.status === 'paused' ? 'disabled' : ''}>
-                            <i class="fas fa-times"></i>
-                        </button>
-                    </div>
+        startBtn.disabled = data.queue.length === 0;
+        pauseBtn.disabled = true;
+        releaseBtn.disabled = true;
+        resumeBtn.disabled = true;
+        stopBtn.disabled = true; // Disable stop button when no encoding
+        cancelBtn.disabled = true;
+    }
+    
+    // Update queue table
+    queueTableBody.innerHTML = '';
+    
+    if (data.queue.length === 0 && !data.current) {
+        queueTableBody.innerHTML = `
+            <tr>
+                <td colspan="6" class="empty-queue">
+                    <i class="fas fa-inbox"></i>
+                    <p>Queue is empty. Add files to get started.</p>
                 </td>
-            `;
-            queueTableBody.appendChild(row);
-        });
+            </tr>
+        `;
+        return;
+    }
+    
+    // Add queued jobs
+    queueData.forEach((job, index) => {
+        const row = document.createElement('tr');
+        const statusClass = {
+            'queued': 'status-queued',
+            'encoding': 'status-encoding',
+            'paused': 'status-paused',
+            'finalizing': 'status-encoding',
+            'completed': 'status-completed',
+            'failed': 'status-failed',
+            'cancelled': 'status-cancelled',
+            'stopped': 'status-stopped'
+        }[job.status] || 'status-queued';
         
-    } catch (error) {
-        console.error('Error updating queue:', error);
+        const statusText = job.status.charAt(0).toUpperCase() + job.status.slice(1);
+        
+        row.className = job.status;
+        
+        // REMOVED: Progress bar column entirely
+        const mediaInfo = [formatMediaInfo(job.media_info), formatEstimate(job.estimate)].filter(Boolean).join(' · ');
+        row.innerHTML = `
+            <td>
+                ${escapeHtml(job.filename)}
+                ${job.priority && job.priority !== 'normal' ? `<span class="priority-badge priority-${job.priority}">${job.priority}</span>` : ''}
+                ${mediaInfo ? `<div class="job-media-info">${mediaInfo}</div>` : ''}
+            </td>
+            <td>${escapeHtml(job.preset)}</td>
+            <td>${job.format.toUpperCase()}</td>
+            <td>${job.input_size || '0'} MB</td>
+            <td><span class="status-badge ${statusClass}">${statusText}</span></td>
+            <td>
+                <div class="action-buttons">
+                    <button onclick="moveInQueue('${job.id}', 'top')" class="btn btn-sm btn-secondary" title="Move to the front of its priority class" ${index === 0 || job.status !== 'queued' ? 'disabled' : ''}>
+                        <i class="fas fa-angles-up"></i>
+                    </button>
+                    <button onclick="moveInQueue('${job.id}', 'up')" class="btn btn-sm btn-secondary" ${index === 0 || job.status !== 'queued' ? 'disabled' : ''}>
+                        <i class="fas fa-arrow-up"></i>
+                    </button>
+                    <button onclick="moveInQueue('${job.id}', 'down')" class="btn btn-sm btn-secondary" ${index === queueData.length - 1 || job.status !== 'queued' ? 'disabled' : ''}>
+                        <i class="fas fa-arrow-down"></i>
+                    </button>
+                    <button onclick="removeFromQueue('${job.id}')" class="btn btn-sm btn-danger" ${job.status === 'encoding' || job.status === 'paused' || job.status === 'finalizing' ? 'disabled' : ''}>
+                        <i class="fas fa-times"></i>
+                    </button>
+                </div>
+            </td>
+        `;
+        queueTableBody.appendChild(row);
+    });
+}
+
+// Rough duration, e.g. "1h 05m" or "12m"
+function formatDuration(seconds) {
+    const minutes = Math.max(1, Math.round(seconds / 60));
+    return minutes >= 60 ? `${Math.floor(minutes / 60)}h ${String(minutes % 60).padStart(2, '0')}m` : `${minutes}m`;
+}
+
+// Expected encode time and output size from the preset's history, e.g. "≈ 12m → 350 MB"
+function formatEstimate(estimate) {
+    if (!estimate || estimate.seconds === null) return '';
+    const size = estimate.output_size !== null ? ` → ${Math.round(estimate.output_size)} MB` : '';
+    return `≈ ${formatDuration(estimate.seconds)}${size}`;
+}
+
+function renderQueueEstimate(estimate) {
+    const el = document.getElementById('queueEstimate');
+    if (!el) return;
+    if (!estimate || !queueData.length || estimate.unestimated === queueData.length) {
+        el.textContent = '';
+        return;
     }
+    const partial = estimate.unestimated ? ` (+${estimate.unestimated} unestimated)` : '';
+    el.textContent = `≈ ${formatDuration(estimate.seconds)} to finish${partial}`;
+}
+
+// Probed source details, e.g. "01:23:45 · 1920x1080 · 23.976 fps · 2 audio"
+function formatMediaInfo(info) {
+    if (!info) return '';
+    
+    const parts = [info.duration_display];
+    if (info.width && info.height) parts.push(`${info.width}x${info.height}`);
+    if (info.fps) parts.push(`${info.fps} fps`);
+    if (info.audio_tracks.length) parts.push(`${info.audio_tracks.length} audio`);
+    if (info.subtitle_tracks.length) parts.push(`${info.subtitle_tracks.length} subs`);
+    return parts.join(' · ');
+}
+
+function renderActiveJob(job, showHeader) {
+    const currentOutputSize = job.status === 'encoding' || job.status === 'paused' || job.status === 'finalizing'
+        ? (job.current_output_size || job.output_size)
+        : job.output_size;
+    
+    const reduction = job.input_size && currentOutputSize 
+        ? `${((job.input_size - currentOutputSize) / job.input_size * 100).toFixed(1)}%`
+        : '-';
+    
+    const info = `
+        <div class="job-info">
+            <div class="job-info-label">File</div>
+            <div class="job-info-value" style="word-break: break-word;">${escapeHtml(job.filename)}</div>
+        </div>
+        <div class="job-info">
+            <div class="job-info-label">Preset</div>
+            <div class="job-info-value">${escapeHtml(job.preset)}</div>
+        </div>
+        <div class="job-info">
+            <div class="job-info-label">Format</div>
+            <div class="job-info-value">${job.format.toUpperCase()}</div>
+        </div>
+        <div class="job-info">
+            <div class="job-info-label">Source</div>
+            <div class="job-info-value">${formatMediaInfo(job.media_info) || '-'}</div>
+        </div>
+        <div class="job-info">
+            <div class="job-info-label">Input Size</div>
+            <div class="job-info-value">${job.input_size || '0'} MB</div>
+        </div>
+        <div class="job-info">
+            <div class="job-info-label">Output Size</div>
+            <div class="job-info-value">${currentOutputSize || '0'} MB</div>
+        </div>
+        <div class="job-info">
+            <div class="job-info-label">Reduction</div>
+            <div class="job-info-value">${reduction}</div>
+        </div>
+    `;
+    
+    if (!showHeader) return info;
+    
+    return `
+        <div class="active-job">
+            <div class="active-job-header">
+                <span class="active-job-slot">Worker ${job.slot + 1}${job.agent ? ` · ${escapeHtml(job.agent)}` : ''}${job.cpus ? ` · CPUs ${job.cpus}` : ''}</span>
+                <span class="status-badge status-${job.paused ? 'paused' : 'encoding'}">${job.status === 'finalizing' ? 'Finalizing' : job.resume_pending ? 'Waiting for slot' : job.released ? 'Released' : job.paused ? 'Paused' : 'Encoding'}</span>
+                <div class="progress-track">
+                    <div class="progress-lavender" style="width: ${job.progress}%"></div>
+                </div>
+                <span>${Math.round(job.progress)}%</span>
+            </div>
+            <div class="active-job-content">${info}</div>
+        </div>
+    `;
 }
 
 // Queue management
@@ -861,7 +997,7 @@ async function moveInQueue(jobId, direction) {
             body: JSON.stringify({ id: parseInt(jobId), direction })
         });
         updateQueueDisplay();
-        showNotification(`Job moved ${direction}`, 'info');
+        showNotification(direction === 'top' ? 'Job moved to top' : `Job moved ${direction}`, 'info');
     } catch (error) {
         console.error('Error moving job:', error);
         showNotification('Failed to move job', 'error');
@@ -921,11 +1057,15 @@ async function startEncoding() {
 }
 
 // Pause/Resume/Cancel
-async function pauseJob() {
+async function pauseJob(release = false) {
     try {
-        await fetch('/pause', { method: 'POST' });
+        await fetch('/pause', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({ release })
+        });
         updateQueueDisplay();
-        showNotification('Encoding paused', 'warning');
+        showNotification(release ? 'Encoding paused, cores released to the queue' : 'Encoding paused', 'warning');
     } catch (error) {
         console.error('Error pausing job:', error);
         showNotification('Failed to pause encoding', 'error');
@@ -970,80 +1110,114 @@ async function stopEncoding() {
     }
 }
 
-// Encoding details polling
-function startEncodingDetailsPolling() {
-    updateEncodingDetails();
-    encodingDetailsInterval = setInterval(updateEncodingDetails, 1000);
+// Encoding details
+function renderEncodingDetails(details) {
+    updateDetailsJobSelect(details);
+    
+    // Update metrics with animation for FPS changes
+    const currentFpsElement = document.getElementById('currentFps');
+    const avgFpsElement = document.getElementById('avgFps');
+    
+    if (parseFloat(currentFpsElement.textContent) !== details.current_fps) {
+        currentFpsElement.classList.remove('fps-high', 'fps-low');
+        if (details.current_fps > 30) currentFpsElement.classList.add('fps-high');
+        else if (details.current_fps > 0 && details.current_fps < 15) currentFpsElement.classList.add('fps-low');
+    }
+    
+    if (parseFloat(avgFpsElement.textContent) !== details.average_fps) {
+        avgFpsElement.classList.remove('fps-high', 'fps-low');
+        if (details.average_fps > 30) avgFpsElement.classList.add('fps-high');
+        else if (details.average_fps > 0 && details.average_fps < 15) avgFpsElement.classList.add('fps-low');
+    }
+    
+    // Update values - Use ETA from HandBrake output
+    currentFpsElement.textContent = details.current_fps.toFixed(1);
+    avgFpsElement.textContent = details.average_fps.toFixed(1);
+    
+    // Use ETA from HandBrake output if available
+    const etaValue = details.eta_from_output && details.eta_from_output !== '--:--' 
+        ? details.eta_from_output 
+        : details.eta;
+    
+    document.getElementById('eta').textContent = etaValue;
+    document.getElementById('inputFile').textContent = details.input_file;
+    document.getElementById('inputSize').textContent = details.input_size;
+    document.getElementById('outputSize').textContent = details.output_size;
+    document.getElementById('sizeReduction').textContent = details.size_reduction;
+    document.getElementById('outputBitrate').textContent = details.output_bitrate || '-';
+    document.getElementById('projectedSize').textContent = details.projected_size || '-';
+    document.getElementById('encodingPreset').textContent = details.preset;
+    document.getElementById('encodingFormat').textContent = details.format;
+    document.getElementById('timeElapsed').textContent = details.time_elapsed;
+    document.getElementById('timeRemaining').textContent = etaValue;
+    
+    // Update encoding status
+    if (details.stopped) {
+        encodingStatus.textContent = 'Stopped';
+    } else if (details.paused) {
+        encodingStatus.textContent = 'Paused';
+    } else if (details.input_file !== '-') {
+        encodingStatus.textContent = 'Encoding';
+    } else {
+        encodingStatus.textContent = 'Idle';
+    }
+    
+    renderEncodingSegments(details.segments || []);
+    
+    // Update encoding log
+    const encodingLog = document.getElementById('encodingLog');
+    if (details.encoding_log && details.encoding_log.length > 0) {
+        encodingLog.innerHTML = '';
+        details.encoding_log.forEach(log => {
+            const logEntry = document.createElement('div');
+            logEntry.className = `log-entry ${log.type}`;
+            logEntry.textContent = log.message;
+            encodingLog.appendChild(logEntry);
+        });
+        
+        encodingLog.scrollTop = encodingLog.scrollHeight;
+    }
 }
 
-async function updateEncodingDetails() {
-    try {
-        const response = await fetch('/encoding-details');
-        const details = await response.json();
-        
-        // Update metrics with animation for FPS changes
-        const currentFpsElement = document.getElementById('currentFps');
-        const avgFpsElement = document.getElementById('avgFps');
-        
-        if (parseFloat(currentFpsElement.textContent) !== details.current_fps) {
-            currentFpsElement.classList.remove('fps-high', 'fps-low');
-            if (details.current_fps > 30) currentFpsElement.classList.add('fps-high');
-            else if (details.current_fps > 0 && details.current_fps < 15) currentFpsElement.classList.add('fps-low');
-        }
-        
-        if (parseFloat(avgFpsElement.textContent) !== details.average_fps) {
-            avgFpsElement.classList.remove('fps-high', 'fps-low');
-            if (details.average_fps > 30) avgFpsElement.classList.add('fps-high');
-            else if (details.average_fps > 0 && details.average_fps < 15) avgFpsElement.classList.add('fps-low');
-        }
-        
-        // Update values - Use ETA from HandBrake output
-        currentFpsElement.textContent = details.current_fps.toFixed(1);
-        avgFpsElement.textContent = details.average_fps.toFixed(1);
-        
-        // Use ETA from HandBrake output if available
-        const etaValue = details.eta_from_output && details.eta_from_output !== '--:--' 
-            ? details.eta_from_output 
-            : details.eta;
-        
-        document.getElementById('eta').textContent = etaValue;
-        document.getElementById('inputFile').textContent = details.input_file;
-        document.getElementById('inputSize').textContent = details.input_size;
-        document.getElementById('outputSize').textContent = details.output_size;
-        document.getElementById('sizeReduction').textContent = details.size_reduction;
-        document.getElementById('encodingPreset').textContent = details.preset;
-        document.getElementById('encodingFormat').textContent = details.format;
-        document.getElementById('timeElapsed').textContent = details.time_elapsed;
-        document.getElementById('timeRemaining').textContent = etaValue;
-        
-        // Update encoding status
-        if (details.stopped) {
-            encodingStatus.textContent = 'Stopped';
-        } else if (details.paused) {
-            encodingStatus.textContent = 'Paused';
-        } else if (details.input_file !== '-') {
-            encodingStatus.textContent = 'Encoding';
-        } else {
-            encodingStatus.textContent = 'Idle';
-        }
-        
-        // Update encoding log
-        const encodingLog = document.getElementById('encodingLog');
-        if (details.encoding_log && details.encoding_log.length > 0) {
-            encodingLog.innerHTML = '';
-            details.encoding_log.forEach(log => {
-                const logEntry = document.createElement('div');
-                logEntry.className = `log-entry ${log.type}`;
-                logEntry.textContent = log.message;
-                encodingLog.appendChild(logEntry);
-            });
-            
-            encodingLog.scrollTop = encodingLog.scrollHeight;
-        }
-        
-    } catch (error) {
-        console.error('Error updating encoding details:', error);
+// Per-segment progress for split-mode encodes
+function renderEncodingSegments(segments) {
+    const container = document.getElementById('encodingSegments');
+    container.style.display = segments.length > 0 ? '' : 'none';
+    container.innerHTML = segments.map(segment => `
+        <div class="segment-row">
+            <div class="segment-label">Part ${segment.index + 1} <span>${segment.start} – ${segment.end}</span></div>
+            <div class="progress-track">
+                <div class="progress-lavender" style="width: ${segment.progress}%"></div>
+            </div>
+            <div class="segment-stats">${segment.progress.toFixed(1)}% · ${segment.current_fps.toFixed(1)} fps · ${segment.status === 'encoding' ? segment.eta : segment.status}</div>
+        </div>
+    `).join('');
+}
+
+function updateDetailsJobSelect(details) {
+    const select = document.getElementById('detailsJobSelect');
+    if (!select) return;
+    
+    const jobs = details.jobs || [];
+    select.style.display = jobs.length > 1 ? '' : 'none';
+    
+    // Only rebuild the options when the set of active jobs changes
+    const key = jobs.map(job => job.id).join(',');
+    if (select.dataset.jobs !== key) {
+        select.dataset.jobs = key;
+        select.innerHTML = jobs
+            .map(job => `<option value="${job.id}">Worker ${job.slot + 1}: ${escapeHtml(job.input_file)}</option>`)
+            .join('');
     }
+    
+    detailsJobId = details.id;
+    if (details.id !== null) select.value = details.id;
+}
+
+function selectDetailsJob() {
+    const select = document.getElementById('detailsJobSelect');
+    detailsJobId = parseInt(select.value) || null;
+    renderEncodingDetails(currentDetails());
 }
 
 function clearEncodingLog() {
@@ -1051,6 +1225,15 @@ function clearEncodingLog() {
     encodingLog.innerHTML = '<div class="log-entry">Log cleared</div>';
 }
 
+// The complete log of the job on screen, spooled to disk by the server
+function downloadEncodingLog() {
+    if (logJobId === null) {
+        showNotification('No encode log to download yet', 'info');
+        return;
+    }
+    window.location.href = `/logs/${logJobId}/download`;
+}
+
 // File preview
 function showFilePreview(filename, filepath) {
     const previewModal = document.getElementById('previewModal');
@@ -1194,31 +1377,18 @@ async function handlePresetUpload() {
 }
 
 // System stats
-function startSystemStatsPolling() {
-    updateSystemStats();
-    systemStatsInterval = setInterval(updateSystemStats, 2000);
-}
-
-async function updateSystemStats() {
-    try {
-        const response = await fetch('/system-stats');
-        const stats = await response.json();
-        
-        // Update mobile panel
-        document.getElementById('mobileCpu').textContent = `${stats.cpu.toFixed(1)}%`;
-        document.getElementById('mobileRam').textContent = `${stats.ram.toFixed(1)}%`;
-        document.getElementById('mobileDisk').textContent = `${stats.disk.toFixed(1)}%`;
-        document.getElementById('mobileProcess').textContent = `${stats.process_cpu.toFixed(1)}% ${stats.process_ram_mb.toFixed(1)}MB`;
-        document.getElementById('mobileTime').textContent = stats.timestamp;
-        
-        // Update progress bars
-        document.getElementById('mobileCpuBar').style.width = `${stats.cpu}%`;
-        document.getElementById('mobileRamBar').style.width = `${stats.ram}%`;
-        document.getElementById('mobileDiskBar').style.width = `${stats.disk}%`;
-        
-    } catch (error) {
-        console.error('Error updating system stats:', error);
-    }
+function renderSystemStats(stats) {
+    // Update mobile panel
+    document.getElementById('mobileCpu').textContent = `${stats.cpu.toFixed(1)}%`;
+    document.getElementById('mobileRam').textContent = `${stats.ram.toFixed(1)}%`;
+    document.getElementById('mobileDisk').textContent = `${stats.disk.toFixed(1)}%`;
+    document.getElementById('mobileProcess').textContent = `${stats.process_cpu.toFixed(1)}% ${stats.process_ram_mb.toFixed(1)}MB`;
+    document.getElementById('mobileTime').textContent = stats.timestamp;
+    
+    // Update progress bars
+    document.getElementById('mobileCpuBar').style.width = `${stats.cpu}%`;
+    document.getElementById('mobileRamBar').style.width = `${stats.ram}%`;
+    document.getElementById('mobileDiskBar').style.width = `${stats.disk}%`;
 }
 
 // Status indicator
@@ -1272,10 +1442,108 @@ document.addEventListener('click', (e) => {
     }
 });
 
-// Polling
-function startPolling() {
-    updateQueueDisplay();
-    pollInterval = setInterval(updateQueueDisplay, 2000);
+// Live updates: the server pushes only the fields that changed
+const IDLE_DETAILS = {
+    id: null,
+    slot: null,
+    current_fps: 0,
+    average_fps: 0,
+    eta: '--:--',
+    eta_from_output: '--:--',
+    time_elapsed: '00:00',
+    time_remaining: '00:00',
+    input_file: '-',
+    input_size: '-',
+    output_size: '-',
+    size_reduction: '-',
+    output_bitrate: '-',
+    projected_size: '-',
+    preset: '-',
+    format: '-',
+    paused: false,
+    stopped: false
+};
+
+function startEventStream() {
+    if (eventSource) eventSource.close();
+    eventSource = new EventSource('/events');
+    
+    eventSource.addEventListener('queue', (e) => {
+        liveState.queue = mergeFields(liveState.queue, JSON.parse(e.data));
+        renderQueue(liveState.queue);
+    });
+    
+    eventSource.addEventListener('details', (e) => {
+        liveState.details = mergeFields(liveState.details, JSON.parse(e.data));
+        renderEncodingDetails(currentDetails());
+    });
+    
+    eventSource.addEventListener('log', (e) => {
+        const lines = JSON.parse(e.data);
+        Object.entries(lines).forEach(([jobId, entries]) => {
+            const log = jobLogs[jobId] || [];
+            const lastSeq = log.length ? log[log.length - 1].seq : 0;
+            // Reconnects resend recent lines; keep each line once
+            entries.forEach(entry => {
+                if (entry.seq > lastSeq) log.push(entry);
+            });
+            jobLogs[jobId] = log.slice(-100);
+        });
+        renderEncodingDetails(currentDetails());
+    });
+    
+    eventSource.addEventListener('history', (e) => {
+        recentHistory = JSON.parse(e.data).items;
+        combineHistory();
+    });
+    
+    eventSource.addEventListener('stats', (e) => {
+        liveState.stats = mergeFields(liveState.stats, JSON.parse(e.data));
+        renderSystemStats(liveState.stats);
+    });
+    
+    // A reconnect starts with a full snapshot, so drop the stale state
+    eventSource.addEventListener('open', () => {
+        liveState = { queue: null, details: { jobs: {} }, stats: null };
+    });
+    
+    // The browser gives up on a refused stream (server at its stream limit): retry later
+    eventSource.addEventListener('error', (e) => {
+        if (e.target === eventSource && eventSource.readyState === EventSource.CLOSED) {
+            setTimeout(startEventStream, 10000);
+        }
+    });
+}
+
+function mergeFields(target, patch) {
+    if (patch === null || typeof patch !== 'object' || Array.isArray(patch)) return patch;
+    const result = (target && typeof target === 'object' && !Array.isArray(target)) ? { ...target } : {};
+    // Removed keys arrive as a list; a null value is a value like any other
+    (patch._removed || []).forEach(key => delete result[key]);
+    Object.entries(patch).forEach(([key, value]) => {
+        if (key !== '_removed') result[key] = mergeFields(result[key], value);
+    });
+    return result;
+}
+
+function currentDetails() {
+    const jobs = Object.values(liveState.details.jobs || {}).sort((a, b) => a.slot - b.slot);
+    const selected = jobs.find(job => job.id === detailsJobId) || jobs[0] || IDLE_DETAILS;
+    
+    if (jobs.length > 0) {
+        // Forget logs of jobs that are no longer active
+        Object.keys(jobLogs).forEach(jobId => {
+            if (!jobs.some(job => String(job.id) === jobId)) delete jobLogs[jobId];
+        });
+    }
+    
+    // When idle, keep showing the log of the last job that finished
+    const logIds = Object.keys(jobLogs);
+    const logId = selected.id !== null ? selected.id : logIds[logIds.length - 1];
+    const log = jobLogs[logId] || [];
+    logJobId = logId !== undefined ? logId : null;
+    
+    return { ...selected, encoding_log: log.slice(-20), jobs };
 }
 
 // Refresh files
@@ -1286,7 +1554,7 @@ function refreshFiles() {
         </div>
     `;
     
-    loadFiles();
+    loadFiles(true);
     showNotification('Files list refreshed', 'info');
 }
 
@@ -1428,10 +1696,7 @@ function setupKeyboardShortcuts() {
     });
 }
 
-// Clean up intervals
+// Close the event stream
 window.addEventListener('beforeunload', () => {
-    if (pollInterval) clearInterval(pollInterval);
-    if (systemStatsInterval) clearInterval(systemStatsInterval);
-    if (encodingDetailsInterval) clearInterval(encodingDetailsInterval);
-    if (historyInterval) clearInterval(historyInterval);
+    if (eventSource) eventSource.close();
 });
\ No newline at end of file
@@ -0,0 +1,62 @@
+import itertools
+import pytest
+import app
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """Empty worker table on an 8-core machine, with pinning on"""
+    monkeypatch.setattr(app, "active_workers", {})
+    monkeypatch.setattr(app, "AVAILABLE_CPUS", list(range(8)))
+    monkeypatch.setattr(app, "CPU_PINNING", True)
+    ids = itertools.count(1)
+
+    def start():
+        job = app.EncodingJob(next(ids), "input.mkv", "fast.json", "mp4")
+        used_slots = {w.slot for w in app.active_workers.values()}
+        worker = app.EncodingWorker(next(s for s in itertools.count() if s not in used_slots), job)
+        app.active_workers[job.id] = worker
+        app.rebalance_cpus()
+        return worker
+
+    def finish(worker):
+        del app.active_workers[worker.job.id]
+        app.rebalance_cpus()
+
+    return start, finish
+
+def assert_partitioned():
+    sets = [set(w.cpus) for w in app.running_workers()]
+    assert all(sets)
+    assert sum(len(s) for s in sets) == len(set().union(*sets)) == 8
+
+def test_cpu_sets_stay_disjoint_across_start_and_finish(scheduler):
+    start, finish = scheduler
+    first = start()
+    assert first.cpus == list(range(8))
+
+    # Starting under full load splits the cores instead of overlapping
+    second = start()
+    third = start()
+    assert_partitioned()
+
+    finish(second)
+    assert_partitioned()
+    fourth = start()
+    assert_partitioned()
+
+    finish(first)
+    finish(third)
+    assert fourth.cpus == list(range(8))
+
+def test_released_worker_gets_cores_back_on_resume(scheduler):
+    start, finish = scheduler
+    paused = start()
+    other = start()
+    paused.released = True
+    paused.cpus = []
+    app.rebalance_cpus()
+    assert other.cpus == list(range(8))
+
+    paused.released = False
+    app.rebalance_cpus()
+    assert_partitioned()
@@ -0,0 +1,29 @@
+import app
+from app import REMOVED_KEYS, diff_fields
+
+def test_field_set_to_none_is_sent_as_a_value():
+    old = {'jobs': {'1': {'eta': '00:10', 'agent': 'box'}}}
+    new = {'jobs': {'1': {'eta': '00:10', 'agent': None}}}
+    assert diff_fields(old, new) == {'jobs': {'1': {'agent': None}}}
+
+def test_removed_fields_are_listed_separately():
+    old = {'jobs': {'1': {'eta': '00:10'}, '2': {'eta': '00:20', 'agent': 'box'}}}
+    new = {'jobs': {'2': {'eta': '00:20'}}}
+    assert diff_fields(old, new) == {
+        'jobs': {REMOVED_KEYS: ['1'], '2': {REMOVED_KEYS: ['agent']}}
+    }
+
+def test_unchanged_payload_has_no_diff():
+    payload = {'jobs': {'1': {'eta': None}}, 'queue': [1, 2]}
+    assert diff_fields(payload, dict(payload)) == {}
+
+def test_broker_publishes_full_payload_then_changes(monkeypatch):
+    broker = app.EventBroker()
+    published = []
+    monkeypatch.setattr(broker, 'publish', lambda topic, data: published.append((topic, data)))
+    broker.update('stats', {'cpu': 10, 'gpu': 5})
+    broker.update('stats', {'cpu': None})
+    assert published == [
+        ('stats', {'cpu': 10, 'gpu': 5}),
+        ('stats', {'cpu': None, REMOVED_KEYS: ['gpu']}),
+    ]
@@ -0,0 +1,35 @@
+import os
+import pytest
+import finalize
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "encode.mp4"
+    path.write_bytes(os.urandom(300_000))
+    return path
+
+def test_zero_from_kernel_copy_falls_back(monkeypatch, tmp_path, source):
+    # e.g. copy_file_range on a filesystem that reports 0 rather than an error
+    monkeypatch.setattr(finalize.os, "copy_file_range", lambda *args: 0, raising=False)
+    monkeypatch.setattr(finalize.os, "sendfile", lambda *args: 0, raising=False)
+    destination = tmp_path / "out.mp4"
+    finalize.copy_file(str(source), str(destination))
+    assert destination.read_bytes() == source.read_bytes()
+
+def test_short_copy_keeps_the_source(monkeypatch, tmp_path, source):
+    monkeypatch.setattr(finalize, "same_filesystem", lambda a, b: False)
+    monkeypatch.setattr(finalize, "copy_contents", lambda src, dst, size: dst.write(src.read(1000)))
+    destination = tmp_path / "out.mp4"
+    with pytest.raises(OSError, match="Incomplete copy"):
+        finalize.publish(str(source), str(destination))
+    assert source.exists()
+    assert not destination.exists()
+    assert not (tmp_path / "out.mp4.part").exists()
+
+def test_cross_filesystem_publish_moves_the_file(monkeypatch, tmp_path, source):
+    monkeypatch.setattr(finalize, "same_filesystem", lambda a, b: False)
+    data = source.read_bytes()
+    destination = tmp_path / "out.mp4"
+    assert finalize.publish(str(source), str(destination)) is True
+    assert destination.read_bytes() == data
+    assert not source.exists()
@@ -0,0 +1,15 @@
+import pytest
+from job_store import JobStore
+
+def test_store_refuses_access_before_open(tmp_path):
+    store = JobStore(str(tmp_path / "encoder.db"))
+    with pytest.raises(RuntimeError, match="not been started"):
+        store.read("SELECT * FROM jobs")
+    with pytest.raises(RuntimeError, match="not been started"):
+        store.delete_jobs([1])
+    assert not (tmp_path / "encoder.db").exists()
+
+def test_store_reads_after_open(tmp_path):
+    store = JobStore(str(tmp_path / "encoder.db"))
+    store.open()
+    assert store.read("SELECT * FROM jobs") == []
@@ -0,0 +1,48 @@
+import progress_parser
+from progress_parser import JsonProgressParser
+
+WORKING_BLOCK = [
+    'Progress: {\n',
+    '    "State": "WORKING",\n',
+    '    "Working": {\n',
+    '        "ETASeconds": 30,\n',
+    '        "Pass": 1,\n',
+    '        "PassCount": 1,\n',
+    '        "Progress": 0.25,\n',
+    '        "Rate": 50.0,\n',
+    '        "RateAvg": 48.0\n',
+    '    }\n',
+    '}\n',
+]
+
+def feed_all(parser, lines):
+    return [parser.feed(line) for line in lines]
+
+def test_working_block_gives_progress():
+    results = feed_all(JsonProgressParser(), WORKING_BLOCK)
+    assert results[:-1] == [(None, None)] * (len(WORKING_BLOCK) - 1)
+    update, message = results[-1]
+    assert update['percent'] == 25.0
+    assert update['eta_seconds'] == 30
+    assert message.startswith('Encoding: pass 1 of 1, 25.00 %')
+
+def test_unterminated_block_is_dropped_at_next_header():
+    parser = JsonProgressParser()
+    feed_all(parser, WORKING_BLOCK[:5])
+    update, _ = feed_all(parser, WORKING_BLOCK)[-1]
+    assert update['percent'] == 25.0
+    assert parser.block_lines == []
+
+def test_unterminated_block_is_capped(monkeypatch):
+    monkeypatch.setattr(progress_parser, 'MAX_JSON_BLOCK_BYTES', 200)
+    parser = JsonProgressParser()
+    parser.feed('Progress: {\n')
+    for _ in range(100):
+        parser.feed('    "State": "WORKING",\n')
+    assert parser.block_name is None
+    assert len(''.join(parser.block_lines)) <= 200
+
+    # Back to plain text once the block is dropped
+    update, message = parser.feed('Encoding: task 1 of 1, 50.00 %\n')
+    assert update['percent'] == 50.0
+    assert message == 'Encoding: task 1 of 1, 50.00 %'
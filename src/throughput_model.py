@@ -0,0 +1,156 @@
+import threading
+from collections import deque
+from datetime import datetime
+
+# Source heights at or above each bound fall in that bucket
+RESOLUTION_BUCKETS = ((2160, '2160p'), (1080, '1080p'), (720, '720p'), (1, 'sd'))
+
+# Completed encodes kept per (preset, resolution bucket)
+MODEL_SAMPLES = 500
+
+def resolution_bucket(height):
+    for bound, name in RESOLUTION_BUCKETS:
+        if height and height >= bound:
+            return name
+    return 'unknown'
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def summarize(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        'p10': round(percentile(values, 0.1), 3),
+        'p50': round(percentile(values, 0.5), 3),
+        'p90': round(percentile(values, 0.9), 3),
+        'mean': round(sum(values) / len(values), 3)
+    }
+
+class Sample:
+    """What one completed encode says about its preset's speed and compression"""
+    __slots__ = ('fps', 'seconds_per_mb', 'ratio', 'mb_per_source_second')
+
+    def __init__(self, fps, seconds_per_mb, ratio, mb_per_source_second):
+        self.fps = fps
+        self.seconds_per_mb = seconds_per_mb
+        self.ratio = ratio
+        self.mb_per_source_second = mb_per_source_second
+
+class ThroughputModel:
+    """Per-preset, per-resolution encode speed and compression learnt from history
+
+    Estimates use the narrowest group with samples: the preset at the source's
+    resolution, then the preset at any resolution, then every preset. Medians
+    are cached per group until the next sample arrives.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}  # (preset, bucket) -> deque of Sample
+        self.medians = {}  # (preset or None, bucket or None) -> cached medians
+        self.version = 0  # bumped by every sample, so cached estimates can be checked
+
+    def add(self, entry):
+        """Learn from a history row; rows that say nothing about speed are skipped"""
+        try:
+            seconds = (datetime.fromisoformat(entry['end_time']) - datetime.fromisoformat(entry['start_time'])).total_seconds()
+        except (KeyError, TypeError, ValueError):
+            return
+        input_size = entry.get('input_size') or 0
+        output_size = entry.get('output_size') or 0
+        # Output cache hits finish instantly
+        if seconds < 1 or not entry.get('average_fps') or input_size <= 0:
+            return
+        source_duration = entry.get('source_duration')
+        sample = Sample(
+            entry['average_fps'],
+            seconds / input_size,
+            output_size / input_size,
+            output_size / source_duration if source_duration else None
+        )
+        key = (entry.get('preset'), resolution_bucket(entry.get('height')))
+        with self.lock:
+            self.samples.setdefault(key, deque(maxlen=MODEL_SAMPLES)).append(sample)
+            self.medians.clear()
+            self.version += 1
+
+    def group(self, preset=None, bucket=None):
+        """Samples for a preset and/or resolution bucket (None matches any)"""
+        return [
+            sample
+            for (sample_preset, sample_bucket), samples in self.samples.items()
+            if preset in (None, sample_preset) and bucket in (None, sample_bucket)
+            for sample in samples
+        ]
+
+    def group_medians(self, preset, bucket):
+        key = (preset, bucket)
+        if key not in self.medians:
+            samples = self.group(preset, bucket)
+            medians = {}
+            for field in Sample.__slots__:
+                values = sorted(getattr(s, field) for s in samples if getattr(s, field) is not None)
+                medians[field] = percentile(values, 0.5) if values else None
+            self.medians[key] = medians
+        return self.medians[key]
+
+    def lookup(self, preset, bucket, field):
+        """Median of a field from the narrowest group that has it"""
+        for group_key in ((preset, bucket), (preset, None), (None, None)):
+            value = self.group_medians(*group_key)[field]
+            if value:
+                return value
+        return None
+
+    def estimate(self, preset, input_size, media_info=None):
+        """Expected encode seconds and output size (MB) for an input; either is
+        None until there is history to base it on"""
+        media_info = media_info or {}
+        bucket = resolution_bucket(media_info.get('height'))
+        with self.lock:
+            fps = self.lookup(preset, bucket, 'fps')
+            seconds_per_mb = self.lookup(preset, bucket, 'seconds_per_mb')
+            mb_per_source_second = self.lookup(preset, bucket, 'mb_per_source_second')
+            ratio = self.lookup(preset, bucket, 'ratio')
+
+        seconds = None
+        if media_info.get('frame_count') and fps:
+            seconds = media_info['frame_count'] / fps
+        elif input_size and seconds_per_mb:
+            seconds = input_size * seconds_per_mb
+
+        output_size = None
+        if media_info.get('duration') and mb_per_source_second:
+            output_size = media_info['duration'] * mb_per_source_second
+        elif input_size and ratio:
+            output_size = input_size * ratio
+
+        return {
+            'seconds': round(seconds) if seconds is not None else None,
+            'output_size': round(output_size, 2) if output_size is not None else None
+        }
+
+    def stats(self, preset):
+        """FPS, speed and compression percentiles for a preset, overall and per
+        resolution bucket"""
+        def describe(samples):
+            return {
+                'samples': len(samples),
+                'fps': summarize([s.fps for s in samples]),
+                'seconds_per_mb': summarize([s.seconds_per_mb for s in samples]),
+                'compression_ratio': summarize([s.ratio for s in samples]),
+                'mb_per_source_minute': summarize([s.mb_per_source_second * 60 for s in samples
+                                                   if s.mb_per_source_second is not None])
+            }
+
+        with self.lock:
+            result = describe(self.group(preset))
+            result['preset'] = preset
+            result['resolutions'] = {
+                bucket: describe(samples)
+                for (sample_preset, bucket), samples in self.samples.items()
+                if sample_preset == preset
+            }
+        return result